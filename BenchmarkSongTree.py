@@ -0,0 +1,100 @@
+#   Benchmark for the Add Song tree model (FileSystemModelLite)
+#
+#   Builds the model for a synthetic song folder (50,000 files by default - no
+#   files are created on disk, sizes and dates are made up) and times:
+#
+#       build     - filling in every folder, as if the whole tree was expanded
+#       traverse  - walking every row through the model interface (index,
+#                   rowCount, parent), which is what the tree view does
+#       add       - adding files to a model that's already filled in (as the
+#                   folder watcher and search result batches do)
+#       remove    - taking them out again
+#       scattered - taking out every tenth file of the large flat folder, and
+#                   a whole sub folder
+#
+#   The files are spread over folders of folders, plus one large flat folder,
+#   as a big flat folder is where a linear search of a folder's children hurts.
+#
+#   Usage:  python BenchmarkSongTree.py [number of files]
+
+import sys
+import time
+
+from PyQt5.QtCore import QModelIndex
+
+from OpenSongViewer import FileSystemModelLite
+
+
+SongRoot = "/songs/"
+
+
+def SyntheticSongList(FileCount):
+
+    #   A quarter of the files go in one flat folder, the rest in
+    #   20 top level folders of 25 sub folders
+    FlatCount = FileCount // 4
+
+    Files = []
+    for FileNo in range(FlatCount):
+        Files.append(SongRoot + "Flat/Song " + str(FileNo) + ".xml")
+
+    for FileNo in range(FileCount - FlatCount):
+        Folder = "Folder " + str(FileNo % 20) + "/Sub " + str((FileNo // 20) % 25)
+        Files.append(SongRoot + Folder + "/Song " + str(FileNo) + ".xml")
+
+    return Files
+
+
+def FakeFileDetails(File):
+    return 1234, 1600000000
+
+
+def FetchAll(Model, Parent=QModelIndex()):
+    if Model.canFetchMore(Parent):
+        Model.fetchMore(Parent)
+
+    for Row in range(Model.rowCount(Parent)):
+        Child = Model.index(Row, 0, Parent)
+        if Model.hasChildren(Child):
+            FetchAll(Model, Child)
+
+
+def Traverse(Model, Parent=QModelIndex()):
+    Count = 0
+    for Row in range(Model.rowCount(Parent)):
+        Child = Model.index(Row, 0, Parent)
+        Model.parent(Child)
+        Model.data(Child)
+        Count += 1 + Traverse(Model, Child)
+
+    return Count
+
+
+def Timed(Description, Function, *Args):
+    StartTime = time.perf_counter()
+    Result = Function(*Args)
+    print("%-10s %8.3f s" % (Description, time.perf_counter() - StartTime))
+    return Result
+
+
+if __name__ == "__main__":
+
+    FileCount = 50000
+    if len(sys.argv) > 1:
+        FileCount = int(sys.argv[1])
+
+    SongList = SyntheticSongList(FileCount)
+    print("Synthetic song folder: " + str(len(SongList)) + " files")
+
+    Model = FileSystemModelLite(SongList, SongRoot, file_details=FakeFileDetails)
+    Timed("build", FetchAll, Model)
+
+    Rows = Timed("traverse", Traverse, Model)
+    print("           " + str(Rows) + " rows")
+
+    NewSongs = [SongRoot + "Flat/New Song " + str(FileNo) + ".xml" for FileNo in range(FileCount // 10)]
+    Timed("add", Model.add_files, NewSongs)
+    Timed("remove", Model.remove_files, NewSongs)
+
+    Scattered = [File for File in SongList if "/Flat/" in File][::10] + [File for File in SongList if "/Folder 3/Sub 3/" in File]
+    Timed("scattered", Model.remove_files, Scattered)
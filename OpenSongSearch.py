@@ -0,0 +1,204 @@
+#   opensong-search - the song search index from the command line
+#
+#   Builds, searches and describes the same song index the program uses (see
+#   SongIndex) - without Qt, so searches can be scripted, timed and tested
+#   without a display.  By default the index and preferences files are the
+#   ones the program uses when run from the current directory.
+#
+#   Usage:
+#       python OpenSongSearch.py build [--full]           bring the index up to date
+#       python OpenSongSearch.py query SEARCH TEXT...     search, as the Add Song dialog does
+#       python OpenSongSearch.py stats                    how big the index is
+#       python OpenSongSearch.py duplicates               songs that are (nearly) the same song
+#
+#   Options for all of them:
+#       --index FILE      the index file (default: as the program)
+#       --song-dir DIR    the song directory (default: from the program's preferences)
+#       --json            output JSON rather than text
+#
+#   The search text can use everything the Add Song dialog understands - e.g.
+#       python OpenSongSearch.py query amazing grace
+#       python OpenSongSearch.py query author:wesley key:G
+#       python OpenSongSearch.py --json query prog:I-V-vi-IV
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from SongDuplicates import DuplicateSongs, DuplicateThreshold
+from SongIndex import SongIndex, SongIndexFileName
+
+
+#   The program keeps its preferences in the directory it's run from
+PreferencesFileName = 'OpenSongViewerPrefs.json'
+
+
+#   The song directory from the program's preferences - or None
+def PreferencesSongDirectory():
+
+    # (the program builds the name with a '\\' on every platform)
+    for FileName in (os.getcwd()+'\\'+PreferencesFileName, os.path.join(os.getcwd(), PreferencesFileName)):
+        try:
+            with open(FileName, 'r') as f:
+                return json.load(f)['SONGDIR']+"/"
+        except:
+            pass
+
+    return None
+
+
+def Output(Arguments, Data, Text):
+    if Arguments.json:
+        print(json.dumps(Data, indent=2))
+    else:
+        print(Text)
+
+
+def Build(Index, Arguments):
+
+    if Arguments.song_dir is None:
+        print("No song directory - give one with --song-dir", file=sys.stderr)
+        return 2
+
+    def Progress(SongsRead, SongsToRead):
+        print("\rIndexing songs: "+str(SongsRead)+" of "+str(SongsToRead), end='', file=sys.stderr, flush=True)
+
+    StartTime = time.perf_counter()
+    Added, Updated, Removed = Index.Refresh(Arguments.song_dir, Full=Arguments.full, Progress=Progress)
+    Seconds = time.perf_counter() - StartTime
+    print("", file=sys.stderr)
+
+    Output(Arguments,
+           {'song_dir': Arguments.song_dir, 'added': len(Added), 'updated': len(Updated), 'removed': len(Removed), 'seconds': Seconds},
+           str(len(Added))+" added, "+str(len(Updated))+" updated, "+str(len(Removed))+" removed in %.2fs" % Seconds)
+    return 0
+
+
+def Query(Index, Arguments):
+
+    if Arguments.refresh:
+        if Arguments.song_dir is None:
+            print("No song directory - give one with --song-dir", file=sys.stderr)
+            return 2
+        Index.Refresh(Arguments.song_dir)
+
+    SearchText = ' '.join(Arguments.text)
+
+    #   As the Add Song dialog - if nothing has the text in it, the closest matches
+    StartTime = time.perf_counter()
+    Ranked = False
+    if Arguments.ranked:
+        Ranked = True
+        Results = Index.RankedSearch(SearchText)
+    else:
+        Results = Index.Search(SearchText)
+        if len(Results) == 0 and not Arguments.exact:
+            Ranked = True
+            Results = Index.RankedSearch(SearchText)
+    Seconds = time.perf_counter() - StartTime
+
+    if Arguments.limit is not None:
+        Results = Results[:Arguments.limit]
+
+    Songs = []
+    for FileName in Results:
+        try:
+            Title = Index.SongDetails(FileName).get('title', '')
+        except KeyError:
+            # Not in the index yet
+            Title = ''
+        Snippet = Index.Snippet(FileName, SearchText)
+        Songs.append({'file': FileName, 'title': Title, 'snippet': None if Snippet is None else ''.join(Snippet)})
+
+    Lines = []
+    for Song in Songs:
+        Line = Song['file']
+        if Song['snippet'] is not None:
+            Line = Line + "\t" + Song['snippet']
+        Lines.append(Line)
+    print(str(len(Results))+(" closest matches" if Ranked else " found")+" in %.1fms" % (Seconds * 1000), file=sys.stderr)
+
+    Output(Arguments,
+           {'query': SearchText, 'ranked': Ranked, 'count': len(Results), 'seconds': Seconds, 'results': Songs},
+           '\n'.join(Lines))
+    return 0
+
+
+def Stats(Index, Arguments):
+
+    Figures = Index.Stats()
+    Output(Arguments,
+           dict(Figures, index_file=Index.IndexFileName),
+           '\n'.join("%-24s %s" % (Name, Value) for Name, Value in Figures.items()))
+    return 0
+
+
+def Duplicates(Index, Arguments):
+
+    if Arguments.refresh:
+        if Arguments.song_dir is None:
+            print("No song directory - give one with --song-dir", file=sys.stderr)
+            return 2
+        Index.Refresh(Arguments.song_dir)
+
+    StartTime = time.perf_counter()
+    Songs = Index.SongLyrics()
+    Groups = DuplicateSongs(Songs, Threshold=Arguments.threshold)
+    Seconds = time.perf_counter() - StartTime
+    print(str(len(Groups))+" groups of duplicates among "+str(len(Songs))+" songs in %.2fs" % Seconds, file=sys.stderr)
+
+    Lines = []
+    for FileNames, Pairs in Groups:
+        Lines.append('\n'.join(FileNames))
+        Lines.append('\n'.join("    %3.0f%%  %s  %s" % (Similarity * 100, os.path.basename(FileName1), os.path.basename(FileName2)) for FileName1, FileName2, Similarity in Pairs))
+        Lines.append('')
+
+    Output(Arguments,
+           {'songs': len(Songs), 'threshold': Arguments.threshold, 'seconds': Seconds,
+            'groups': [{'files': FileNames, 'pairs': [{'files': [FileName1, FileName2], 'similarity': Similarity} for FileName1, FileName2, Similarity in Pairs]} for FileNames, Pairs in Groups]},
+           '\n'.join(Lines).rstrip('\n'))
+    return 0
+
+
+def Main(ArgumentList=None):
+
+    Parser = argparse.ArgumentParser(prog='opensong-search', description='Build, search and describe the OpenSongViewer song index.')
+    Parser.add_argument('--index', default=os.path.join(os.getcwd(), SongIndexFileName), help='the index file (default: %(default)s)')
+    Parser.add_argument('--song-dir', default=None, help='the song directory (default: from the program\'s preferences)')
+    Parser.add_argument('--json', action='store_true', help='output JSON')
+    Commands = Parser.add_subparsers(dest='command', required=True)
+
+    BuildParser = Commands.add_parser('build', help='bring the index up to date with the song directory')
+    BuildParser.add_argument('--full', action='store_true', help='check every song, not just those in changed directories')
+    BuildParser.set_defaults(function=Build)
+
+    QueryParser = Commands.add_parser('query', help='search the index')
+    QueryParser.add_argument('text', nargs='+', help='what to search for')
+    QueryParser.add_argument('--exact', action='store_true', help='don\'t fall back to the closest matches')
+    QueryParser.add_argument('--ranked', action='store_true', help='just the closest matches, best first')
+    QueryParser.add_argument('--limit', type=int, default=None, help='show at most this many songs')
+    QueryParser.add_argument('--refresh', action='store_true', help='bring the index up to date first')
+    QueryParser.set_defaults(function=Query)
+
+    StatsParser = Commands.add_parser('stats', help='how big the index is')
+    StatsParser.set_defaults(function=Stats)
+
+    DuplicatesParser = Commands.add_parser('duplicates', help='find songs that are (nearly) the same song')
+    DuplicatesParser.add_argument('--threshold', type=float, default=DuplicateThreshold, help='how much of the lyrics have to be the same, 0 to 1 (default: %(default)s)')
+    DuplicatesParser.add_argument('--refresh', action='store_true', help='bring the index up to date first')
+    DuplicatesParser.set_defaults(function=Duplicates)
+
+    Arguments = Parser.parse_args(ArgumentList)
+    if Arguments.song_dir is None:
+        Arguments.song_dir = PreferencesSongDirectory()
+
+    Index = SongIndex(Arguments.index)
+    return Arguments.function(Index, Arguments)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(Main())
@@ -4,9 +4,13 @@ import os
 from pickle import TRUE
 import sys
 from tkinter import Text
-import xml.etree.ElementTree as ET
 import datetime
+import html
 import io
+import multiprocessing
+import re
+import threading
+from collections import OrderedDict
 
 try:
     import pyi_splash
@@ -22,12 +26,15 @@ from PyQt5.QtGui import QStandardItemModel
 from PyQt5.QtGui import QIcon
 from PyQt5.QtGui import QFont
 from PyQt5.QtGui import QColor
+from PyQt5.QtGui import QTextDocument
 from PyQt5.QtWidgets import QDialog
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtWidgets import QMessageBox
 from PyQt5.QtWidgets import QFileSystemModel
 from PyQt5.QtWidgets import QApplication, QWidget
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QStyle
 from PyQt5.QtCore import QAbstractItemModel, QModelIndex
+from PyQt5.QtCore import QSortFilterProxyModel
 
 # file open / search includes
 from typing import Any, List, Union
@@ -42,6 +49,14 @@ from Prefs import Ui_PrefsEditor
 from About import Ui_About
 from OpenFile import Ui_OpenDialog
 
+#    Song search index
+from SongIndex import SongIndex, SongIndexFileName
+from SongChords import SongKeys, SongKeys_Alt
+from SongSheet import ParseSongText, ChordLine, HeadingLine, BreakLine, BlankLine
+from SongRepository import Song, SongRepository
+from SongReader import ReadSongFields, ReadSongTree
+from SongCache import SongCache, SongCacheFileName
+
 
 #   OpenSongViewer
 #
@@ -111,24 +126,30 @@ from OpenFile import Ui_OpenDialog
 VersionNumber = "0.91"
 VersionInformation = "Release 10/4/25 - Carl Beech"
 
-# SongDataList - main Data structure
-# 0 - full file and path name
-# 1 - lyrics text
-# 2 - Base key
-# 3 - Offset
-# 4 - Basename (just the file name)
-# 5 - Font Size    ( Default or a font size - Landscape)
-# 6 - Font Size    ( Default or a font size - Portrait)
-# 7 - Line count before column break (Default or a line count) - Landscape
-# 8 - Line count before column break (Default or a line count) - Portrait
-
-SongDataList = []
-SongKeys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-SongKeys_Alt = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+# SongDataList - main Data structure - the songs in the song list, each a Song
+# record (see SongRepository), found by the name shown in the on-screen list.
+
+SongDataList = SongRepository()
+
+# SongKeys / SongKeys_Alt - the keys, sharp and flat versions - come from SongChords
 
 # V0.2: switch to use dictionary so can use a key:value pair.
 SongPreferences = {'DUMMY': 'DUMMY'}
 
+# Bumped whenever the preferences are changed - anything worked out using the
+# preferences (e.g. song previews) and kept for later is then out of date.
+SongPreferencesVersion = 0
+
+# Full text index of the song directory - used by the song search dialog.
+SongSearchIndex = None
+
+# Watches the song directory and keeps the search index up to date.
+SongWatcher = None
+
+# The songs read for the song list, kept on disk - so opening a song list
+# doesn't have to read every song again.
+SongFileCache = None
+
 LogFileName=datetime.datetime.now().strftime("OpenSongViewer-%Y-%m-%d_%H_%M_%S.log")
 
 def logmessage( MessageText ):
@@ -190,28 +211,6 @@ class AboutWindow(QDialog):
 
 # Classes to deal with open file / file search
 
-def grep(filename, searchString):
-    # Perform a search in a file for a given string (note not case sensitive)
-
-    # print("Checking: "+filename)
-    try:
-        with open(filename, 'r', encoding="utf8") as myfile:
-            LoadSongData = myfile.read()
-    except:
-        try:
-            with open(filename, 'r') as myfile:
-                LoadSongData = myfile.read()
-        except:
-            print(filename+" error")
-            LoadSongData=""
-
-    if ( searchString.upper() in LoadSongData.upper() ):
-        return True
-    else:  
-        return False
-
-
-
 FSMItemOrNone = Union["_FileSystemModelLiteItem", None]
 
 
@@ -224,43 +223,77 @@ def sizeof_fmt(num, suffix="B"):
     return f"{num:.1f} Yi{suffix}"
 
 
-def grep(filename, searchString):
-    # Perform a search in a file for a given string (note not case sensitive)
-
-    # print("Checking: "+filename)
-    try:
-        with open(filename, 'r', encoding="utf8") as myfile:
-            LoadSongData = myfile.read()
-    except:
-        try:
-            with open(filename, 'r') as myfile:
-                LoadSongData = myfile.read()
-        except:
-            print(filename+" error")
-            LoadSongData=""
-
-    if ( searchString.upper() in LoadSongData.upper() ):
-        return True
-    else:  
-        return False
+def file_size_and_mtime(file):
+    """Size and modification time of a file - from a single stat call"""
+    file_stat = os.stat(file)
+    return file_stat.st_size, file_stat.st_mtime
 
 
 class _FileSystemModelLiteItem(object):
     """Represents a single node (drive, folder or file) in the tree"""
 
+    # There can be tens of thousands of these - slots keep them small.
+    __slots__ = ("_data", "_parent", "child_items", "_child_names", "_row",
+                 "_stale_row", "is_folder", "pending", "folder", "fetched", "depth")
+
     def __init__(
                 self,
                 data: List[Any],
                 parent: FSMItemOrNone = None,
                 fullpath = "",
+                is_folder = False,
                 ):
         self._data: List[Any] = data
         self._parent: _FileSystemModelLiteItem = parent
         self.child_items: List[_FileSystemModelLiteItem] = []
-        self.fullpath: fullpath
+        self.is_folder = is_folder
+
+        # name -> child, so finding a child doesn't mean a search through them all
+        self._child_names = {} if is_folder else None
+
+        # our position in the parent's child_items - kept up to date by the parent
+        self._row = 0
+
+        # children from this row on have moved up (children before them were
+        # taken out) and haven't been renumbered yet - see row()
+        self._stale_row = None
+
+        # Folders are filled in when they're first expanded - until then these
+        # hold what still has to be added:
+        #   pending - (path parts, full path) of files somewhere below this folder
+        #   folder  - full path of a folder in the song directory still to be listed
+        self.pending: List[Any] = [] if is_folder else ()
+        self.folder = None
+        self.fetched = False
+
+        if parent is None:
+            self.depth = 0
+        else:
+            self.depth = parent.depth + 1
 
     def append_child(self, child: "_FileSystemModelLiteItem"):
+        child._row = len(self.child_items)
         self.child_items.append(child)
+        self._child_names[child.data(0)] = child
+
+    # take out the children in rows first_row to last_row
+    def remove_children(self, first_row: int, last_row: int):
+        for child in self.child_items[first_row:last_row + 1]:
+            if self._child_names.get(child.data(0)) is child:
+                del self._child_names[child.data(0)]
+        del self.child_items[first_row:last_row + 1]
+
+        # everything after them has moved up - they're renumbered when next
+        # asked for their row, so taking out lots of children doesn't mean
+        # renumbering the rest each time
+        if first_row < len(self.child_items) and (self._stale_row is None or first_row < self._stale_row):
+            self._stale_row = first_row
+
+    def child_by_name(self, name) -> FSMItemOrNone:
+        return self._child_names.get(name)
+
+    def set_data(self, column: int, value: Any):
+        self._data[column] = value
 
     def child(self, row: int) -> FSMItemOrNone:
         try:
@@ -271,6 +304,12 @@ class _FileSystemModelLiteItem(object):
     def child_count(self) -> int:
         return len(self.child_items)
 
+    def can_fetch_more(self) -> bool:
+        return len(self.pending) > 0 or self.folder is not None
+
+    def has_children(self) -> bool:
+        return len(self.child_items) > 0 or self.can_fetch_more()
+
     def column_count(self) -> int:
         return len(self._data)
 
@@ -281,9 +320,15 @@ class _FileSystemModelLiteItem(object):
             return None
 
     def row(self) -> int:
-        if self._parent:
-            return self._parent.child_items.index(self)
-        return 0
+        parent = self._parent
+        if parent is not None and parent._stale_row is not None and self._row >= parent._stale_row:
+            parent._renumber_children()
+        return self._row
+
+    def _renumber_children(self):
+        for later_row in range(self._stale_row, len(self.child_items)):
+            self.child_items[later_row]._row = later_row
+        self._stale_row = None
 
     def parent_item(self) -> FSMItemOrNone:
         return self._parent
@@ -291,11 +336,51 @@ class _FileSystemModelLiteItem(object):
 
 
 class FileSystemModelLite(QAbstractItemModel):
-    def __init__(self, file_list: List[str], FileStartLocation, parent=None, **kwargs):
+    """Tree of song files - folders are only filled in when they're expanded,
+    so the cost of showing the tree doesn't depend on how many songs there are.
+
+    file_list       - the files to show, or None for the whole song folder
+    folder_contents - function giving (sub folders, files) in a song folder -
+                      used to list folders when showing the whole song folder
+    file_details    - optional function giving (size, modification time) for a
+                      file, so we can use already known values rather than going
+                      to disk
+    flat            - show the files as a list, in the order given (with their
+                      path within the song folder), rather than in folders
+    file_snippet    - optional function giving the text shown for a file in an
+                      extra 'Match' column (worked out as the row is shown)
+    """
+
+    def __init__(self, file_list: Union[List[str], None], FileStartLocation, parent=None, file_details=None, folder_contents=None, flat=False, file_snippet=None, **kwargs):
         super().__init__(parent, **kwargs)
 
-        self._root_item = _FileSystemModelLiteItem(["Name", "Size", "Modification Date"])  #,"FileLoc"
-        self._setup_model_data(file_list, self._root_item, FileStartLocation)
+        self._flat = flat
+        self._file_snippet = file_snippet
+
+        if file_details is None:
+            file_details = file_size_and_mtime
+        self._file_details = file_details
+        self._folder_contents = folder_contents
+        self._file_start_location = FileStartLocation
+
+        headers = ["Name", "Size", "Modification Date"]  #,"FileLoc"
+        if file_snippet is not None:
+            headers.append("Match")
+        self._root_item = _FileSystemModelLiteItem(headers, is_folder=True)
+
+        # full path -> item, for the files (not folders) in the tree
+        self._file_items = {}
+
+        # path within the song folder (tuple of names) -> item, for the folders
+        self._folder_items = {}
+
+        # files removed before their folder was filled in
+        self._dropped_files = set()
+
+        if file_list is None:
+            self._root_item.folder = FileStartLocation
+        else:
+            self._root_item.pending = [self._file_record(file) for file in file_list]
 
     def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
         if not index.isValid():
@@ -303,6 +388,11 @@ class FileSystemModelLite(QAbstractItemModel):
 
         item: _FileSystemModelLiteItem = index.internalPointer()
         if role == Qt.DisplayRole:
+            if index.column() == 3:
+                # the Match column - (the file's full path is kept in column 3)
+                if item.is_folder:
+                    return ""
+                return self._file_snippet(item.data(3))
             return item.data(index.column())
         elif index.column() == 0 and role == Qt.DecorationRole:
             return 0
@@ -313,6 +403,8 @@ class FileSystemModelLite(QAbstractItemModel):
             return None
 
         item: _FileSystemModelLiteItem = index.internalPointer()
+        if item.is_folder:
+            return None
         if role == Qt.DisplayRole:
             return item.data(3)
         elif index.column() == 0 and role == Qt.DecorationRole:
@@ -367,58 +459,359 @@ class FileSystemModelLite(QAbstractItemModel):
         return parent_item.child_count()
 
     def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
-        if parent.isValid():
-            return parent.internalPointer().column_count()
         return self._root_item.column_count()
 
-    def _setup_model_data(self, file_list: List[str], parent: "_FileSystemModelLiteItem", FileStartLocation):
-        def _add_to_tree(_file_record, _parent: "_FileSystemModelLiteItem", root=False, FullFileLocation=""):
-            item_name = _file_record["bits"].pop(0)
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        if parent.column() > 0:
+            return False
 
-            for child in _parent.child_items:
-                if item_name == child.data(0):
-                    item = child
-                    break
+        if not parent.isValid():
+            return self._root_item.has_children()
+
+        return parent.internalPointer().has_children()
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        if not parent.isValid():
+            return self._root_item.can_fetch_more()
+
+        return parent.internalPointer().can_fetch_more()
+
+    def fetchMore(self, parent: QModelIndex):
+        if not parent.isValid():
+            parent_item = self._root_item
+        else:
+            parent_item = parent.internalPointer()
+
+        self._fetch(parent_item)
+
+    # Fill in a folder - the view is told about the new rows.
+    def _fetch(self, folder_item: "_FileSystemModelLiteItem"):
+        records = folder_item.pending
+        folder_item.pending = []
+        folder_item.fetched = True
+
+        first_new_row = folder_item.child_count()
+
+        if folder_item.folder is not None:
+            sub_folders, files = self._folder_contents(folder_item.folder)
+            folder_item.folder = None
+
+            # Sub folders first, then the files - the sub folders are listed
+            # in their turn when they're expanded.
+            for sub_folder in sub_folders:
+                item = self._find_child(folder_item, osp.basename(sub_folder))
+                if item is None or not item.is_folder:
+                    item = self._new_folder(folder_item, osp.basename(sub_folder))
+                if not item.fetched:
+                    item.folder = sub_folder
+
+            records = [self._file_record(file) for file in files] + records
+
+        for record in records:
+            self._add_record(record, folder_item, False)
+
+        # The new rows only go in once the view (or proxy) has been told they're
+        # coming - it mustn't see them beforehand.
+        new_items = folder_item.child_items[first_new_row:]
+        if len(new_items) > 0:
+            del folder_item.child_items[first_new_row:]
+            self.beginInsertRows(self._item_index(folder_item), first_new_row, first_new_row + len(new_items) - 1)
+            folder_item.child_items.extend(new_items)
+            self.endInsertRows()
+
+    # Add more files to an existing model - the view is told about each new row
+    # so it can keep showing what's already there (used when search results
+    # arrive a batch at a time, and when songs are added to the song folder).
+    def add_files(self, file_list: List[str]):
+        for file in file_list:
+            self._dropped_files.discard(file)
+            if self._root_item.fetched:
+                self._add_record(self._file_record(file), self._root_item, True)
             else:
-                data = [item_name, "", "",FullFileLocation]
-                if root:
-                    dummy=1
-                elif len(_file_record["bits"]) == 0:
-                    data = [
-                            item_name,
-                            _file_record["size"],
-                            _file_record["modified_at"],
-                            FullFileLocation,
-                            ]
-                else:
-                    dummy=1
+                self._root_item.pending.append(self._file_record(file))
+
+    # Take files out of an existing model - any folders left empty go too.
+    def remove_files(self, file_list: List[str]):
+        items = []
+        for file in file_list:
+            item = self._file_items.pop(file, None)
+            if item is None:
+                self._dropped_files.add(file)
+                continue
+            items.append(item)
+
+        # the files first, then the folders they've left empty, and so on up
+        while len(items) > 0:
+            rows_by_parent = {}
+            for item in items:
+                rows_by_parent.setdefault(item.parent_item(), []).append(item.row())
+
+            items = []
+            for parent_item, rows in rows_by_parent.items():
+                self._remove_rows(parent_item, rows)
+
+                if parent_item != self._root_item and not parent_item.has_children():
+                    self._folder_items.pop(self.folder_key(parent_item), None)
+                    items.append(parent_item)
+
+    # Take rows out of a folder - last first, so the rows still to go don't
+    # move, and neighbouring rows together.
+    def _remove_rows(self, parent_item, rows):
+        rows.sort(reverse=True)
+        parent_index = self._item_index(parent_item)
+
+        position = 0
+        while position < len(rows):
+            last_row = rows[position]
+            first_row = last_row
+            while position + 1 < len(rows) and rows[position + 1] == first_row - 1:
+                position += 1
+                first_row = rows[position]
+
+            self.beginRemoveRows(parent_index, first_row, last_row)
+            parent_item.remove_children(first_row, last_row)
+            self.endRemoveRows()
+
+            position += 1
+
+    # Files have changed on disk - update the size and modification date shown.
+    def update_files(self, file_list: List[str]):
+        for file in file_list:
+            item = self._file_items.get(file)
+            if item is None:
+                continue
+
+            file_size, file_mtime = self._file_details(file)
+            item.set_data(1, sizeof_fmt(file_size))
+            item.set_data(2, time.strftime("%Y-%b-%d %H:%M:%S", time.localtime(file_mtime)))
+
+            row = item.row()
+            parent_index = self._item_index(item.parent_item())
+            self.dataChanged.emit(self.index(row, 1, parent_index), self.index(row, 2, parent_index))
+
+    # Ask the views (and proxies) to look again at files / folders that haven't
+    # themselves changed - e.g. because a filter on the tree now shows or hides
+    # them.  Only files and folders that are in the tree so far are looked at,
+    # anything else gets the filter when its folder is filled in.
+    def refilter(self, file_list: List[str], folder_keys):
+        items = [self._file_items[file] for file in file_list if file in self._file_items]
+        items += [self._folder_items[key] for key in folder_keys if key in self._folder_items]
+
+        rows_by_parent = {}
+        for item in items:
+            rows_by_parent.setdefault(item.parent_item(), []).append(item.row())
+
+        # one notification for each run of rows next to each other
+        last_column = self.columnCount() - 1
+        for parent_item, rows in rows_by_parent.items():
+            parent_index = self._item_index(parent_item)
+            rows.sort()
+            first_row = rows[0]
+            for position, row in enumerate(rows):
+                if position + 1 == len(rows) or rows[position + 1] != row + 1:
+                    self.dataChanged.emit(self.index(first_row, 0, parent_index), self.index(row, last_column, parent_index))
+                    if position + 1 < len(rows):
+                        first_row = rows[position + 1]
+
+    # The item at a row of a folder
+    def row_item(self, row: int, parent: QModelIndex) -> FSMItemOrNone:
+        if not parent.isValid():
+            return self._root_item.child(row)
+        return parent.internalPointer().child(row)
+
+    # Path of a folder within the song folder, as a tuple of names
+    def folder_key(self, item: "_FileSystemModelLiteItem"):
+        names = []
+        while item is not self._root_item:
+            names.append(item.data(0))
+            item = item.parent_item()
+        return tuple(reversed(names))
+
+    # The folders a file is in (below the song folder) - as for folder_key
+    def file_folder_keys(self, file):
+        bits, file = self._file_record(file)
+        return [tuple(bits[:depth]) for depth in range(1, len(bits))]
+
+    # Everything in the tree so far - (files, folder keys)
+    def known_items(self):
+        return self._file_items.keys(), self._folder_items.keys()
+
+    def _item_index(self, item: "_FileSystemModelLiteItem") -> QModelIndex:
+        if item == self._root_item:
+            return QModelIndex()
+        return self.createIndex(item.row(), 0, item)
+
+    # (path within the song folder split into parts, full path)
+    def _file_record(self, file):
+        shortfile = file
+        if file.startswith(self._file_start_location):
+            shortfile = file[len(self._file_start_location):]
+
+        bits = [bit for bit in shortfile.replace("\\", "/").split("/") if bit != ""]
+        if self._flat:
+            bits = ["/".join(bits)]
+        return bits, file
+
+    def _find_child(self, _parent: "_FileSystemModelLiteItem", item_name):
+        return _parent.child_by_name(item_name)
+
+    def _new_folder(self, _parent: "_FileSystemModelLiteItem", item_name):
+        item = _FileSystemModelLiteItem([item_name, "", "", ""], parent=_parent, is_folder=True)
+        _parent.append_child(item)
+        self._folder_items[self.folder_key(item)] = item
+        return item
+
+    # Put a file record into a folder that's been filled in - if it belongs in a
+    # sub folder that hasn't been filled in yet, it waits there until it is.
+    def _add_record(self, _file_record, _parent: "_FileSystemModelLiteItem", notify):
+        bits, file = _file_record
+        item_name = bits[_parent.depth]
+
+        if len(bits) == _parent.depth + 1:
+            # It's a file in this folder
+            if file in self._file_items or file in self._dropped_files:
+                return
+
+            file_size, file_mtime = self._file_details(file)
+            data = [
+                    item_name,
+                    sizeof_fmt(file_size),
+                    time.strftime("%Y-%b-%d %H:%M:%S", time.localtime(file_mtime)),
+                    file,
+                    ]
+
+            if notify:
+                new_row = _parent.child_count()
+                self.beginInsertRows(self._item_index(_parent), new_row, new_row)
+
+            item = _FileSystemModelLiteItem(data, parent=_parent)
+            _parent.append_child(item)
+            self._file_items[file] = item
+
+            if notify:
+                self.endInsertRows()
+            return
+
+        # It's further down - find (or create) the folder it's in
+        item = self._find_child(_parent, item_name)
+        if item is None or not item.is_folder:
+            if notify:
+                new_row = _parent.child_count()
+                self.beginInsertRows(self._item_index(_parent), new_row, new_row)
+
+            item = self._new_folder(_parent, item_name)
+
+            if notify:
+                self.endInsertRows()
+
+        if item.fetched:
+            self._add_record(_file_record, item, notify)
+        else:
+            item.pending.append(_file_record)
+
+
+class SongFilterProxyModel(QSortFilterProxyModel):
+    """Shows just some of the songs in a FileSystemModelLite tree (and the
+    folders they're in) - used to show search results in the one tree of the
+    whole song folder, rather than building a new tree for every search.
+
+    Changing the songs shown only has the rows that are shown / hidden looked
+    at again - the tree isn't reset, so what's expanded and selected stays.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        # full paths of the songs to show - or None to show everything
+        self._files = None
+
+        # folders (as FileSystemModelLite.folder_key) with songs to show in them
+        self._folders = set()
+
+    def showing_all(self) -> bool:
+        return self._files is None
+
+    # Show just these songs - or everything, if file_list is None
+    def set_files(self, file_list: Union[List[str], None]):
+        source = self.sourceModel()
+
+        if file_list is None:
+            files, folders = None, set()
+        else:
+            files = set(file_list)
+            folders = self._folders_of(files)
+
+        if self._files is None and files is None:
+            return
+
+        if self._files is None or files is None:
+            # everything in the tree so far that isn't (or wasn't) shown
+            shown_files, shown_folders = (self._files, self._folders) if files is None else (files, folders)
+            known_files, known_folders = source.known_items()
+            changed_files = [file for file in known_files if file not in shown_files]
+            changed_folders = [key for key in known_folders if key not in shown_folders]
+        else:
+            changed_files = files.symmetric_difference(self._files)
+            changed_folders = folders.symmetric_difference(self._folders)
 
-                item = _FileSystemModelLiteItem(data,parent=_parent)
-                _parent.append_child(item)
+        self._files, self._folders = files, folders
+        source.refilter(changed_files, changed_folders)
 
-            if len(_file_record["bits"]):
-                _add_to_tree(_file_record, item, False, FullFileLocation)
+    # Show these songs as well
+    def add_files(self, file_list: List[str]):
+        if self._files is None:
+            return
 
+        new_files = [file for file in file_list if file not in self._files]
+        new_folders = self._folders_of(new_files) - self._folders
+
+        self._files.update(new_files)
+        self._folders.update(new_folders)
+        self.sourceModel().refilter(new_files, new_folders)
+
+    def _folders_of(self, file_list):
+        source = self.sourceModel()
+        folders = set()
         for file in file_list:
-            file_record = {
-                            "size": sizeof_fmt(osp.getsize(file)),
-                            "modified_at": time.strftime("%Y-%b-%d %H:%M:%S", time.localtime(osp.getmtime(file))),
-                            "fullfilelocation":file
-                            }
-
-            drive = True
-            if "\\" in file:
-                file = posixpath.join(*file.split("\\"))
-            
-            shortfile=file.replace(FileStartLocation,"")
+            folders.update(source.file_folder_keys(file))
+        return folders
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if self._files is None:
+            return True
+
+        source = self.sourceModel()
+        item = source.row_item(source_row, source_parent)
+        if item is None:
+            return False
+        if item.is_folder:
+            return source.folder_key(item) in self._folders
+        return item.data(3) in self._files
+
 
-            bits = shortfile.split("/")
-            if len(bits) > 1 and bits[0] == "":
-                bits[0] = "/"
-                drive = False
+class SnippetDelegate(QStyledItemDelegate):
+    """Draws a column whose text is (simple) HTML - used for the search hit
+    snippets, with the hit in bold."""
 
-            file_record["bits"] = bits
-            _add_to_tree(file_record, parent, drive, file)
+    def paint(self, painter, option, index):
+        options = QStyleOptionViewItem(option)
+        self.initStyleOption(options, index)
+
+        document = QTextDocument()
+        document.setDefaultFont(options.font)
+        document.setDocumentMargin(0)
+        document.setHtml(options.text)
+
+        # Draw the row's background (selection etc.) without the text
+        options.text = ""
+        style = options.widget.style() if options.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, options, painter, options.widget)
+
+        painter.save()
+        painter.translate(options.rect.left(), options.rect.top() + (options.rect.height() - document.size().height()) / 2)
+        painter.setClipRect(0, 0, options.rect.width(), options.rect.height())
+        document.drawContents(painter)
+        painter.restore()
 
 
 #============================================================================================
@@ -437,6 +830,713 @@ class StandardItem(QStandardItem):
         self.setText(txt)
 
 
+#   Keeps an eye on the song directory for the lifetime of the program, so the
+#   song search index (and the song search dialog, if it's open) are kept up to
+#   date as songs are added, edited, renamed or removed - without having to
+#   rescan the whole song directory.
+#
+#   Only the directories are watched (watching every song would mean thousands
+#   of handles on Windows) - a directory that's changed is looked at again, and
+#   songs in it that have changed size or modification time are re-read.  This
+#   is done on the song index's own thread, not the GUI thread.  Writing to a
+#   song doesn't always count as a change to its directory (on Linux, it
+#   doesn't), so every so often the songs are checked as well.
+
+#   How long to wait (ms) after a change before acting on it - saving a song
+#   can produce several notifications in a row.
+WatcherDelay = 300
+
+#   How long to wait (ms) after a change before saving the song index
+WatcherSaveDelay = 5000
+
+#   How often (ms) to check for songs edited in place (see SongIndex.CheckFiles)
+WatcherCheckInterval = 5 * 60 * 1000
+
+#   How long to wait (seconds) for the song index to stop updating when the
+#   program closes
+WatcherCloseWait = 10
+
+
+#   Bring the song index up to date with the song directory in the background -
+#   when the index is first built, or the song directory has changed a lot
+#   since the program was last run, this can take a while.
+class SongIndexRefreshSignals(QtCore.QObject):
+    # (songs read, songs to read)
+    progress = QtCore.pyqtSignal(int, int)
+    # (refresh task, added files, updated files, removed files)
+    finished = QtCore.pyqtSignal(object, object, object, object)
+
+
+class SongIndexRefreshTask(QtCore.QRunnable):
+
+    #   CheckFiles - look for songs changed in place (see SongIndex.CheckFiles)
+    #                rather than bringing the index up to date with the directory
+    def __init__(self, SongDirectory, CheckFiles=False):
+        super().__init__()
+        self.SongDirectory = SongDirectory
+        self.CheckFiles = CheckFiles
+        self.signals = SongIndexRefreshSignals()
+        self._Cancelled = False
+        self.Done = threading.Event()
+
+    #   Stop reading songs - what's been read so far is saved, the rest are
+    #   read next time.
+    def Cancel(self):
+        self._Cancelled = True
+
+    def IsCancelled(self):
+        return self._Cancelled
+
+    def run(self):
+
+        Added, Updated, Removed = [], [], []
+
+        try:
+            if self.CheckFiles:
+                Added, Updated, Removed = SongSearchIndex.CheckFiles(Progress=self.signals.progress.emit, Cancelled=self.IsCancelled)
+            else:
+                Added, Updated, Removed = SongSearchIndex.Refresh(self.SongDirectory, Progress=self.signals.progress.emit, Cancelled=self.IsCancelled)
+        except:
+            logmessage("SongIndexRefreshTask:Error refreshing song index")
+
+        self.Done.set()
+        self.signals.finished.emit(self, Added, Updated, Removed)
+
+
+#   Bring the song index up to date for directories the watcher has been told
+#   have changed - in the background, as songs may have to be read.
+class SongLibraryChangesTask(QtCore.QRunnable):
+
+    def __init__(self, Directories):
+        super().__init__()
+        self.Directories = Directories
+        self.signals = SongIndexRefreshSignals()
+
+    def run(self):
+
+        Added, Updated, Removed = [], [], []
+
+        try:
+            for Directory in self.Directories:
+                DirAdded, DirUpdated, DirRemoved = SongSearchIndex.RefreshDirectory(Directory)
+                Added += DirAdded
+                Updated += DirUpdated
+                Removed += DirRemoved
+        except:
+            logmessage("SongLibraryChangesTask:Error applying changes")
+
+        self.signals.finished.emit(self, Added, Updated, Removed)
+
+
+#   Save the song index in the background - with a big library it takes long
+#   enough to notice.
+class SongIndexSaveTask(QtCore.QRunnable):
+
+    def run(self):
+
+        try:
+            SongSearchIndex.Save()
+        except:
+            logmessage("SongIndexSaveTask:Error saving song index")
+
+
+class SongLibraryWatcher(QtCore.QObject):
+
+    # (added files, updated files, removed files)
+    changed = QtCore.pyqtSignal(object, object, object)
+
+    # (songs read, songs to read) - while the song index is being brought up
+    # to date with the song directory
+    progress = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.SongDirectory = ''
+
+        self.Watcher = QtCore.QFileSystemWatcher(self)
+        self.Watcher.directoryChanged.connect(self.DirectoryChanged)
+
+        # Tidied-up path -> path as used by the song index
+        self.WatchedPaths = {}
+
+        self.PendingDirectories = set()
+
+        self.UpdateTimer = QtCore.QTimer(self)
+        self.UpdateTimer.setSingleShot(True)
+        self.UpdateTimer.setInterval(WatcherDelay)
+        self.UpdateTimer.timeout.connect(self.ApplyChanges)
+
+        self.SaveTimer = QtCore.QTimer(self)
+        self.SaveTimer.setSingleShot(True)
+        self.SaveTimer.setInterval(WatcherSaveDelay)
+        self.SaveTimer.timeout.connect(self.SaveIndex)
+
+        self.CheckTimer = QtCore.QTimer(self)
+        self.CheckTimer.setInterval(WatcherCheckInterval)
+        self.CheckTimer.timeout.connect(self.CheckFiles)
+
+        #   Bringing the index up to date (and saving it) has a thread of its
+        #   own - building it for a big library takes a while, and searches and
+        #   previews (on the global thread pool) mustn't have to wait for it.
+        self.RefreshTask = None
+        self.RefreshPool = QtCore.QThreadPool(self)
+        self.RefreshPool.setMaxThreadCount(1)
+
+    #   Start watching a (new) song directory - the index is brought up to date
+    #   first (in the background), then the directory is watched.
+    def SetSongDirectory(self, SongDirectory):
+
+        logmessage("SongLibraryWatcher:SetSongDirectory:"+SongDirectory)
+
+        if SongDirectory == self.SongDirectory:
+            return
+
+        OldPaths = self.Watcher.directories()
+        if len(OldPaths) > 0:
+            self.Watcher.removePaths(OldPaths)
+        self.WatchedPaths = {}
+        self.CheckTimer.stop()
+
+        self.SongDirectory = SongDirectory
+
+        if self.RefreshTask is not None:
+            self.RefreshTask.Cancel()
+
+        self.StartRefresh(SongIndexRefreshTask(SongDirectory))
+
+    def StartRefresh(self, Task):
+
+        self.RefreshTask = Task
+        self.RefreshTask.signals.progress.connect(self.progress)
+        self.RefreshTask.signals.finished.connect(self.RefreshFinished)
+        self.RefreshPool.start(self.RefreshTask)
+
+    #   The song index is up to date with the song directory - watch it from
+    #   now on, and check for songs edited in place while we weren't watching.
+    def RefreshFinished(self, Task, Added, Updated, Removed):
+
+        # Ignore a refresh that's been overtaken by a change of song directory
+        if Task is not self.RefreshTask:
+            return
+
+        logmessage("SongLibraryWatcher:RefreshFinished")
+
+        self.RefreshTask = None
+
+        if not Task.CheckFiles:
+            self.progress.emit(0, 0)
+            self.Watch(SongSearchIndex.Directories())
+            if not Task.IsCancelled():
+                self.CheckFiles()
+                self.CheckTimer.start()
+
+        if len(Added) > 0 or len(Updated) > 0 or len(Removed) > 0:
+            self.changed.emit(Added, Updated, Removed)
+
+    #   Look for songs edited in place - unless the index is already being
+    #   brought up to date.
+    def CheckFiles(self):
+        if self.RefreshTask is None:
+            self.StartRefresh(SongIndexRefreshTask(self.SongDirectory, CheckFiles=True))
+
+    def Watch(self, Paths):
+
+        if len(Paths) == 0:
+            return
+
+        for Path in Paths:
+            self.WatchedPaths[os.path.normpath(Path)] = Path
+
+        Failed = self.Watcher.addPaths(Paths)
+        if len(Failed) > 0:
+            logmessage("SongLibraryWatcher:Unable to watch "+str(len(Failed))+" paths")
+
+    def DirectoryChanged(self, Path):
+        self.PendingDirectories.add(self.WatchedPaths.get(os.path.normpath(Path), Path))
+        self.UpdateTimer.start()
+
+    #   Apply the changes that have built up to the index (in the background),
+    #   and let anyone interested know what's changed.
+    def ApplyChanges(self):
+
+        logmessage("SongLibraryWatcher:ApplyChanges")
+
+        Task = SongLibraryChangesTask(list(self.PendingDirectories))
+        Task.signals.finished.connect(self.ChangesApplied)
+        self.RefreshPool.start(Task)
+
+        self.PendingDirectories = set()
+
+    def ChangesApplied(self, Task, Added, Updated, Removed):
+
+        #   New directories need watching - directories that have gone are
+        #   no longer watched.
+        Directories = SongSearchIndex.Directories()
+        NewDirectories = [Directory for Directory in Directories if os.path.normpath(Directory) not in self.WatchedPaths]
+        self.Watch(NewDirectories)
+
+        for Path in set(self.WatchedPaths) - set(os.path.normpath(Directory) for Directory in Directories):
+            self.Watcher.removePath(self.WatchedPaths.pop(Path))
+
+        if len(Added) > 0 or len(Updated) > 0 or len(Removed) > 0:
+            self.changed.emit(Added, Updated, Removed)
+            self.SaveTimer.start()
+
+    def SaveIndex(self):
+        self.RefreshPool.start(SongIndexSaveTask())
+
+    #   Program is closing - stop bringing the index up to date (it carries on
+    #   from where it got to next time), and save any changes not yet saved.
+    def Close(self):
+
+        logmessage("SongLibraryWatcher:Close")
+
+        self.UpdateTimer.stop()
+        self.CheckTimer.stop()
+
+        if self.RefreshTask is not None:
+            self.RefreshTask.Cancel()
+            self.RefreshTask.Done.wait(WatcherCloseWait)
+            self.RefreshTask = None
+
+        self.RefreshPool.waitForDone(WatcherCloseWait * 1000)
+
+        if self.SaveTimer.isActive():
+            self.SaveTimer.stop()
+            SongSearchIndex.Save()
+
+
+#   Background song search - used by the song search dialog so that the
+#   search box doesn't freeze while a search is running.  Results are passed
+#   back as they're found - the first few straight away, so there's something
+#   to look at, then the rest in batches - rather than waiting for the whole
+#   search to finish.
+
+#   How long to wait (ms) after a key press before starting to search
+SearchDelay = 150
+
+#   How many results to show first - passed back as soon as they're found
+SearchFirstBatchSize = 50
+
+#   The rest of the search results are passed back in batches of this size
+SearchBatchSize = 200
+
+
+class SongSearchSignals(QtCore.QObject):
+    # (search task, list of files, first batch?, how many more results there
+    #  are to come - or -1 if that isn't known yet as the search is still going)
+    results = QtCore.pyqtSignal(object, object, bool, int)
+
+
+class SongSearchTask(QtCore.QRunnable):
+
+    def __init__(self, SearchText):
+        super().__init__()
+        self.SearchText = SearchText
+        self.signals = SongSearchSignals()
+        self._Cancelled = False
+
+        # Set if nothing had the search text in it, and these are the closest
+        # matches (best first) instead.
+        self.Ranked = False
+
+        # Results found, but not passed back yet - and those that have been
+        self._Pending = []
+        self._Sent = set()
+
+    #   Stop this search - it's been overtaken by a newer one.
+    def Cancel(self):
+        self._Cancelled = True
+
+    def IsCancelled(self):
+        return self._Cancelled
+
+    #   Songs found by the search, while it's still going - pass them back
+    #   once there are enough for a batch.
+    def Found(self, file_list):
+
+        self._Pending.extend(file_list)
+
+        while not self._Cancelled:
+            BatchSize = SearchFirstBatchSize if len(self._Sent) == 0 else SearchBatchSize
+            if len(self._Pending) < BatchSize:
+                break
+            self.SendBatch(BatchSize, -1)
+
+    #   Pass back the next BatchSize of the results found
+    def SendBatch(self, BatchSize, More):
+
+        Batch = self._Pending[:BatchSize]
+        del self._Pending[:BatchSize]
+
+        FirstBatch = len(self._Sent) == 0
+        self._Sent.update(Batch)
+        if More != -1:
+            More = len(self._Pending)
+
+        self.signals.results.emit(self, Batch, FirstBatch, More)
+
+    def run(self):
+
+        try:
+            file_list = SongSearchIndex.Search(self.SearchText, self.IsCancelled, self.Found)
+
+            # Nothing with exactly that in - probably a typo, so see what comes closest.
+            if file_list is not None and len(file_list) == 0:
+                self.Ranked = True
+                file_list = SongSearchIndex.RankedSearch(self.SearchText, self.IsCancelled)
+        except:
+            logmessage("SongSearchTask:Error searching for "+self.SearchText)
+            file_list = []
+
+        if file_list is None or self._Cancelled:
+            return
+
+        #   The search has finished - send back whatever hasn't been sent yet
+        #   (the results may not all have been passed to Found).
+        self._Pending = [file for file in file_list if file not in self._Sent]
+        while not self._Cancelled:
+            BatchSize = SearchFirstBatchSize if len(self._Sent) == 0 else SearchBatchSize
+            self.SendBatch(BatchSize, 0)
+            if len(self._Pending) == 0:
+                break
+
+
+#   Song previews for the song search dialog - reading, parsing and laying out a
+#   song every time the highlight moves makes arrowing through the songs
+#   laggy, so previews are kept (the most recently used, up to PreviewCacheSize
+#   of them) and the songs either side of the highlight are worked out in the
+#   background, ready for when the highlight moves on to them.
+
+#   How many song previews to keep
+PreviewCacheSize = 50
+
+
+#   Work out the HTML previewing a song file
+def SongPreviewHtml(FilePath):
+    global SongPreferences
+
+    #   Just the song details we need from the XML
+    LoadSongFields = ReadSongFields(FilePath, ('lyrics', 'key'))
+
+    SongTextHeader = """<html>
+        <head>
+        <style>
+        body { 
+            background-color: #FFFFFF;
+            padding-top : 1em;
+            font-family: Arial, Helvetica, sans-serif;
+            font-size: 30px; margin: 0px; 
+            } 
+        p {
+          padding-top : 1em; 
+          font-family: Arial, Helvetica, sans-serif;  
+          font-size: 30px; margin: 0px; 
+        }
+        p.heading {
+          padding-top : 0; 
+          font-family: Arial, Helvetica, sans-serif;
+          color: red;
+          margin: 0px;
+          font-size: 30px;
+        }
+        p.nochords {
+          padding-top : 0;  
+          font-family: Arial, Helvetica, sans-serif; 
+          margin: 0px;
+          font-size: 30px; 
+        }
+        p.onlychords {
+          padding-top : 0;  
+          font-family: Arial, Helvetica, sans-serif; 
+          margin: 0px;
+          font-weight: bold;
+          font-style: italic;
+          color: blue;
+          font-size: 30px; 
+        }
+
+        em {
+            font-style: normal;
+        }
+
+        em[data-chord]:before {
+            position: relative;
+            top: -1em;
+            display: inline-block;
+            content: attr(data-chord);
+            width: 0;
+            font-weight: bold;
+            font-style: italic;
+            color: blue;
+            font-family: Arial, Helvetica, sans-serif;
+            speak: literal-punctuation;
+            pause: 1s;
+            /* pause between chord and text */
+        }
+
+        table {
+            padding: 0;
+            border: 1px solid black;
+        }
+        tr {
+            padding: 0;
+        }
+        td {
+            vertical-align: top;
+        }
+
+        </style>
+        </head>
+        <body>"""
+
+    #SongTextHeader = "<html><head>"
+    #SongTextHeader = SongTextHeader + "<style>"
+    #SongTextHeader = SongTextHeader + "body { background-color: #555555;font-size: 32px;} "
+
+    #SongTextHeader = SongTextHeader + "p { font-size: 25px; margin: 0px;} "
+    #SongTextHeader = SongTextHeader + "table { width: 100%; border: 2px solid black; padding 20px;} "
+    #SongTextHeader = SongTextHeader + "tr { width: 100%; border: 2px solid black; padding 20px;} "
+    #SongTextHeader = SongTextHeader + "td { border: 2px solid black; padding 5px; background-color: #eeeeee;} "
+    #SongTextHeader = SongTextHeader + "</style>"
+    #SongTextHeader = SongTextHeader + "</head>"
+    #SongTextHeader = SongTextHeader + "<body>"
+
+
+    OutputSongText = "<table><tr><td style='padding:10px'>"
+
+    LoadSongText=LoadSongFields['lyrics']
+
+    if 'key' not in LoadSongFields:
+        SongKeyValue = 'C'
+    else:
+        SongKey = LoadSongFields['key']
+        if SongKey == '':
+            SongKeyValue = 'C'
+        else:
+            SongKeyValue = SongKey
+
+    OutputText=Derive_Song_Text( "YES", ParseSongText(LoadSongText), SongKeyValue, 0,SongPreferences['DEFAULTPAGESIZE'],'L')
+
+    #LoadSongText = LoadSongText.replace('\n.','<br> ').replace('\n ','</br> ').replace(' ','&nbsp;')
+    # space in the TD STYLE has been mucked up by the global replace - undo it.
+    #LoadSongText = LoadSongText.replace('<td&nbsp;style','<td style')
+    #LoadSongText = LoadSongText.replace('[','<b><font color=''red''>[').replace(']',']</font></b>')
+
+    SongLyricsDisplay = OutputSongText + OutputText
+
+    SongLyricsDisplay = SongTextHeader + SongLyricsDisplay + '</td></tr></table></body></html>'
+
+    #print("SONGTEXT---------------------------------------------------------")
+    #print(SongLyricsDisplay)
+    #print("SONGTEXT---------------------------------------------------------")
+
+    return SongLyricsDisplay
+
+
+#   Song previews, keyed by (file, modification time, preferences version) -
+#   so a song that's been edited, or changed preferences, give a new preview.
+class SongPreviewCache(object):
+
+    def __init__(self, Size):
+        self.Size = Size
+        self._Previews = OrderedDict()
+        self._Lock = threading.Lock()
+
+    def _Key(self, FilePath):
+        return (FilePath, os.stat(FilePath).st_mtime, SongPreferencesVersion)
+
+    #   The preview of a song - worked out if we haven't got it already
+    def Preview(self, FilePath):
+
+        Key = self._Key(FilePath)
+        with self._Lock:
+            SongLyricsDisplay = self._Previews.get(Key)
+            if SongLyricsDisplay is not None:
+                self._Previews.move_to_end(Key)
+                return SongLyricsDisplay
+
+        SongLyricsDisplay = SongPreviewHtml(FilePath)
+
+        with self._Lock:
+            self._Previews[Key] = SongLyricsDisplay
+            while len(self._Previews) > self.Size:
+                self._Previews.popitem(last=False)
+
+        return SongLyricsDisplay
+
+    #   Work out a song's preview ahead of time - errors are left for when (if)
+    #   the song is actually previewed.
+    def Prefetch(self, FilePath):
+
+        try:
+            self.Preview(FilePath)
+        except:
+            pass
+
+
+SongPreviews = SongPreviewCache(PreviewCacheSize)
+
+
+#   Background preparation of song previews
+class SongPreviewTask(QtCore.QRunnable):
+
+    def __init__(self, FilePaths):
+        super().__init__()
+        self.FilePaths = FilePaths
+
+    def run(self):
+        for FilePath in self.FilePaths:
+            SongPreviews.Prefetch(FilePath)
+
+
+#   Read a song file for the song list - returns the song (not yet in the
+#   list), or None if it couldn't be read.  Only reads (through the song
+#   cache), so it can be run off the GUI thread.
+def ReadListSong(SongFilename, SetSongOffset, SongLocation):
+
+    logmessage("ReadListSong")
+    try:
+
+        #   windows/linux
+        FName=SongFilename
+        if os.sep == '\\':
+            FName = FName.replace('/', '\\')
+        FName = FName.replace(SongLocation+'\\', '')
+
+        #   Read in the song data, to add to the list...
+
+        logmessage("ReadListSong:Filename:"+FName)
+
+        #   Just the song details we need - from the song cache if the
+        #   song hasn't changed since it was last read
+        SongFields = SongFileCache.SongFields(FName)
+
+        #   Interpret the XML into the main data structure
+        SongLyrics = SongFields['lyrics']
+
+        if SongFields.get('key') is None:
+            SongKeyValue = 'C'
+        else:
+            SongKeyValue = SongFields['key']
+
+        logmessage("ReadListSong:KeyData:"+SongKeyValue)
+
+        ExtraInfoText=SongFields.get('user1')
+
+        try:
+            if "|" in ExtraInfoText:
+            # we have extra font info...
+
+                ExtraInfoArray=ExtraInfoText.split("|")
+
+                FontSize = ExtraInfoArray[0]
+                if len(FontSize) == 0:
+                    FontSize = "Default"
+
+                FontSize_Portrait = ExtraInfoArray[1]
+                if len(FontSize_Portrait) == 0:
+                    FontSize = "Default"
+
+                PageSize = ExtraInfoArray[2]
+                if len(PageSize) == 0:
+                    PageSize = "Default"
+
+                PageSize_Portrait = ExtraInfoArray[3]
+                if len(PageSize_Portrait) == 0:
+                    PageSize_Portrait = "Default"
+
+            else:
+
+                FontSize = "Default"
+                FontSize_Portrait = "Default"
+                PageSize = "Default"
+                PageSize_Portrait = "Default"
+
+
+        except:
+            FontSize = "Default"
+            FontSize_Portrait = "Default"
+            PageSize = "Default"
+            PageSize_Portrait = "Default"
+
+
+        logmessage("ReadListSong:Fontdata:FontSize_L:"+FontSize+" P:"+FontSize_Portrait+" Pagesize_L:"+PageSize+" P:"+PageSize_Portrait)
+
+        logmessage("ReadListSong:Lyrics")
+        logmessage(SongLyrics)
+
+        # Create list element, SongName, LyricsText, Key, OffsetToKey
+        return Song(FName, SongLyrics, SongKeyValue, SetSongOffset, os.path.basename(FName),FontSize,FontSize_Portrait,PageSize,PageSize_Portrait)
+
+    except:
+        logmessage("ReadListSong: Error reading song?")
+        print("Error trying to read song - ignoring")
+        return None
+
+
+#   How many songs to read at once when loading a song list - reading a song is
+#   mostly waiting for the disk (or network share), so this can be more than
+#   the number of processors.  The song list loads have their own threads, so
+#   they don't wait behind a song index refresh.
+SongListLoadThreads = 8
+
+
+class SongListLoadSignals(QtCore.QObject):
+    # (song list load, position in the song list, the song - or None if it
+    #  couldn't be read)
+    loaded = QtCore.pyqtSignal(object, int, object)
+
+
+#   Loading a song list - the songs are read in the background, a task each,
+#   and go into the on-screen list as they arrive, in the song list's order.
+class SongListLoad(object):
+
+    def __init__(self, SongList, SongLocation):
+        # [(song file name, key offset)]
+        self.SongList = SongList
+        self.SongLocation = SongLocation
+        self.signals = SongListLoadSignals()
+        self._Cancelled = False
+
+        # Songs read, but waiting for a song before them - position -> song
+        self.Arrived = {}
+
+        # Position of the next song to go into the list
+        self.NextPosition = 0
+
+    #   Stop reading songs - this load has been overtaken by a newer one, or
+    #   the song list has been cleared.
+    def Cancel(self):
+        self._Cancelled = True
+
+    def IsCancelled(self):
+        return self._Cancelled
+
+    def IsFinished(self):
+        return self.NextPosition >= len(self.SongList)
+
+
+class SongListLoadTask(QtCore.QRunnable):
+
+    def __init__(self, ListLoad, Position):
+        super().__init__()
+        self.ListLoad = ListLoad
+        self.Position = Position
+
+    def run(self):
+
+        if self.ListLoad.IsCancelled():
+            return
+
+        SongFilename, SetSongOffset = self.ListLoad.SongList[self.Position]
+        logmessage("SongListLoadTask:Load:"+SongFilename)
+        NewSong = ReadListSong(SongFilename, SetSongOffset, self.ListLoad.SongLocation)
+
+        self.ListLoad.signals.loaded.emit(self.ListLoad, self.Position, NewSong)
+
+
 class OpenFile(QDialog):
 
     def __init__(self):
@@ -466,6 +1566,10 @@ class OpenFile(QDialog):
 
         self.setWindowTitle('Select song...')
         self.ui.lineEdit.setText('Start typing')
+        self.ui.lineEdit.setToolTip('Type part of a song\'s title or words - or search on its details,\n'
+                                    'e.g. author:wesley key:G theme:"christmas" (also title, ccli, aka,\n'
+                                    'key_line, tempo, time, hymn), or how its chords go, in any key,\n'
+                                    'e.g. prog:I-V-vi-IV or prog:G-D-Em-C')
 
         self.desktop = QApplication.desktop()
         self.screenRect = self.desktop.screenGeometry()
@@ -492,6 +1596,9 @@ class OpenFile(QDialog):
 
         self.ui.treeView.installEventFilter(self)
 
+        # All rows are the same height - saves the view measuring each one.
+        self.ui.treeView.setUniformRowHeights(True)
+
         #self.ui.treeView.setHeaderHidden(False)
 
         #treemodel=QStandardItemModel()
@@ -519,6 +1626,12 @@ class OpenFile(QDialog):
 
         #self.FilesArray={}
 
+        #   Search hit snippets (in the Match column) for the current search -
+        #   (file, search text) -> snippet HTML
+        self.SnippetText = ''
+        self.Snippets = {}
+        self.ui.treeView.setItemDelegateForColumn(3, SnippetDelegate(self.ui.treeView))
+
         self.ScanFolder(SongPreferences['SONGDIR']+"/")
 
         self.ui.treeView.clicked.connect(self.clickedTree)
@@ -539,26 +1652,79 @@ class OpenFile(QDialog):
         #self.ui.treeView.expandAll()
 
 
+        #   Searching is done in the background - wait for a pause in the typing
+        #   before starting, and drop any search that has been overtaken.
+        self.CurrentSearch = None
+        self.SearchTimer = QtCore.QTimer(self)
+        self.SearchTimer.setSingleShot(True)
+        self.SearchTimer.setInterval(SearchDelay)
+        self.SearchTimer.timeout.connect(self.StartSearch)
+
         self.ui.lineEdit.textChanged.connect(self.lineEditTextChanged)
 
+        #   Keep the tree up to date if songs change while we're open.
+        SongWatcher.changed.connect(self.LibraryChanged)
+
         self.ui.lineEdit.setFocus()
 
-    def ScanFolder(self,startpath):
-        file_list=[]
-        for root, subdirs, files in os.walk(startpath, followlinks=False):
+    def ScanFolder(self,startpath):
+        # The song index is kept up to date by the song directory watcher,
+        # so just use what it knows rather than walking the folder again.
+        # Folders are only filled in when they're expanded.
+        # The one tree is kept for as long as the dialog is open - searches
+        # just show / hide songs in it (through the filter).
+        self.ShowingAllSongs = True
+        self.setWindowTitle('Select song...')
+
+        self._fileSystemModel = FileSystemModelLite(None, startpath, self, SongSearchIndex.FileDetails, SongSearchIndex.DirectoryContents, file_snippet=self.SongSnippet)
+
+        self._filterModel = SongFilterProxyModel(self)
+        self._filterModel.setSourceModel(self._fileSystemModel)
 
-            for file in files:
+        self.ShowTree()
 
-                if ( ".xml" in file):
-                    file_list.append(root+os.path.sep+file)
+    #   Show the song tree (through the filter) - rather than a list of
+    #   closest matches
+    def ShowTree(self):
+        if self.ui.treeView.model() is not self._filterModel:
+            self.ui.treeView.setModel(self._filterModel)
+            self.ui.treeView.setColumnWidth(0,500)
 
-        self._fileSystemModel = FileSystemModelLite(file_list, startpath, self)
+    #   Show all the songs in the tree again
+    def ShowAllSongs(self):
+        self.ShowingAllSongs = True
+        self.setWindowTitle('Select song...')
+        self._filterModel.set_files(None)
+        self.ShowTree()
+        self.ui.treeView.viewport().update()
+
+    #   The Match column - where the search text is in a song's lyrics, from
+    #   the song index
+    def SongSnippet(self, FilePath):
+        if self.ShowingAllSongs:
+            return ""
+
+        SnippetHtml = self.Snippets.get(FilePath)
+        if SnippetHtml is None:
+            try:
+                Snippet = SongSearchIndex.Snippet(FilePath, self.SnippetText)
+            except:
+                Snippet = None
 
-        self.ui.treeView.setModel(self._fileSystemModel)
+            if Snippet is None:
+                SnippetHtml = ""
+            else:
+                Before, Hit, After = Snippet
+                SnippetHtml = html.escape(Before) + "<b>" + html.escape(Hit) + "</b>" + html.escape(After)
+            self.Snippets[FilePath] = SnippetHtml
 
-        self.ui.treeView.setColumnWidth(0,999)
+        return SnippetHtml
 
-        self.ui.treeView.expandAll()
+    #   Full path of the song at a row of the tree - None for a folder
+    def IndexFilePath(self, Index):
+        if Index.isValid() and Index.model() is self._filterModel:
+            Index = self._filterModel.mapToSource(Index)
+        return FileSystemModelLite.fullpath(self, Index)
 
 
     def ScanFolder2(self,startpath):
@@ -622,22 +1788,99 @@ class OpenFile(QDialog):
 
     def lineEditTextChanged(self):
         #print("OpenFile:lineEdit TextChanged")
+
+        # Whatever is currently being searched for is now out of date.
+        self.CancelSearch()
+
+        # (Re)start the timer - we search once the typing pauses.
+        self.SearchTimer.start()
+
+    def CancelSearch(self):
+        if self.CurrentSearch is not None:
+            self.CurrentSearch.Cancel()
+            self.CurrentSearch = None
+
+    def StartSearch(self):
         newvalue=self.ui.lineEdit.text()
 
-        startpath=SongPreferences['SONGDIR']+"/"
+        logmessage("OpenFile:StartSearch:"+newvalue)
+
+        self.CancelSearch()
+
+        if len(newvalue.strip()) == 0:
+            # Nothing to search for - show the whole song folder.
+            self.ShowAllSongs()
+            return
+
+        # Ask the song index - no need to go back to the song files.
+        self.CurrentSearch = SongSearchTask(newvalue)
+        self.CurrentSearch.signals.results.connect(self.SearchResults)
+        QtCore.QThreadPool.globalInstance().start(self.CurrentSearch)
+
+    #   A batch of search results has arrived from the background search
+    def SearchResults(self, Search, file_list, FirstBatch, More):
+
+        # Ignore anything from a search that has since been replaced.
+        if Search is not self.CurrentSearch:
+            return
+
+        # Say if there are more results on the way
+        if Search.Ranked:
+            self.setWindowTitle('Select song... (closest matches to "'+Search.SearchText.strip()+'")')
+        elif More > 0:
+            self.setWindowTitle('Select song... ('+str(More)+' more…)')
+        elif More == -1:
+            self.setWindowTitle('Select song... (more…)')
+        else:
+            self.setWindowTitle('Select song...')
+
+        if FirstBatch:
+            self.ShowingAllSongs = len(Search.SearchText.strip()) == 0
+            self.SnippetText = Search.SearchText
+            self.Snippets = {}
+
+            startpath=SongPreferences['SONGDIR']+"/"
+
+            # Closest matches are shown best first, rather than folder by folder,
+            # in a list of their own.
+            if Search.Ranked:
+                self._rankedModel = FileSystemModelLite(file_list, startpath, self, SongSearchIndex.FileDetails, flat=True, file_snippet=self.SongSnippet)
+                self.ui.treeView.setModel(self._rankedModel)
+                self.ui.treeView.setColumnWidth(0,500)
+            else:
+                self._filterModel.set_files(file_list)
+                self.ShowTree()
+                self.ui.treeView.viewport().update()
+        elif Search.Ranked:
+            self._rankedModel.add_files(file_list)
+        else:
+            self._filterModel.add_files(file_list)
+
+    #   Songs have been added / changed / removed in the song directory
+    def LibraryChanged(self, Added, Updated, Removed):
 
-        file_list=[]
-        for root, subdirs, files in os.walk(startpath, followlinks=False):
+        logmessage("OpenFile:LibraryChanged")
 
-            for file in files:
+        self.Snippets = {}
 
-                if ( ".xml" in file):
-                    if (newvalue.upper() in file.upper() or grep(startpath+file,newvalue) ): 
-                        file_list.append(root+os.path.sep+file)
+        # The tree has the whole song directory - just apply the changes.
+        self._fileSystemModel.remove_files(Removed)
+        self._fileSystemModel.update_files(Updated)
+        self._fileSystemModel.add_files(Added)
 
-        self._fileSystemModel = FileSystemModelLite(file_list, startpath, self)
+        if not self.ShowingAllSongs:
+            # Showing search results - which may now be different, search again.
+            self.StartSearch()
 
-        self.ui.treeView.setModel(self._fileSystemModel)
+    #   Dialog is closing - no point carrying on with any search.
+    def done(self, result):
+        self.SearchTimer.stop()
+        self.CancelSearch()
+        try:
+            SongWatcher.changed.disconnect(self.LibraryChanged)
+        except TypeError:
+            pass
+        super(OpenFile, self).done(result)
 
         
     def eventFilter(self, obj, event):
@@ -650,25 +1893,44 @@ class OpenFile(QDialog):
                 if event.key() == QtCore.Qt.Key_Up:
                     logmessage("OpenFile:KeyUp")
                     print("Up")
-                    SelectedFile=FileSystemModelLite.fullpath(self,self.ui.treeView.indexAbove(self.ui.treeView.selectedIndexes()[0]))
+                    SelectedIndex=self.ui.treeView.indexAbove(self.ui.treeView.selectedIndexes()[0])
+                    SelectedFile=self.IndexFilePath(SelectedIndex)
                     #SelectedFile=self.model.filePath(self.ui.treeView.indexAbove(self.ui.treeView.selectedIndexes()[0]))
                     self.SelectFile(SelectedFile)
+                    self.PrefetchPreviews(SelectedIndex)
                 if event.key() == QtCore.Qt.Key_Down:
                     logmessage("OpenFile:KeyDown")
                     print("Down")
-                    SelectedFile=FileSystemModelLite.fullpath(self,self.ui.treeView.indexBelow(self.ui.treeView.selectedIndexes()[0]))
+                    SelectedIndex=self.ui.treeView.indexBelow(self.ui.treeView.selectedIndexes()[0])
+                    SelectedFile=self.IndexFilePath(SelectedIndex)
                     #SelectedFile=self.model.filePath(self.ui.treeView.indexBelow(self.ui.treeView.selectedIndexes()[0]))
                     self.SelectFile(SelectedFile)
+                    self.PrefetchPreviews(SelectedIndex)
                 if event.key() == QtCore.Qt.Key_Return:
                     logmessage("OpenFile:KeyEnter")
                     print("enter pressed")
-                    file_path=FileSystemModelLite.fullpath(self,self.ui.treeView.currentIndex())
+                    file_path=self.IndexFilePath(self.ui.treeView.currentIndex())
+                    if not file_path:
+                        return super(OpenFile, self).eventFilter(obj, event)
                     short_path=file_path.replace(SongPreferences['SONGDIR']+"/",'')
                     self.ui.lineEdit.setText(short_path)
                     self.accept()
 
         return super(OpenFile, self).eventFilter(obj, event)
 
+    #   Get the previews of the songs either side of the highlighted one ready,
+    #   in the background - they're where the highlight will go next.
+    def PrefetchPreviews(self, Index):
+
+        FilePaths = []
+        for NeighbourIndex in (self.ui.treeView.indexBelow(Index), self.ui.treeView.indexAbove(Index)):
+            FilePath = self.IndexFilePath(NeighbourIndex)
+            if FilePath:
+                FilePaths.append(FilePath)
+
+        if len(FilePaths) > 0:
+            QtCore.QThreadPool.globalInstance().start(SongPreviewTask(FilePaths))
+
 
     def DoubleClickedTree(self, signal):
 
@@ -683,7 +1945,11 @@ class OpenFile(QDialog):
 
         file_path=''
         # file_path=self.ui.treeView.model().filePath(signal)
-        file_path=FileSystemModelLite.fullpath(self,self.ui.treeView.currentIndex())
+        file_path=self.IndexFilePath(self.ui.treeView.currentIndex())
+
+        # Double clicking a folder just opens / closes it.
+        if not file_path:
+            return
 
         short_path=file_path.replace(SongPreferences['SONGDIR']+"/",'')
 
@@ -703,9 +1969,10 @@ class OpenFile(QDialog):
         file_path=''
         # file_path=self.ui.treeView.model().filePath(signal)
         #file_path=FileSystemModelLite.data(self,self.ui.treeView.currentIndex())
-        file_path=FileSystemModelLite.fullpath(self,self.ui.treeView.currentIndex())
+        file_path=self.IndexFilePath(self.ui.treeView.currentIndex())
 
         self.SelectFile(file_path)
+        self.PrefetchPreviews(self.ui.treeView.currentIndex())
         # self.SelectFile(SongPreferences['SONGDIR']+"/"+file_path)
 
 
@@ -718,6 +1985,10 @@ class OpenFile(QDialog):
 
         logmessage("OpenFile:SelectFile")
 
+        # Nothing to preview for a folder
+        if not FilePath:
+            return
+
         try:
 
             short_path=FilePath.replace(SongPreferences['SONGDIR']+"/",'')
@@ -725,133 +1996,7 @@ class OpenFile(QDialog):
             #self.ui.lineEdit.setText(short_path)
             print(FilePath)
 
-            print("reading file...")
-
-            with open(FilePath, 'r') as myfile:
-                    LoadSongData = myfile.read()
-
-            print("getting data")
-
-            Datatree = ET.ElementTree(ET.fromstring(LoadSongData))
-
-            #   Interpret the XML into the main data structure
-            print("getting lyrics")
-
-            LoadSongLyrics = list(Datatree.iter('lyrics'))
-
-            SongTextHeader = """<html>
-                <head>
-                <style>
-                body { 
-                    background-color: #FFFFFF;
-                    padding-top : 1em;
-                    font-family: Arial, Helvetica, sans-serif;
-                    font-size: 30px; margin: 0px; 
-                    } 
-                p {
-                  padding-top : 1em; 
-                  font-family: Arial, Helvetica, sans-serif;  
-                  font-size: 30px; margin: 0px; 
-                }
-                p.heading {
-                  padding-top : 0; 
-                  font-family: Arial, Helvetica, sans-serif;
-                  color: red;
-                  margin: 0px;
-                  font-size: 30px;
-                }
-                p.nochords {
-                  padding-top : 0;  
-                  font-family: Arial, Helvetica, sans-serif; 
-                  margin: 0px;
-                  font-size: 30px; 
-                }
-                p.onlychords {
-                  padding-top : 0;  
-                  font-family: Arial, Helvetica, sans-serif; 
-                  margin: 0px;
-                  font-weight: bold;
-                  font-style: italic;
-                  color: blue;
-                  font-size: 30px; 
-                }
-
-                em {
-                    font-style: normal;
-                }
-
-                em[data-chord]:before {
-                    position: relative;
-                    top: -1em;
-                    display: inline-block;
-                    content: attr(data-chord);
-                    width: 0;
-                    font-weight: bold;
-                    font-style: italic;
-                    color: blue;
-                    font-family: Arial, Helvetica, sans-serif;
-                    speak: literal-punctuation;
-                    pause: 1s;
-                    /* pause between chord and text */
-                }
-
-                table {
-                    padding: 0;
-                    border: 1px solid black;
-                }
-                tr {
-                    padding: 0;
-                }
-                td {
-                    vertical-align: top;
-                }
-
-                </style>
-                </head>
-                <body>"""
-
-            #SongTextHeader = "<html><head>"
-            #SongTextHeader = SongTextHeader + "<style>"
-            #SongTextHeader = SongTextHeader + "body { background-color: #555555;font-size: 32px;} "
-
-            #SongTextHeader = SongTextHeader + "p { font-size: 25px; margin: 0px;} "
-            #SongTextHeader = SongTextHeader + "table { width: 100%; border: 2px solid black; padding 20px;} "
-            #SongTextHeader = SongTextHeader + "tr { width: 100%; border: 2px solid black; padding 20px;} "
-            #SongTextHeader = SongTextHeader + "td { border: 2px solid black; padding 5px; background-color: #eeeeee;} "
-            #SongTextHeader = SongTextHeader + "</style>"
-            #SongTextHeader = SongTextHeader + "</head>"
-            #SongTextHeader = SongTextHeader + "<body>"
-
-
-            OutputSongText = "<table><tr><td style='padding:10px'>"
-
-            LoadSongText=LoadSongLyrics[0].text
-
-            KeyData = Datatree.find('key')
-
-            if KeyData is None:
-                SongKeyValue = 'C'
-            else:
-                SongKey = KeyData.text
-                if SongKey == '':
-                    SongKeyValue = 'C'
-                else:
-                    SongKeyValue = SongKey
-
-            OutputText=Derive_Song_Text( "YES", LoadSongText, SongKeyValue, 0,SongPreferences['DEFAULTPAGESIZE'],'L')
-
-            #LoadSongText = LoadSongText.replace('\n.','<br> ').replace('\n ','</br> ').replace(' ','&nbsp;')
-            # space in the TD STYLE has been mucked up by the global replace - undo it.
-            #LoadSongText = LoadSongText.replace('<td&nbsp;style','<td style')
-            #LoadSongText = LoadSongText.replace('[','<b><font color=''red''>[').replace(']',']</font></b>')
-
-            SongLyricsDisplay = OutputSongText + OutputText
-
-            SongLyricsDisplay = SongTextHeader + SongLyricsDisplay + '</td></tr></table></body></html>'
-
-            #print("SONGTEXT---------------------------------------------------------")
-            #print(SongLyricsDisplay)
-            #print("SONGTEXT---------------------------------------------------------")
+            SongLyricsDisplay = SongPreviews.Preview(FilePath)
 
             # self.ui.textBrowser.setText(SongLyricsDisplay)
             self.ui.textBrowser.setHtml(SongLyricsDisplay)
@@ -875,7 +2020,7 @@ class EditWindow(QDialog):
         global SongKeys_Alt
         global SongPreferences
 
-        LocalSongText=SongData[1]
+        LocalSongText=SongData.Lyrics
         print("LocalSongText")
         print(LocalSongText)
 
@@ -886,12 +2031,12 @@ class EditWindow(QDialog):
         self.ui.setupUi(self)
 
         #   Copy variable values for single song into on-screen fields.
-        self.FullSongPath=SongData[0]
-        self.ui.FName.setText(SongData[4])
+        self.FullSongPath=SongData.FilePath
+        self.ui.FName.setText(SongData.FileName)
 
-        SongText=SongData[1]
-        SongKey=SongData[2]
-        SongOffset = SongData[3]
+        SongText=SongData.Lyrics
+        SongKey=SongData.Key
+        SongOffset = SongData.Offset
         logmessage("EditWindow:Init:SongText")
         logmessage(LocalSongText)
 
@@ -904,7 +2049,7 @@ class EditWindow(QDialog):
             self.ui.SongKey.setCurrentText(SongKey)
         else:
             logmessage("EditWindow:Init:DontUseOriginalKey")
-            ModifiedSongText=Derive_Song_Text( "NO", LocalSongText, SongKey, SongOffset,SongPreferences['DEFAULTPAGESIZE'],'L')
+            ModifiedSongText=Derive_Song_Text( "NO", SongData.Sheet, SongKey, SongOffset,SongPreferences['DEFAULTPAGESIZE'],'L')
             #ModifiedSongText.replace("/n","<br>")
             ActualSongKey = Derive_Actual_Song_Key(SongKey, SongOffset)
             logmessage("EditWindow:Init:ModifiedSongText")
@@ -913,10 +2058,10 @@ class EditWindow(QDialog):
             self.ui.EditingSongText.setPlainText(ModifiedSongText)
             self.ui.SongKey.setCurrentText(SongKeys_Alt[ActualSongKey])
 
-        SongFontSize=SongData[5]
-        SongFontSize_Portrait=SongData[6]
-        SongPageSize=SongData[7]
-        SongPageSize_Portrait=SongData[8]
+        SongFontSize=SongData.FontSize
+        SongFontSize_Portrait=SongData.FontSize_Portrait
+        SongPageSize=SongData.PageSize
+        SongPageSize_Portrait=SongData.PageSize_Portrait
         self.ui.DefaultFontSize.setCurrentText(SongFontSize)
         self.ui.DefaultFontSize_Portrait.setCurrentText(SongFontSize_Portrait)
         self.ui.PageSize.setCurrentText(SongPageSize)
@@ -1125,72 +2270,80 @@ def ConvertChord(ChordString, Offset):
 
 
 
-#   Process an individual line of music chords - i.e. must begin with '.'
+#   Process an individual line of music chords - a chord line from a
+#   SongSheet.  Returns the line with each chord converted, and where each of
+#   its 'words' (see SongSheet) now is in it - [(start, end)].
 
-def ProcessMusicLine(InputText,SongOffset):
+def ProcessMusicLine(MusicLine,SongOffset):
 
     logmessage("ProcessMusicLine")
 
-    #   Line begins with '.' - it contains chords - need to work through letter by letter
+    #   Convert each chord, and keep whatever is between them - noting how
+    #   far along the rest of the line has moved after each one (a chord can
+    #   change length, e.g. 'C' -> 'C#').
 
+    InputText = MusicLine.Text
     Ptr3 = 0  # pointer into the text line
-    OutputLine = ''  # converted line
+    OutputParts = []  # converted line
+    Shift = 0
+    ChordShifts = []
 
-    # Create a temp line with extra spaces at the end - so we don't read past the end of line.
-    TempLine = InputText + "   "
+    for ChordStart, ChordEnd, NewString in MusicLine.Chords:
 
-    while Ptr3 < len(InputText):
+        # NewString contains the chord - convert it...
+        UpdatedChord = ConvertChord(NewString, SongOffset)
 
-        NewValue = ord(InputText[Ptr3])
+        OutputParts.append(InputText[Ptr3:ChordStart])
+        OutputParts.append(UpdatedChord)
+        Ptr3 = ChordEnd
 
-        if 65 <= NewValue <= 71:
-            # This is a key value
+        Shift = Shift + len(UpdatedChord) - (ChordEnd - ChordStart)
+        ChordShifts.append((ChordEnd, Shift))
 
-            # Get the chord
-            NewString = InputText[Ptr3]
+    OutputParts.append(InputText[Ptr3:])
+    OutputLine = ''.join(OutputParts)
 
-            # Check: is this a minor or sharp?
-            if (TempLine[Ptr3 + 1] == 'M') or (TempLine[Ptr3 + 1] == '#') or (TempLine[Ptr3 + 1] == 'b'):
-                NewString = NewString + InputText[Ptr3 + 1]
-                Ptr3 = Ptr3 + 1
-                # Check: is this a minor or sharp?
-                if (TempLine[Ptr3 + 1] == 'M') or (TempLine[Ptr3 + 1] == '#') or (TempLine[Ptr3 + 1] == 'b'):
-                    NewString = NewString + InputText[Ptr3 + 1]
-                    Ptr3 = Ptr3 + 1
-
-            # NewString now contains the chord - convert it...
-            UpdatedChord = ConvertChord(NewString, SongOffset)
-
-            OutputLine = OutputLine + UpdatedChord
-
-        else:
-            OutputLine = OutputLine + InputText[Ptr3]
-
-        Ptr3 = Ptr3 + 1
+    #   The chords are all inside the words - so a word moves by as much as
+    #   the chords before it have changed length.
+    Words = []
+    ChordNo = 0
+    Shift = 0
+    for WordStart, WordEnd in MusicLine.Words:
+        StartShift = Shift
+        while ChordNo < len(ChordShifts) and ChordShifts[ChordNo][0] <= WordEnd:
+            Shift = ChordShifts[ChordNo][1]
+            ChordNo = ChordNo + 1
+        Words.append((WordStart + StartShift, WordEnd + Shift))
 
     logmessage("ProcessMusicLine:Output:"+OutputLine)
-    return OutputLine
+    return OutputLine, Words
+
 
 
+#   How much of a chord line, and its lyric line, is used when they're merged
+#   for display
+MergeLineWidth = 490
 
+#   Spaces outside html tags - see Derive_Song_Text_HTML
+HtmlSpacePattern = re.compile(r'(<[^>]*>?)| ')
 
 
-#   Given the song text, and offset data, work out the updated song text with key change
+#   Given the song (as a SongSheet), and offset data, work out the updated song text with key change
 #   also, have the option to output in HTML format or non HTML
 #   HTML format is used to display a song on-screen, but non-HTML is used
 #   if we want to edit, but use the transposed key (as we need to use plain text)
 
-def Derive_Song_Text( HTML_Needed, SongText, SongKey, SongOffset, PageSize, Orientation):
+def Derive_Song_Text( HTML_Needed, SongSheet, SongKey, SongOffset, PageSize, Orientation):
     if (HTML_Needed=="YES"):
-        ReturnString=Derive_Song_Text_HTML( HTML_Needed, SongText, SongKey, SongOffset, PageSize, Orientation)
+        ReturnString=Derive_Song_Text_HTML( HTML_Needed, SongSheet, SongKey, SongOffset, PageSize, Orientation)
     else:
-        ReturnString=Derive_Song_Text_Plain( HTML_Needed, SongText, SongKey, SongOffset, PageSize, Orientation)
+        ReturnString=Derive_Song_Text_Plain( HTML_Needed, SongSheet, SongKey, SongOffset, PageSize, Orientation)
 
     return ReturnString
 
 
 
-def Derive_Song_Text_Plain( HTML_Needed, SongText, SongKey, SongOffset, PageSize, Orientation):
+def Derive_Song_Text_Plain( HTML_Needed, SongSheet, SongKey, SongOffset, PageSize, Orientation):
     global SongDataList
     global SongKeys
     global SongKeys_Alt
@@ -1200,51 +2353,28 @@ def Derive_Song_Text_Plain( HTML_Needed, SongText, SongKey, SongOffset, PageSize
 
         logmessage("Derive_Song_Text_Plain")
 
-        ReturnString=""
-
-        #   SongText is in 'SongText' variable - chords are defined with lines beginning with '.'
-        #   First, split the string on newlines.
-
-        SongTextLines = SongText.split('\n')
-
-        #   Now, go through the lines...
-
-        Ptr2 = 0
-
-        SongTextLineNumber = 0
-        MusicChordsLine=""
-
-        # Work through all the lines of text
-        while Ptr2 < (len(SongTextLines)):
-
-            # Put the line we're working with into a working variable
-            TextLine = SongTextLines[Ptr2]
-
-            print( SongTextLines[Ptr2])
-
-            # If its not a blank line
-            if len(TextLine) > 0:
+        #   The lines are as they are in the song, apart from the chord lines,
+        #   which are transposed.
 
-                # is it a command line?
-                if TextLine[0] == '.':
+        OutputLines = []
 
-                    OutputLine=ProcessMusicLine(TextLine,SongOffset)
+        # Work through all the lines of text, a section at a time
+        for Section in SongSheet.Sections:
+            for SongLine in Section:
 
+                if SongLine.Kind == ChordLine:
+                    OutputLines.append(ProcessMusicLine(SongLine,SongOffset)[0])
+                    if SongLine.Lyrics is not None:
+                        OutputLines.append(SongLine.Lyrics.Text)
                 else:
-                    OutputLine = TextLine
-            else:
-                # its a blank line
-                OutputLine = ''
-
-            TextLine = OutputLine
-
-            if (ReturnString==""):
-                ReturnString = TextLine
-            else:
-                ReturnString = ReturnString +"\n"+ TextLine
+                    OutputLines.append(SongLine.Text)
 
+        # (any blank lines at the start are dropped)
+        Ptr2 = 0
+        while Ptr2 < len(OutputLines) and len(OutputLines[Ptr2]) == 0:
             Ptr2 = Ptr2 + 1
-            SongTextLineNumber = SongTextLineNumber + 1
+
+        ReturnString = "\n".join(OutputLines[Ptr2:])
 
         logmessage("Derive_Song_Text_Plain:Return:")
         logmessage(ReturnString)
@@ -1261,185 +2391,87 @@ def Derive_Song_Text_Plain( HTML_Needed, SongText, SongKey, SongOffset, PageSize
         logmessage(outstring)
 
 
-def Derive_Song_Text_HTML( HTML_Needed, SongText, SongKey, SongOffset, PageSize, Orientation):
-    global SongDataList
-    global SongKeys
-    global SongKeys_Alt
-    global SongPreferences
-
-    try:
-
-        logmessage("Derive_Song_Text")
-
-        ReturnString=""
-
-        #   SongText is in 'SongText' variable - chords are defined with lines beginning with '.'
-        #   First, split the string on newlines.
-
-        SongTextLinesRaw = SongText.split('\n')
-        SongTextLines=[]
-
-        # Pre-process - we'll go through the SongTextLinesRaw array, and merge 
-        # chord lines with the lyric lines
-
-        OuputLineNumber=0
-        Ptr2=0
-
-        while (Ptr2 < len(SongTextLinesRaw)):
-
-            TextLine = SongTextLinesRaw[Ptr2]+" "
-            if (Ptr2+1 < len(SongTextLinesRaw)):
-                TextLine2= SongTextLinesRaw[Ptr2+1]
-            else:
-                TextLine2=""
-
-            # is this a music line and there's a lyric line next 
-            if len(TextLine2)>0 :
-                if ( TextLine[0] == "." and TextLine2[0] == " " ):
-                    # ok we've got a chord line followed by a lyric line
-
-                    # Before we merge - we need to do any transposing...
-                    TextLine=ProcessMusicLine(TextLine,SongOffset)
-
-                    # Now, merge the two lines:
-                    # e.g.
-                    # .    G      Asus
-                    #   Hello there how are you
-                    # becomes
-                    #   Hel<em>G</e>lo ther<em>Asus</em>e how are you
-
-                    # we'll need to work right to left to preserve the positioning in both strings.
-
-                    # Create string 1 and string2, each same length, padded with spaces.
-                    String1=TextLine + ( " " *500 )
-                    String2=TextLine2 + ( " " *500 )
-
-                    # Make the same length
-                    String1=String1[:490]
-                    String2=String2[:490]
-
-                    # now work backward through string 1 (chords), locating text
-
-                    Ptr3=len(String1)-1
+#   A line of a song (from a SongSheet) as HTML, for Derive_Song_Text_HTML
+def SongLineHtml(SongLine, SongOffset, Orientation):
 
-                    while (Ptr3 > 0):
-                        
-                        if ( String1[Ptr3] != " "):
-                            # got a non-space - i.e. a chord - however, it can be multiple characters
-                            # start to work backward from here...
-                            Ptr4=Ptr3
-                            while ( String1 [Ptr4] != " " and Ptr4 > 0):
-                                Ptr4=Ptr4-1
+    if SongLine.Kind == ChordLine:
 
-                            # Ptr3 is the end of the string, Ptr4 is the start
-                            # also Ptr4 is the location in String2 to perform the merge
+        # Before we merge - we need to do any transposing...
+        ChordText, ChordWords = ProcessMusicLine(SongLine,SongOffset)
 
-                            Chord=String1[Ptr4+1:Ptr3+1]
+        if SongLine.Lyrics is not None:
+            # ok we've got a chord line followed by a lyric line
 
-                            # Now do the insert into String2
+            # Now, merge the two lines:
+            # e.g.
+            # .    G      Asus
+            #   Hello there how are you
+            # becomes
+            #   Hel<em>G</e>lo ther<em>Asus</em>e how are you
 
-                            String2=String2[:Ptr4+1]+"<em data-chord='"+Chord+"'></em>"+String2[Ptr4+1:]
+            # each chord goes in the lyric line where its word starts in the chord line
+            LyricText = (SongLine.Lyrics.Text + ( " " * MergeLineWidth ))[:MergeLineWidth]
 
-                            # Now carry on from Ptr4
-
-                            Ptr3=Ptr4
+            MergedParts = []
+            Ptr3 = 0
+            for WordStart, WordEnd in ChordWords:
+                if WordStart >= MergeLineWidth:
+                    break
+                Chord = ChordText[WordStart:min(WordEnd, MergeLineWidth)]
+                MergedParts.append(LyricText[Ptr3:WordStart])
+                MergedParts.append("<em data-chord='"+Chord+"'></em>")
+                Ptr3 = WordStart
+            MergedParts.append(LyricText[Ptr3:])
 
-                        Ptr3 = Ptr3 -1
+            TextLine="<p>"+''.join(MergedParts).strip()+"</p>"
 
-                    # Finish - String2 now contains the merged lines
-                    TextLine="<p>"+String2.strip()+"</p>"
-                    # As we've dealt with the next line in the input text, bump that pointer too..
-                    Ptr2 = Ptr2 +1
+        else:
+            # ok - we've got a chord line, but the next line isn't for merging
+            # so make it a 'p.onlychords' line
+            TextLine="<p class='onlychords'>"+ChordText[1:]+" </p>"
 
-                else:
-                    if ( TextLine[0] == "." ):
-                        # ok - we've got a chord line, but the next line isn't for merging
-                        # so make it a 'p.onlychords' line
-                        # do any transposing first..
-                        TextLine=ProcessMusicLine(TextLine,SongOffset)
-                        TextLine="<p class='onlychords'>"+TextLine[1:]+"</p>"
-                    else:
-                        if ( len(TextLine.strip()) == 0):
-                            # its a blank line
-                            TextLine="<br>"
-                        else:
-                            if ( TextLine.strip()[0] == "["):
-                                # its a command
-                                # if (TextLine.strip()=="[===]") or (TextLine.strip()=="[=L=]" and Orientation=='L') or (TextLine.strip()=="[=P=]" and Orientation=='P'):
-                                if (TextLine.strip()=="[===]") or TextLine.strip()=="[=L=]"  or TextLine.strip()=="[=P=]":
-                                    # Page break requested - check if we're landscape or portrait:
-                                    if (TextLine.strip()=="[===]") or (TextLine.strip()=="[=L=]" and Orientation=='L') or (TextLine.strip()=="[=P=]" and Orientation=='P'):
-                                        TextLine = "</td><td>"
-                                    else:
-                                        TextLine =""
-                                else:
-                                    TextLine = "<p class='heading'>"+TextLine+"</p>"
-                            else:
-                                # so this is a basic line - no merging - use p.nochords
+    elif SongLine.Kind == BlankLine:
+        TextLine="<br>"
 
-                                TextLine="<p class='nochords'>"+TextLine[1:]+"</p>"
-            else:
-                # Ok - we've got a line, but with nothing following
-                if ( TextLine[0] == "." ):
-                    # ok - we've got a chord line, but the next line isn't for merging
-                    # so make it a 'p.onlychords' line
-                    # do any transposing first..
-                    TextLine=ProcessMusicLine(TextLine,SongOffset)
-                    TextLine="<p class='onlychords'>"+TextLine[1:]+"</p>"
-                else:
-                    if ( len(TextLine.strip()) == 0):
-                        # its a blank line
-                        TextLine="<br>"
-                    else:
-                        if ( TextLine.strip()[0] == "["):
-                            # its a command
-                            if TextLine.strip()=="[===]" or TextLine.strip()=="[=L=]" or TextLine.strip()=="[=P=]":
-                                # Page break requested
-                                if (TextLine.strip()=="[===]") or (TextLine.strip()=="[=L=]" and Orientation=='L') or (TextLine.strip()=="[=P=]" and Orientation=='P'):
-                                    TextLine = "</td><td>"
-                                else:
-                                    TextLine =""
-                            else:
-                                TextLine = "<p class='heading'>"+TextLine+"</p>"
-                        else:
-                            # so this is a basic line - no merging - use p.nochords
+    elif SongLine.Kind == BreakLine:
+        # Page break requested - check if we're landscape or portrait:
+        if SongLine.Orientation == '' or SongLine.Orientation == Orientation:
+            TextLine = "</td><td>"
+        else:
+            TextLine = ""
 
-                            TextLine="<p class='nochords'>"+TextLine[1:]+"</p>"                    
+    elif SongLine.Kind == HeadingLine:
+        TextLine = "<p class='heading'>"+SongLine.Text+" </p>"
 
-            # Last stage
-            # Its possible that there's spaces in the text, however, we can't just replace
-            # all spaces with &nbsp; 's - it'll break html tags - we'll have to work our way through it.
+    else:
+        # so this is a basic line - no merging - use p.nochords
+        TextLine="<p class='nochords'>"+SongLine.Text[1:]+" </p>"
 
-            TextLine=TextLine.strip()
-            OutputText=""
+    # Last stage
+    # Its possible that there's spaces in the text, however, we can't just replace
+    # all spaces with &nbsp; 's - it'll break html tags - so just those outside them.
 
-            OutPtr=0
-            InsideTag=0
-            while ( OutPtr < len(TextLine)):
-                if (TextLine[OutPtr]=="<"):
-                    InsideTag=1
-                if (TextLine[OutPtr]==">"):
-                    InsideTag=0
+    return HtmlSpacePattern.sub(lambda Match: Match.group(1) or "&nbsp;", TextLine.strip())
 
-                if (TextLine[OutPtr]==" " and InsideTag==0):
-                    OutputText=OutputText+"&nbsp;"
-                else:
-                    OutputText=OutputText+TextLine[OutPtr]
 
-                OutPtr=OutPtr+1
+def Derive_Song_Text_HTML( HTML_Needed, SongSheet, SongKey, SongOffset, PageSize, Orientation):
+    global SongDataList
+    global SongKeys
+    global SongKeys_Alt
+    global SongPreferences
 
+    try:
 
-            # Add the finished lines to the output array...
-            SongTextLines.append(OutputText)
-            ReturnString=ReturnString+OutputText
-            OuputLineNumber=OuputLineNumber+1
+        logmessage("Derive_Song_Text")
 
-            if (OuputLineNumber>int(PageSize)):
-                SongTextLines.append("</td><td>")
+        OutputLines = []
 
-            Ptr2=Ptr2+1
+        # Work through all the lines, a section at a time
+        for Section in SongSheet.Sections:
+            for SongLine in Section:
+                OutputLines.append(SongLineHtml(SongLine, SongOffset, Orientation))
 
-        #   Now, go through the lines...
+        ReturnString=''.join(OutputLines)
 
         logmessage("Derive_Song_Text_HTML:Return:")
         logmessage(ReturnString)
@@ -1548,6 +2580,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         global SongKeys
         global SongKeys_Alt
         global SongPreferences
+        global SongSearchIndex
+        global SongWatcher
+        global SongFileCache
 
         logmessage("MainWindow:Init")
 
@@ -1746,6 +2781,23 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         print("Songpreferences in place:")
         print(SongPreferences)
 
+        #   Song search index - kept next to the preferences file - and the
+        #   watcher that keeps it up to date.
+        SongSearchIndex = SongIndex(os.path.join(self.HomeDirectory, SongIndexFileName))
+        SongWatcher = SongLibraryWatcher(self)
+        SongWatcher.progress.connect(self.SongIndexProgress)
+        QApplication.instance().aboutToQuit.connect(SongWatcher.Close)
+
+        #   Songs read for the song list - also kept next to the preferences file
+        SongFileCache = SongCache(os.path.join(self.HomeDirectory, SongCacheFileName))
+        QApplication.instance().aboutToQuit.connect(SongFileCache.Save)
+
+        #   Song list being loaded (see LoadSongList) - and the threads its
+        #   songs are read on
+        self.CurrentListLoad = None
+        self.SongListLoadPool = QtCore.QThreadPool(self)
+        self.SongListLoadPool.setMaxThreadCount(SongListLoadThreads)
+
         self.InterpretPreferences()
 
         #   Wire up the buttons
@@ -1857,6 +2909,17 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         self.SongLocation = SongPreferences['SONGDIR']
 
+        # Watch the (possibly new) song directory
+        SongWatcher.SetSongDirectory(SongPreferences['SONGDIR']+"/")
+
+    #   Show how the song index is getting on while it's being brought up to date
+    def SongIndexProgress(self, SongsRead, SongsToRead):
+
+        if SongsRead < SongsToRead:
+            self.statusBar.showMessage("Indexing songs: "+str(SongsRead)+" of "+str(SongsToRead))
+        else:
+            self.statusBar.clearMessage()
+
     #   General routine to ask a query on screen
     def AskQuery(self,QueryTitle,QueryText):
 
@@ -2024,6 +3087,11 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         logmessage("MainWindow:SaveSongList")
 
+        #   If a song list is still loading, it's saved when it's finished -
+        #   saving now would write out just part of it.
+        if self.CurrentListLoad is not None:
+            return
+
         #   we'll create a special data structure to hold the song list, and then we'll do a JSON.DUMP 
         #   of that structure.
 
@@ -2039,10 +3107,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             #   get the song title from the list...
             SongTitle=self.SongListModel.index(P1, 0).data()
 
-            SongPtr=self.LocateSong(SongTitle)
+            ListSong=self.LocateSong(SongTitle)
 
-            SongFile=SongDataList[SongPtr][0]
-            SongKey=SongDataList[SongPtr][3]
+            SongFile=ListSong.FilePath
+            SongKey=ListSong.Offset
 
             logmessage("MainWindow:SaveSongList:Construct:"+SongFile)
 
@@ -2083,7 +3151,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         try:
             SaveFileName = self.SaveFileName
             with open(SaveFileName,'w') as f:
-                json.dump(SongDataList,f)
+                json.dump([[ListSong.FilePath, ListSong.Lyrics, ListSong.Key, ListSong.Offset, ListSong.FileName,
+                            ListSong.FontSize, ListSong.FontSize_Portrait, ListSong.PageSize, ListSong.PageSize_Portrait]
+                           for ListSong in SongDataList], f)
         except:
             self.OkMessage('Save error','Unable to save song list',sys.exc_info()[0])
 
@@ -2108,9 +3178,11 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         if fileName and len(fileName[0]) > 0:
 
-            # When loading, clear the previous song list.
+            # When loading, clear the previous song list (and stop loading
+            # the previous one, if it's still going).
+            self.CancelSongListLoad()
             self.SongListModel.clear()
-            SongDataList = []
+            SongDataList.Clear()
 
             #   If Windows, change the separator
             FName = fileName[0]
@@ -2125,19 +3197,64 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             with open(FName) as f:
                 SaveSongDataList = json.load(f)
 
+            # Read the songs in the background - they're put in the list
+            # (and the first one displayed) by SongListLoaded as they arrive.
+            self.CurrentListLoad = SongListLoad([(SongFileName, SongKeyOffset) for SongFileName, SongKeyOffset in SaveSongDataList], self.SongLocation)
+            self.CurrentListLoad.signals.loaded.connect(self.SongListLoaded)
+
             P1=0
 
             while P1 < len(SaveSongDataList):
 
-                SongFileName=SaveSongDataList[P1][0]
-                SongKeyOffset=SaveSongDataList[P1][1]
-                logmessage("MainWindow:LoadSongList:Load:"+SongFileName)
-                self.LoadSongTitle(SongFileName,SongKeyOffset)
+                self.SongListLoadPool.start(SongListLoadTask(self.CurrentListLoad, P1))
 
                 P1=P1+1
 
-            # now re-display
-            self.DisplaySong(SongDataList[0][4])
+            if self.CurrentListLoad.IsFinished():
+                self.FinishSongListLoad()
+
+    #   A song from the song list being loaded has been read - put it, and any
+    #   songs after it that were read before it, into the list.
+    def SongListLoaded(self, ListLoad, Position, NewSong):
+
+        if ListLoad is not self.CurrentListLoad:
+            return
+
+        ListLoad.Arrived[Position] = NewSong
+
+        while ListLoad.NextPosition in ListLoad.Arrived:
+
+            NewSong = ListLoad.Arrived.pop(ListLoad.NextPosition)
+            ListLoad.NextPosition += 1
+
+            if NewSong is None:
+                continue
+
+            self.AddSongToList(NewSong)
+
+            # Show the first song as soon as it's there
+            if self.SongListModel.rowCount() == 1:
+                self.DisplaySong(NewSong.DisplayName)
+
+        if ListLoad.IsFinished():
+            self.FinishSongListLoad()
+
+    #   All the songs in the song list have been read - save the song list
+    #   (and the song cache) once, now that it's all there.
+    def FinishSongListLoad(self):
+
+        logmessage("MainWindow:FinishSongListLoad")
+
+        self.CurrentListLoad = None
+        SongFileCache.Save()
+        self.SaveSongList()
+
+    #   Stop loading the song list, if it's still being loaded.
+    def CancelSongListLoad(self):
+
+        if self.CurrentListLoad is not None:
+            self.CurrentListLoad.Cancel()
+            self.CurrentListLoad = None
 
 
 
@@ -2169,31 +3286,24 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             # Now, open then file and read the JSON data.
 
             with open(FName) as f:
-                SongDataList = json.load(f)
+                OldSongDataList = json.load(f)
 
             # Clear out and populate the song list panel.
 
             self.SongListModel.clear()
+            SongDataList.Clear()
 
             # Add the files to the on-screen list
-            Ptr = 0
-
             try:
-                while Ptr < len(SongDataList):
-                    FName = SongDataList[Ptr][4]
-                    FontSize=SongDataList[Ptr][5]
-                    FontSize_Portrait=SongDataList[Ptr][6]
-                    PageSize=SongDataList[Ptr][7]
-                    PageSize_Portrait=SongDataList[Ptr][8]
-                    item = QStandardItem(FName)
-                    self.SongListModel.appendRow(item)
-                    Ptr = Ptr+1
+                for SongData in OldSongDataList:
+                    self.AddSongToList(Song(*SongData))
             except:
                 self.OkMessage('Load error','Song list file is not compatible with this version - sorry')
                 self.SongListModel.clear()
+                SongDataList.Clear()
 
 
-    #   Given a song name, find the location within the main song array and return the number
+    #   Given a song name (as shown in the song list), find the song - or None
     def LocateSong(self,SongName):
 
         #   Locate the song...
@@ -2205,18 +3315,20 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         logmessage("MainWindow:LocateSong")
 
-        Ptr = 0
-        RetValue = -1
+        return SongDataList.ByName(SongName)
 
-        while Ptr < len(SongDataList) and RetValue == -1:
+    #   Put a song into the song list - on screen and in the data structure.
+    #   The list shows the song's display name, and remembers its id.
+    def AddSongToList(self, NewSong):
 
-            if SongDataList[Ptr][4] == SongName:
-                # Located the song information...
-                RetValue = Ptr
+        global SongDataList
 
-            Ptr = Ptr + 1
+        SongDataList.Add(NewSong)
+        item = QStandardItem(NewSong.DisplayName)
+        item.setData(NewSong.Id, Qt.UserRole)
+        self.SongListModel.appendRow(item)
 
-        return RetValue
+        return NewSong
 
     #   Transpose - go down a key
     def TransposeMinusSelected(self):
@@ -2229,22 +3341,22 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         logmessage("MainWindow:TransposeMinusSelected")
 
         #   Locate the song...
-        SongPtr = self.LocateSong(self.CurrentSong)
+        CurrentSong = self.LocateSong(self.CurrentSong)
 
-        if SongPtr > -1:
+        if CurrentSong is not None:
             # got a valid song..
 
             print("Located song")
 
             # Take it down a key
-            SongDataList[SongPtr][3] -= 1
+            CurrentSong.Offset -= 1
 
             # 0 1  2 3  4 5 6  7 8  9  10 11
             # c c# d d# e f f# g g# a  a# b
 
             # Wraparound if necessary
-            if SongDataList[SongPtr][3] < 0:
-                SongDataList[SongPtr][3] = 11
+            if CurrentSong.Offset < 0:
+                CurrentSong.Offset = 11
 
             # now re-display
             self.DisplaySong(self.CurrentSong)
@@ -2263,22 +3375,22 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         logmessage("MainWindow:TransposePlusSelected")
 
         #   Locate the song...
-        SongPtr = self.LocateSong(self.CurrentSong)
+        CurrentSong = self.LocateSong(self.CurrentSong)
 
-        if SongPtr > -1:
+        if CurrentSong is not None:
             # got a valid song..
 
             print("Located song")
 
             # take it up a key
-            SongDataList[SongPtr][3] += 1
+            CurrentSong.Offset += 1
 
             # 0 1  2 3  4 5 6  7 8  9  10 11
             # c c# d d# e f f# g g# a  a# b
 
             # too high - wraparound
-            if SongDataList[SongPtr][3] > 11:
-                SongDataList[SongPtr][3] = 0
+            if CurrentSong.Offset > 11:
+                CurrentSong.Offset = 0
 
             # now re-display
             self.DisplaySong(self.CurrentSong)
@@ -2303,19 +3415,19 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         try:
 
             #   Locate the song...
-            Ptr = self.LocateSong(SongName)
+            DisplayedSong = self.LocateSong(SongName)
 
-            if Ptr > -1:
+            if DisplayedSong is not None:
 
                 #   Located the song information...
 
-                SongText = SongDataList[Ptr][1]
-                SongKey = SongDataList[Ptr][2]
-                SongOffset = SongDataList[Ptr][3]
-                CurrentFontSize = SongDataList[Ptr][5]
-                CurrentFontSize_Portrait = SongDataList[Ptr][6]
-                CurrentPageSize = SongDataList[Ptr][7]
-                CurrentPageSize_Portrait = SongDataList[Ptr][8]
+                SongText = DisplayedSong.Lyrics
+                SongKey = DisplayedSong.Key
+                SongOffset = DisplayedSong.Offset
+                CurrentFontSize = DisplayedSong.FontSize
+                CurrentFontSize_Portrait = DisplayedSong.FontSize_Portrait
+                CurrentPageSize = DisplayedSong.PageSize
+                CurrentPageSize_Portrait = DisplayedSong.PageSize_Portrait
 
                 logmessage("MainWindow:DisplaySong:SongText")
                 logmessage(SongText)
@@ -2452,7 +3564,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                     else:
                         Pagesize=self.CurrentPageSize_Portrait
 
-                SongLyricsDisplay = OutputSongText + Derive_Song_Text( "YES", SongText, SongKey, SongOffset,Pagesize,self.WindowOrientation)
+                SongLyricsDisplay = OutputSongText + Derive_Song_Text( "YES", DisplayedSong.Sheet, SongKey, SongOffset,Pagesize,self.WindowOrientation)
 
                 SongLyricsDisplay = SongLyricsDisplay.replace('SUS','sus')
 
@@ -2521,11 +3633,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             for item in listItems:
                 self.SongListModel.removeRow(item.row())
 
-            Ptr = self.LocateSong(self.CurrentSong)
+            ToRemove = self.LocateSong(self.CurrentSong)
 
-            if Ptr >= 0:
-                ToRemove = SongDataList[Ptr]
-                SongDataList.remove(ToRemove)
+            if ToRemove is not None:
+                SongDataList.Remove(ToRemove)
 
             print("Removed: " + self.CurrentSong)
 
@@ -2542,8 +3653,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         Result = self.AskQuery("Clear Songlist?", "Clear Songlist?")
 
         if Result == "YES":
+            self.CancelSongListLoad()
             self.SongListModel.clear()
-            SongDataList = []
+            SongDataList.Clear()
             self.SaveFileName='SongData.json'
 
             print("Cleared")
@@ -2560,14 +3672,15 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         logmessage("MainWindow:SaveSong")
 
         #   Locate the given song
-        Ptr = self.LocateSong(self.CurrentSong)
+        SingleSongData = self.LocateSong(SongName)
 
-        if Ptr >= 0:
-            #   Get the data about the song
-            SingleSongData = SongDataList[Ptr]
+        if SingleSongData is not None:
 
-            #   Get the default song location and add the song name
-            Fname = self.SongLocation + '/' + SongName
+            #   The song's own file - there can be songs with the same name
+            #   in different directories of the song location
+            Fname = SingleSongData.FilePath
+            if not os.path.isabs(Fname):
+                Fname = self.SongLocation + '/' + Fname
 
             #   Linux / windows
             if os.sep == '\\':
@@ -2586,17 +3699,14 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             if os.path.isfile(Fname):
 
                 try:
-                    with open(Fname, 'r') as Originalfile:
-                        SongData = Originalfile.read()
-
                     # tree contains the tree structure
-                    tree = ET.ElementTree(ET.fromstring(SongData))
+                    tree = ReadSongTree(Fname)
 
                     # Overwrite the items within the XML...
-                    tree.find('title').text = SingleSongData[4]
-                    tree.find('lyrics').text = SingleSongData[1]
-                    tree.find('key').text = SingleSongData[2]
-                    tree.find('user1').text = SingleSongData[5]+'|'+SingleSongData[6]+'|'+SingleSongData[7]+'|'+SingleSongData[8]
+                    tree.find('title').text = SingleSongData.FileName
+                    tree.find('lyrics').text = SingleSongData.Lyrics
+                    tree.find('key').text = SingleSongData.Key
+                    tree.find('user1').text = SingleSongData.FontSize+'|'+SingleSongData.FontSize_Portrait+'|'+SingleSongData.PageSize+'|'+SingleSongData.PageSize_Portrait
 
                     # overwrite the original file with the updated values
                     tree.write(Fname)
@@ -2619,9 +3729,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                     New_FileName = Fname
                 New_SongText = '<?xml version="1.0" encoding="UTF-8"?>\n'
                 New_SongText = New_SongText + '<song>\n'
-                New_SongText = New_SongText + '<title>'+SingleSongData[4]+'</title>\n'
+                New_SongText = New_SongText + '<title>'+SingleSongData.FileName+'</title>\n'
                 New_SongText = New_SongText + '  <lyrics>'
-                New_SongText = New_SongText + SingleSongData[1]+'\n'
+                New_SongText = New_SongText + SingleSongData.Lyrics+'\n'
                 New_SongText = New_SongText + '  </lyrics>\n'
                 New_SongText = New_SongText + '<author></author>\n'
                 New_SongText = New_SongText + '<copyright></copyright>\n'
@@ -2629,10 +3739,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 New_SongText = New_SongText + '<presentation></presentation>\n'
                 New_SongText = New_SongText + '<ccli></ccli>\n'
                 New_SongText = New_SongText + '<capo print = "false"></capo>\n'
-                New_SongText = New_SongText + '<key>'+SingleSongData[2]+'</key>\n'
+                New_SongText = New_SongText + '<key>'+SingleSongData.Key+'</key>\n'
                 New_SongText = New_SongText + '<aka></aka>\n'
                 New_SongText = New_SongText + '<key_line></key_line>\n'
-                New_SongText = New_SongText + '<user1>'+SingleSongData[5]+'|'+SingleSongData[6]+'|'+SingleSongData[7]+'|'+SingleSongData[8]+'</user1>\n'
+                New_SongText = New_SongText + '<user1>'+SingleSongData.FontSize+'|'+SingleSongData.FontSize_Portrait+'|'+SingleSongData.PageSize+'|'+SingleSongData.PageSize_Portrait+'</user1>\n'
                 New_SongText = New_SongText + '<user2></user2>\n'
                 New_SongText = New_SongText + '<user3></user3>\n'
                 New_SongText = New_SongText + '<theme></theme>\n'
@@ -2664,14 +3774,13 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         logmessage("MainWindow:EditCurrentSong")
 
         #   Locate the song
-        Ptr = self.LocateSong(self.CurrentSong)
+        SingleSongData = self.LocateSong(self.CurrentSong)
 
-        if Ptr > -1:
-            SingleSongData = SongDataList[Ptr]
+        if SingleSongData is not None:
 
-            logmessage("EditCurrentSong:"+SingleSongData[4])
+            logmessage("EditCurrentSong:"+SingleSongData.FileName)
             logmessage("EditCurrentSong:Prior song text:")
-            logmessage("EditCurrentSong:"+SingleSongData[1])
+            logmessage("EditCurrentSong:"+SingleSongData.Lyrics)
 
             #   Initialise and show the song
             dlg = EditWindow(SingleSongData)
@@ -2680,17 +3789,24 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             if dlg.exec_():
                 print("Success!")
                 logmessage("EditCurrentSong:Post song text:")
-                logmessage("EditCurrentSong:"+SingleSongData[1])
-                #   Copy the song data to the main data structure
-                SongDataList[Ptr][0] = self.SongLocation+'/'+dlg.ui.FName.text()
-                SongDataList[Ptr][1] = dlg.ui.EditingSongText.toPlainText()
-                SongDataList[Ptr][2] = dlg.ui.SongKey.currentText()
-                SongDataList[Ptr][3] = 0
-                SongDataList[Ptr][4] = dlg.ui.FName.text()
-                SongDataList[Ptr][5] = dlg.ui.DefaultFontSize.currentText()
-                SongDataList[Ptr][6] = dlg.ui.DefaultFontSize_Portrait.currentText()
-                SongDataList[Ptr][7] = dlg.ui.PageSize.currentText()
-                SongDataList[Ptr][8] = dlg.ui.PageSize_Portrait.currentText()
+                logmessage("EditCurrentSong:"+SingleSongData.Lyrics)
+                #   Copy the song data to the main data structure - the song
+                #   stays in its own directory, even if it's been renamed
+                SongDirectory = os.path.dirname(SingleSongData.FilePath) or self.SongLocation
+                SongDataList.Update(SingleSongData, os.path.join(SongDirectory, dlg.ui.FName.text()), dlg.ui.FName.text())
+                SingleSongData.Lyrics = dlg.ui.EditingSongText.toPlainText()
+                SingleSongData.Key = dlg.ui.SongKey.currentText()
+                SingleSongData.Offset = 0
+                SingleSongData.FontSize = dlg.ui.DefaultFontSize.currentText()
+                SingleSongData.FontSize_Portrait = dlg.ui.DefaultFontSize_Portrait.currentText()
+                SingleSongData.PageSize = dlg.ui.PageSize.currentText()
+                SingleSongData.PageSize_Portrait = dlg.ui.PageSize_Portrait.currentText()
+
+                #   The song may have been renamed - show its new name in the list
+                for index in self.SongListModel.match(self.SongListModel.index(0, 0), Qt.UserRole, SingleSongData.Id, 1, Qt.MatchExactly):
+                    self.SongListModel.setData(index, SingleSongData.DisplayName)
+                self.CurrentSong = SingleSongData.DisplayName
+
                 self.DisplaySong(self.CurrentSong)
                 self.SaveSong(self.CurrentSong)
                 logmessage("EditCurrentSong: Saved")
@@ -2710,16 +3826,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         logmessage("MainWindow:NewSong")
 
         # Create a blank song
-        SingleSongData = ['a','a','a',0,'a','a','a','a','a']
-        SingleSongData[0] = self.SongLocation+'/New Song'
-        SingleSongData[1] = '.C\n Words'
-        SingleSongData[2] = 'C'
-        SingleSongData[3] = 0
-        SingleSongData[4] = 'New Song'
-        SingleSongData[5] = 'Default'
-        SingleSongData[6] = 'Default'
-        SingleSongData[7] = 'Default'
-        SingleSongData[8] = 'Default'
+        SingleSongData = Song(self.SongLocation+'/New Song', '.C\n Words', 'C')
 
         # Initialise the edit window
         dlg = EditWindow(SingleSongData)
@@ -2727,22 +3834,20 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         # Activate the edit window
         if dlg.exec_():
             print("Success!")
-            SingleSongData[0] = self.SongLocation+'/'+dlg.ui.FName.text()
-            SingleSongData[1] = dlg.ui.EditingSongText.toPlainText()
-            SingleSongData[2] = dlg.ui.SongKey.currentText()
-            SingleSongData[3] = 0
-            SingleSongData[4] = dlg.ui.FName.text()
-            SingleSongData[5] = dlg.ui.DefaultFontSize.currentText()
-            SingleSongData[6] = dlg.ui.DefaultFontSize_Portrait.currentText()
-            SingleSongData[7] = dlg.ui.PageSize.currentText()
-            SingleSongData[8] = dlg.ui.PageSize_Portrait.currentText()
+            SingleSongData.FilePath = self.SongLocation+'/'+dlg.ui.FName.text()
+            SingleSongData.Lyrics = dlg.ui.EditingSongText.toPlainText()
+            SingleSongData.Key = dlg.ui.SongKey.currentText()
+            SingleSongData.Offset = 0
+            SingleSongData.FileName = dlg.ui.FName.text()
+            SingleSongData.FontSize = dlg.ui.DefaultFontSize.currentText()
+            SingleSongData.FontSize_Portrait = dlg.ui.DefaultFontSize_Portrait.currentText()
+            SingleSongData.PageSize = dlg.ui.PageSize.currentText()
+            SingleSongData.PageSize_Portrait = dlg.ui.PageSize_Portrait.currentText()
 
             #   Up to this point its the same as edit - however, now we need to add the
             #   new song to the on-screen list, and display.
-            SongDataList.append(SingleSongData)
-            self.CurrentSong = SingleSongData[4]
-            item = QStandardItem(self.CurrentSong)
-            self.SongListModel.appendRow(item)
+            self.AddSongToList(SingleSongData)
+            self.CurrentSong = SingleSongData.DisplayName
             self.DisplaySong(self.CurrentSong)
             self.SaveSong(self.CurrentSong)
             logmessage("MainWindow:SaveSong")
@@ -2776,137 +3881,37 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             FName = SongPreferences['SONGDIR']+"/"+dialog.ui.lineEdit.text()
 
             # Add a new song, but as this is just 'new' keep the base key as-is i.e. ""
-            self.LoadSongTitle(FName,0)
+            NewSong = self.LoadSongTitle(FName,0)
+            SongFileCache.Save()
 
             logmessage("MainWindow:AddNewSong:"+FName)
 
-            self.DisplaySong(SongNameToAdd)
+            if NewSong is not None:
+                self.DisplaySong(NewSong.DisplayName)
 
 
 
 
+    #   Read a song file and add it to the end of the song list - returns the
+    #   song, or None if it couldn't be read.
     def LoadSongTitle(self, SongFilename, SetSongOffset):
 
             logmessage("MainWindow:LoadSongTitle")
-            try:
-
-                #   windows/linux
-                FName=SongFilename
-                if os.sep == '\\':
-                    FName = FName.replace('/', '\\')
-                FName = FName.replace(self.SongLocation+'\\', '')
-                item = QStandardItem(os.path.basename(FName))
-                self.SongListModel.appendRow(item)
-
-                #   Read in the song data, to add to the list...
-
-                print("reading file...")
-
-                with open(FName, 'r') as myfile:
-                    SongData = myfile.read()
-
-                print("getting data")
-
-                tree = ET.ElementTree(ET.fromstring(SongData))
-
-                #   Interpret the XML into the main data structure
-                print("getting lyrics")
 
-                SongLyrics = list(tree.iter('lyrics'))
-
-                print("getting key")
-
-                KeyData = tree.find('key')
-
-                if KeyData is None:
-                    SongKeyValue = 'C'
-                else:
-                    SongKey = list(tree.iter('key'))
-                    if SongKey[0].text is None:
-                        SongKeyValue = 'C'
-                    else:
-                        SongKeyValue = SongKey[0].text
-
-                logmessage("MainWindow:LoadSongTitle:KeyData:"+SongKeyValue)
-                print("getting fontsize")
-
-                ExtraInfo = tree.find('user1')
-                ExtraInfoText=ExtraInfo.text
-
-                try:
-                    if "|" in ExtraInfoText:
-                    # we have extra font info...
-
-                        ExtraInfoArray=ExtraInfoText.split("|")
-
-                        FontSize = ExtraInfoArray[0]
-                        if len(FontSize) == 0:
-                            FontSize = "Default"
-
-                        FontSize_Portrait = ExtraInfoArray[1]
-                        if len(FontSize_Portrait) == 0:
-                            FontSize = "Default"
-
-                        PageSize = ExtraInfoArray[2]
-                        if len(PageSize) == 0:
-                            PageSize = "Default"
-
-                        PageSize_Portrait = ExtraInfoArray[3]
-                        if len(PageSize_Portrait) == 0:
-                            PageSize_Portrait = "Default"
-
-                    else:
-
-                        FontSize = "Default"
-                        FontSize_Portrait = "Default"
-                        PageSize = "Default"
-                        PageSize_Portrait = "Default"
-
-
-                except:
-                    FontSize = "Default"
-                    FontSize_Portrait = "Default"
-                    PageSize = "Default"
-                    PageSize_Portrait = "Default"
+            NewSongData = ReadListSong(SongFilename, SetSongOffset, self.SongLocation)
+            if NewSongData is None:
+                logmessage("MainWindow:LoadSongTitle: Error adding song?")
+                print("Error trying to add song - ignoring")
+                return None
 
+            print("append into songdata")
+            self.AddSongToList(NewSongData)
+            print("added")
 
-                logmessage("MainWindow:LoadSongTitle:Fontdata:FontSize_L:"+FontSize+" P:"+FontSize_Portrait+" Pagesize_L:"+PageSize+" P:"+PageSize_Portrait)
-
-                print("create list element")
-                # Create list element, SongName, LyricsText, Key, OffsetToKey
-                print("Filename:" + FName)
-                print("Lyrics:" + SongLyrics[0].text)
-                print("Key:" + SongKeyValue)
-                print("Font:" + FontSize)
-                print("Font_Portrait:" + FontSize_Portrait)
-                print("Pagesize:" + PageSize)
-                print("Pagesize_Portrait:" + PageSize_Portrait)
-
-                logmessage("MainWindow:LoadSongTitle:Lyrics")
-                logmessage(SongLyrics[0].text)
-
-                # Data structure
-                # 0 - full file and path name
-                # 1 - lyrics text
-                # 2 - Base key
-                # 3 - Offset
-                # 4 - Basename (just the file name)
-                # 5 - Font size (Landscape)
-                # 6 - Font size_Portrait
-                # 7 - Pagesize (Landscape)
-                # 8 - Pagesize_Portrait
-                NewSongData = [FName, SongLyrics[0].text, SongKeyValue, SetSongOffset, os.path.basename(FName),FontSize,FontSize_Portrait,PageSize,PageSize_Portrait]
-
-                print("append into songdata")
-                SongDataList.append(NewSongData)
-                print("added")
-
-                logmessage("MainWindow:LoadSongTitle: Added")
-                self.SaveSongList()
+            logmessage("MainWindow:LoadSongTitle: Added")
+            self.SaveSongList()
 
-            except:
-                logmessage("MainWindow:LoadSongTitle: Error adding song?")
-                print("Error trying to add song - ignoring")
+            return NewSongData
 
 
     def CleanString(self,InputString):
@@ -2930,6 +3935,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         global SongKeys
         global SongKeys_Alt
         global SongPreferences
+        global SongPreferencesVersion
 
         logmessage("MainWindow:UpdatePrefs")
 
@@ -2988,6 +3994,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             with open(self.SongPreferencesFileName, 'w') as f:
                 json.dump(SongPreferences, f)
 
+            SongPreferencesVersion = SongPreferencesVersion + 1
+
             # Set up preference variables.
             self.InterpretPreferences()
 
@@ -3021,6 +4029,10 @@ except:
 #   If we're running in the GUI then set up and open the GUI...
 if __name__ == "__main__":
 
+    # The song index is built using worker processes - needed for them to
+    # start when we're packaged up as an executable.
+    multiprocessing.freeze_support()
+
     logmessage("Start:")
     app = QtWidgets.QApplication(sys.argv)
     w = MainWindow()
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import os
+import pickle
+import threading
+
+from SongReader import ReadSongFields
+
+
+#   SongCache
+#
+#   The details of songs read for the song list (lyrics, key, and the display
+#   overrides in user1) - kept on disk, so that opening a song list doesn't
+#   have to read and parse every song in it again.
+#
+#   Each song is kept with the size and modification time of its file when it
+#   was read - if either has changed, the song is read again.  The cache is
+#   saved as a pickle next to the preferences file (written to a temp file
+#   first, as the song index is) - only when a song has been added, replaced
+#   or dropped.  It's kept to SongCacheMaxSize characters of song text - the
+#   songs used longest ago are dropped first.
+
+SongCacheFileName = 'OpenSongViewerSongCache.bin'
+
+#   Bump this if what's kept for each song changes - old cache files are then
+#   ignored.
+SongCacheVersion = 1
+
+#   The elements of a song file that are kept
+SongCacheFields = ('lyrics', 'key', 'user1')
+
+#   How much song text (in characters) to keep - a few thousand songs
+SongCacheMaxSize = 4 * 1024 * 1024
+
+
+#   How much room a song's details take up in the cache
+def CachedSize(SongFields):
+    return sum(len(Value) for Value in SongFields.values() if Value is not None) + 100
+
+
+class SongCache(object):
+
+    def __init__(self, CacheFileName):
+
+        self.CacheFileName = CacheFileName
+
+        # Full path -> (size, mtime, {element name: text}) - most recently
+        # used last
+        self._Songs = OrderedDict()
+        self._Size = 0
+        self._Unsaved = False
+
+        # Songs may be read on more than one thread at once
+        self._Lock = threading.Lock()
+
+        self.Load()
+
+    #   Pull in the saved cache - if there's a problem, start empty.
+    def Load(self):
+
+        try:
+            with open(self.CacheFileName, 'rb') as f:
+                CacheData = pickle.load(f)
+
+            if CacheData['version'] != SongCacheVersion:
+                return
+
+            Songs = OrderedDict(CacheData['songs'])
+        except:
+            return
+
+        with self._Lock:
+            self._Songs = Songs
+            self._Size = sum(CachedSize(SongFields) for FileSize, FileTime, SongFields in Songs.values())
+            self._Unsaved = False
+
+    #   Write the cache out, if anything has changed since it was last saved.
+    def Save(self):
+
+        with self._Lock:
+            if not self._Unsaved:
+                return
+            CacheData = pickle.dumps({
+                                      'version': SongCacheVersion,
+                                      'songs': list(self._Songs.items()),
+                                      }, pickle.HIGHEST_PROTOCOL)
+            self._Unsaved = False
+
+        try:
+            TempFileName = self.CacheFileName+'.tmp'
+            with open(TempFileName, 'wb') as f:
+                f.write(CacheData)
+            os.replace(TempFileName, self.CacheFileName)
+        except:
+            print("Unable to save song cache "+self.CacheFileName)
+
+    #   A song's details (see SongCacheFields) - from the cache if the song
+    #   hasn't changed since it was read, otherwise from the song file.
+    #   Returns {element name: text} as ReadSongFields - and raises the same
+    #   errors if the file can't be read.
+    def SongFields(self, FileName):
+
+        FileStat = os.stat(FileName)
+
+        with self._Lock:
+            Cached = self._Songs.get(FileName)
+            if Cached is not None and Cached[0] == FileStat.st_size and Cached[1] == FileStat.st_mtime:
+                # (the cache isn't written out just for this - the new order
+                # is saved along with the next real change)
+                self._Songs.move_to_end(FileName)
+                return dict(Cached[2])
+
+        SongFields = ReadSongFields(FileName, SongCacheFields)
+
+        with self._Lock:
+            Cached = self._Songs.pop(FileName, None)
+            if Cached is not None:
+                self._Size -= CachedSize(Cached[2])
+
+            self._Songs[FileName] = (FileStat.st_size, FileStat.st_mtime, SongFields)
+            self._Size += CachedSize(SongFields)
+            self._Unsaved = True
+
+            while self._Size > SongCacheMaxSize and len(self._Songs) > 1:
+                OldFileName, (FileSize, FileTime, OldFields) = self._Songs.popitem(last=False)
+                self._Size -= CachedSize(OldFields)
+
+        return dict(SongFields)
@@ -0,0 +1,175 @@
+import re
+
+
+#   SongChords
+#
+#   Working with the chords in a song - shared between the song display (which
+#   transposes chord lines) and the song index (which indexes chord
+#   progressions so songs can be found by how they go, in any key).
+#
+#   Chord lines are the lyric lines beginning with '.' - the chords are picked
+#   out by looking for the note letters A-G, each optionally followed by
+#   (up to two of) 'M' (minor), '#' or 'b'.
+#
+#   A song's chord progression is stored as the sequence of its chords' roots,
+#   as the number of semitones above the song's key - one character for each
+#   chord, see ProgressionChars - so the same progression looks the same
+#   whatever key it's in.  'Chord progression' here means the roots only -
+#   G-Em-C-D and G-E-C-D are the same progression.
+
+SongKeys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+SongKeys_Alt = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+
+#   Semitones above the key -> the character used for it in a progression
+ProgressionChars = '0123456789ab'
+
+#   Roman numeral -> semitones above the key
+RomanNumerals = {
+                 'i': 0,
+                 'ii': 2,
+                 'iii': 4,
+                 'iv': 5,
+                 'v': 7,
+                 'vi': 9,
+                 'vii': 11,
+                 }
+
+#   A roman numeral chord in a progression search, e.g. 'vi', 'bVII', 'IV7'
+RomanChordPattern = re.compile(r'^([b#]?)(iii|ii|iv|vii|vi|v|i)(?![iv])', re.IGNORECASE)
+
+#   A chord by name in a progression search, e.g. 'G', 'Em', 'F#m7'
+NamedChordPattern = re.compile(r'^([A-G][#b]?)')
+
+#   What separates the chords in a progression search
+ProgressionSeparatorPattern = re.compile(r'[\s,\-–—>|/]+')
+
+
+#   Find the chords in a chord line - returns a list of (start, end, chord)
+#   for each chord, i.e. the chord is InputText[start:end]
+def ChordsInLine(InputText):
+
+    Chords = []
+
+    Ptr3 = 0  # pointer into the text line
+
+    # Create a temp line with extra spaces at the end - so we don't read past the end of line.
+    TempLine = InputText + "   "
+
+    while Ptr3 < len(InputText):
+
+        NewValue = ord(InputText[Ptr3])
+
+        if 65 <= NewValue <= 71:
+            # This is a key value
+            ChordStart = Ptr3
+
+            # Check: is this a minor or sharp?
+            if (TempLine[Ptr3 + 1] == 'M') or (TempLine[Ptr3 + 1] == '#') or (TempLine[Ptr3 + 1] == 'b'):
+                Ptr3 = Ptr3 + 1
+                # Check: is this a minor or sharp?
+                if (TempLine[Ptr3 + 1] == 'M') or (TempLine[Ptr3 + 1] == '#') or (TempLine[Ptr3 + 1] == 'b'):
+                    Ptr3 = Ptr3 + 1
+
+            Chords.append((ChordStart, Ptr3 + 1, InputText[ChordStart:Ptr3 + 1]))
+
+        Ptr3 = Ptr3 + 1
+
+    return Chords
+
+
+#   The note a key (or chord) is based on - as a number 0 (C) to 11 (B),
+#   or -1 if it's not a key we understand.  e.g. 'G' -> 7, 'Bbm' -> 10
+def KeyNumber(KeyName):
+
+    KeyName = KeyName.strip()
+    if len(KeyName) == 0:
+        return -1
+
+    Root = KeyName[0].upper()
+    if len(KeyName) > 1 and KeyName[1] in '#b':
+        Root = Root + KeyName[1]
+
+    for Ptr3 in range(12):
+        if SongKeys[Ptr3] == Root or SongKeys_Alt[Ptr3] == Root:
+            return Ptr3
+
+    return -1
+
+
+#   Work out a song's chord progression from its lyrics (see above).  If the
+#   song has no key we understand, its first chord is taken as the key.
+#   A bass note (the B in G/B) isn't a chord of its own, and a chord repeated
+#   straight after itself only counts once.
+def SongProgression(Lyrics, SongKey):
+
+    SongKeyNumber = KeyNumber(SongKey)
+
+    Progression = []
+    for TextLine in Lyrics.split('\n'):
+        if len(TextLine) == 0 or TextLine[0] != '.':
+            continue
+
+        for ChordStart, ChordEnd, ChordString in ChordsInLine(TextLine):
+            if ChordStart > 0 and TextLine[ChordStart - 1] == '/':
+                continue
+
+            Root = KeyNumber(ChordString)
+            if Root == -1:
+                continue
+
+            if SongKeyNumber == -1:
+                SongKeyNumber = Root
+
+            Degree = ProgressionChars[(Root - SongKeyNumber) % 12]
+            if len(Progression) == 0 or Progression[-1] != Degree:
+                Progression.append(Degree)
+
+    return ''.join(Progression)
+
+
+#   Turn a progression typed into the search box into what to look for in the
+#   songs' progressions.  It can be given as roman numerals (I-V-vi-IV) - which
+#   are relative to the song's key - or as chords (G-D-Em-C) - which are
+#   looked for in any key.
+#   Returns a list of progressions (as stored for the songs) - any of them
+#   will do - or an empty list if we can't make sense of it.
+def ParseProgression(Text):
+
+    Tokens = [Token for Token in ProgressionSeparatorPattern.split(Text.strip()) if len(Token) > 0]
+    if len(Tokens) == 0:
+        return []
+
+    Degrees = []
+    for Token in Tokens:
+        Match = RomanChordPattern.match(Token)
+        if Match is None:
+            break
+        Degree = RomanNumerals[Match.group(2).lower()]
+        if Match.group(1) == 'b':
+            Degree = Degree - 1
+        elif Match.group(1) == '#':
+            Degree = Degree + 1
+        Degrees.append(Degree % 12)
+
+    if len(Degrees) == len(Tokens):
+        return [CollapseProgression(Degrees)]
+
+    Roots = []
+    for Token in Tokens:
+        Match = NamedChordPattern.match(Token)
+        if Match is None:
+            return []
+        Roots.append(KeyNumber(Match.group(1)))
+
+    # Chords by name - the song could be in any key.
+    return [CollapseProgression([(Root - Key) % 12 for Root in Roots]) for Key in range(12)]
+
+
+def CollapseProgression(Degrees):
+
+    Progression = []
+    for Degree in Degrees:
+        if len(Progression) == 0 or Progression[-1] != ProgressionChars[Degree]:
+            Progression.append(ProgressionChars[Degree])
+
+    return ''.join(Progression)
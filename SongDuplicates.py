@@ -0,0 +1,215 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import re
+import zlib
+
+from SongIndex import FoldText
+
+
+#   SongDuplicates
+#
+#   Finding songs that are (nearly) the same song - copies saved under another
+#   file name, in another key, with a verse added or a few words changed.
+#
+#   Each song's lyrics (without the chord lines, so the key doesn't matter)
+#   are turned into a set of 'shingles' - each run of ShingleLines lines, with
+#   the case, accents and punctuation folded out of them.  Two songs are
+#   near-duplicates if enough of their shingles are the same - the Jaccard
+#   similarity, shingles in both / shingles in either.
+#
+#   Comparing every song with every other song doesn't scale (20,000 songs is
+#   200 million pairs), so each song gets a MinHash signature - the smallest
+#   hash of its shingles under each of MinHashCount different hash functions.
+#   The chance of two songs having the same smallest hash is their Jaccard
+#   similarity.  The signature is cut into bands of BandRows hashes, and only
+#   songs that have a whole band the same (LSH - locality sensitive hashing)
+#   are compared - similar songs almost always share a band, different ones
+#   almost never do.  The songs compared are checked on their actual shingles,
+#   so there are no false matches - just the odd missed one below ~60%.
+
+#   How many lines make a shingle
+ShingleLines = 2
+
+#   Hash functions in a signature, and how many of them make a band - 16 bands
+#   of 4, so songs ~50% similar have an even chance of sharing a band, and 80%
+#   similar songs share one >99.9% of the time.
+MinHashCount = 64
+BandRows = 4
+
+#   How similar songs have to be to be reported (Jaccard similarity)
+DuplicateThreshold = 0.7
+
+#   Below this many songs, signatures aren't worth sharing out between worker
+#   processes - and how many songs to give a worker at a time
+ParallelMinimum = 2000
+ShardSize = 1000
+
+#   The hash functions are the successive 32 bit pieces of a SHAKE-128 digest
+#   - one call (in C) hashes a shingle all MinHashCount ways, where doing the
+#   arithmetic for each hash function in Python is several times slower.
+MinHashBytes = MinHashCount * 4
+
+#   Lines that aren't words to be sung - section headings '[V1]', comments
+#   ';...' and chord lines '.G  C' (in case they're still there)
+NotLyricPattern = re.compile(r'^\s*[\[;.]')
+
+#   The verse numbers OpenSong puts at the start of lines for multi-verse songs
+VerseNumberPattern = re.compile(r'^\d+')
+
+WordPattern = re.compile(r'\w+')
+
+
+#   The lyric lines of a song, folded (as the song index does - case, accents,
+#   ...) and with just the words left, ready for shingling.  Blank lines are
+#   dropped.
+def LyricLines(Lyrics):
+
+    Lines = []
+    for TextLine in FoldText(Lyrics).split('\n'):
+        if NotLyricPattern.match(TextLine):
+            continue
+        Words = WordPattern.findall(VerseNumberPattern.sub('', TextLine))
+        if len(Words) > 0:
+            Lines.append(' '.join(Words))
+
+    return Lines
+
+
+#   The shingles of a song's lyrics (see above) - as a set of byte strings.  A
+#   song with fewer lines than a shingle is one shingle.
+def LyricShingles(Lyrics):
+
+    Lines = LyricLines(Lyrics)
+    if len(Lines) == 0:
+        return set()
+
+    Count = max(1, len(Lines) - ShingleLines + 1)
+    return set('\n'.join(Lines[Start:Start+ShingleLines]).encode('utf8') for Start in range(Count))
+
+
+#   A song's MinHash signature - the smallest hash of its shingles under each
+#   of the hash functions
+def MinHashSignature(Shingles):
+    return tuple(map(min, zip(*[array('I', hashlib.shake_128(Shingle).digest(MinHashBytes)) for Shingle in Shingles])))
+
+
+#   Work out the signatures of a shard of songs - run in a worker process if
+#   there are enough songs.
+#   Returns, for each song, (signature, shingle hashes) - or None if the song
+#   has no lyrics.  Only songs that are compared need their shingles again, so
+#   they're kept as small hashes.
+def SignatureShard(LyricsList):
+
+    Results = []
+    for Lyrics in LyricsList:
+        SongShingles = LyricShingles(Lyrics)
+        if len(SongShingles) == 0:
+            Results.append(None)
+        else:
+            Results.append((MinHashSignature(SongShingles), set(map(zlib.crc32, SongShingles))))
+
+    return Results
+
+
+def Similarity(Shingles1, Shingles2):
+    return len(Shingles1 & Shingles2) / len(Shingles1 | Shingles2)
+
+
+#   Find the groups of (nearly) the same songs.
+#   Songs - {song name: lyrics}
+#   Cancelled - optional function, checked as the songs are gone through - if
+#   it returns True we give up and None is returned.
+#   Returns a list of (group, pairs) - group being the song names in the
+#   group, sorted, and pairs the pairs of them found to be similar, as
+#   (song name, song name, similarity).  The groups are sorted by their first
+#   song.
+def DuplicateSongs(Songs, Threshold=DuplicateThreshold, Cancelled=None):
+
+    if Cancelled is None:
+        Cancelled = lambda: False
+
+    Names = list(Songs)
+    Shards = [[Songs[Name] for Name in Names[Start:Start+ShardSize]] for Start in range(0, len(Names), ShardSize)]
+
+    Executor = None
+    if len(Names) >= ParallelMinimum and (os.cpu_count() or 1) > 1:
+        try:
+            Executor = ProcessPoolExecutor()
+            Results = Executor.map(SignatureShard, Shards)
+        except:
+            print("Unable to start worker processes - working out signatures here")
+            Executor = None
+
+    if Executor is None:
+        Results = map(SignatureShard, Shards)
+
+    Shingles = {}
+    Buckets = {}
+    try:
+        for ShardNo in range(len(Shards)):
+            if Cancelled():
+                return None
+
+            try:
+                Result = next(Results)
+            except:
+                # A worker process has fallen over - do the rest here.
+                print("Problem in worker process - working out signatures here")
+                Results = map(SignatureShard, Shards[ShardNo+1:])
+                Result = SignatureShard(Shards[ShardNo])
+
+            for Name, Song in zip(Names[ShardNo*ShardSize:], Result):
+                if Song is None:
+                    continue
+                Signature, Shingles[Name] = Song
+                for Band in range(0, MinHashCount, BandRows):
+                    Buckets.setdefault((Band, Signature[Band:Band+BandRows]), []).append(Name)
+    finally:
+        if Executor is not None:
+            Executor.shutdown(wait=False, cancel_futures=True)
+
+    # Check the songs that share a band (each pair once), and put the
+    # matching ones together - each song's group is found by following
+    # Group until it leads back to itself.
+    Group = {}
+    Checked = set()
+    Pairs = []
+
+    def GroupOf(Name):
+        while Group.get(Name, Name) != Name:
+            Name = Group[Name]
+        return Name
+
+    for Bucket in Buckets.values():
+        if len(Bucket) < 2:
+            continue
+        if Cancelled():
+            return None
+
+        for Ptr1 in range(len(Bucket)):
+            for Ptr2 in range(Ptr1 + 1, len(Bucket)):
+                Pair = (Bucket[Ptr1], Bucket[Ptr2]) if Bucket[Ptr1] < Bucket[Ptr2] else (Bucket[Ptr2], Bucket[Ptr1])
+                if Pair in Checked:
+                    continue
+                Checked.add(Pair)
+
+                PairSimilarity = Similarity(Shingles[Pair[0]], Shingles[Pair[1]])
+                if PairSimilarity >= Threshold:
+                    Pairs.append(Pair + (PairSimilarity,))
+                    Group.setdefault(Pair[0], Pair[0])
+                    Group.setdefault(Pair[1], Pair[1])
+                    Group1, Group2 = GroupOf(Pair[0]), GroupOf(Pair[1])
+                    if Group1 != Group2:
+                        Group[max(Group1, Group2)] = min(Group1, Group2)
+
+    Groups = {}
+    for Name in Group:
+        Groups.setdefault(GroupOf(Name), set()).add(Name)
+
+    GroupPairs = {}
+    for Pair in sorted(Pairs):
+        GroupPairs.setdefault(GroupOf(Pair[0]), []).append(Pair)
+
+    return [(sorted(Groups[First]), GroupPairs[First]) for First in sorted(Groups)]
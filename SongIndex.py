@@ -0,0 +1,1904 @@
+
+from array import array
+from collections import OrderedDict
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import json
+import locale
+import math
+import mmap
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+
+from SongChords import SongProgression, ParseProgression
+from SongReader import ReadSongFields, ParseSongFields, SongEncoding, ReadChunkSize
+
+
+#   SongIndex
+#
+#   Persistent full-text index of the song library - used by the song search
+#   dialog so that typing in the search box doesn't have to re-read every song
+#   file on every keystroke.
+#
+#   The index is saved as a JSON file next to the preferences file.  Each song
+#   file has an entry keyed by its full path - the entry remembers the size and
+#   modification time of the file when it was indexed, if either changes then
+#   the song is re-read, otherwise the stored entry is used as-is.
+#
+#   In memory, the entries are turned into a trigram index - for every three
+#   character sequence, the songs containing it.  Anything containing the typed
+#   text must contain every one of its trigrams, so intersecting their song
+#   lists (rarest first) narrows the search down to a handful of songs, which
+#   are then checked for the whole text.  The cost of a search depends on how
+#   many songs match, not on how big the library is.  A single word (or part
+#   of one) is looked up in the word index instead (see below) - the songs
+#   with the words it's part of are the songs with it, no checking needed.
+#
+#   Songs are numbered in the trigram index, and each trigram's songs are kept
+#   as an array of song numbers - much smaller than sets of file names.  Songs
+#   that are taken out keep their numbers in the arrays until there are enough
+#   of them to be worth clearing out (the numbers are simply skipped).
+#
+#   For typo tolerant searching there's also a word index - for every word,
+#   the songs containing it - and the words themselves are indexed by their
+#   trigrams, so that words similar to a typed word can be found without
+#   comparing it with every word in the library.  Ranked searches score the
+#   songs by how well, and where, the typed words match (see RankedSearch).
+#
+#   Building the trigram and word indexes takes a while for a big library, so
+#   they're saved too (alongside the index file) and loaded back if they were
+#   saved along with the index file we've loaded.
+#
+#   Searches can run on a background thread while the index is being updated
+#   on another - a lock keeps the two apart.  Song files are never read while
+#   it's held, so searches only wait while what's been read goes in.
+#
+#   The index also keeps a manifest of the song directories - for each
+#   directory, its modification time and the song files / sub directories in
+#   it.  Adding, removing or renaming a file changes its directory's
+#   modification time, so when the program starts, directories that haven't
+#   changed don't need to be listed, and their songs don't need to be stat'ed
+#   again (this matters when the songs are on a network share).  Songs edited in
+#   place don't change their directory's modification time - while the program
+#   is running the directory watcher picks them up, and once it has started,
+#   the songs are checked in the background in case they were edited before
+#   (see CheckFiles).
+#
+#   Each entry also has a catalog of the song's details (author, CCLI number,
+#   key etc.) so searches like 'author:wesley key:G' can be answered without
+#   going back to the song files - see ParseQuery.
+#
+#   Songs' chord progressions are indexed too (see SongChords), by their
+#   sequences of three chords, so 'prog:I-V-vi-IV' finds songs that go that
+#   way in any key.
+#
+#   Reading the songs is the slow part of building the index from scratch, so
+#   when there are a lot to read they're shared out, a shard at a time, between
+#   worker processes (one per core) which read, parse and index them - the
+#   shards' song lists are then merged into the index.  The index is saved
+#   every so often while this goes on, so if the program is closed part way
+#   through, the songs already read don't have to be read again next time.
+#
+#   Until a song has been read into the index (e.g. the first time the program
+#   is run, while the index is built in the background) searches scan the
+#   song file itself - see SongScanner.
+#
+#   Text is folded for searching as it's indexed - case, accents and the
+#   different forms of quotes and dashes are all ignored (see FoldText) - and
+#   the typed search text is folded the same way, so 'jesus' finds 'Jesús'
+#   and "Lord's" finds 'Lord’s' at no cost to each search.
+#
+#   Recent search results are remembered - as the user types, each search is
+#   usually the previous one plus a letter, and anything matching the longer
+#   text must also have matched the shorter one, so only the previous results
+#   need checking.  Backspacing just picks up the earlier results again.
+
+#   Bump this if the layout of the entries (or the way text is folded) changes
+#   - old index files are then discarded and rebuilt.
+SongIndexVersion = 6
+
+#   File name of the index - held in the same directory as the preferences.
+SongIndexFileName = 'OpenSongViewerSongIndex.json'
+
+#   Extension of the saved trigram / word indexes - they go alongside the
+#   index file.
+SongSearchFileExtension = '.searchdata'
+
+#   How many songs / words a search works through before checking whether it
+#   has been cancelled.
+SearchCheckInterval = 500
+
+#   How many recent searches to remember
+QueryCacheSize = 64
+
+#   Once a search is down to this many possible songs, stop narrowing it with
+#   the trigram index - just check them.
+CandidateCheckSize = 64
+
+#   Roughly how many times longer it takes to check a song for the search text
+#   than to look a song up while narrowing the search - a trigram that most
+#   songs have isn't worth narrowing with, checking the few songs it would
+#   rule out is quicker.
+CheckCostRatio = 10
+
+#   Clear taken out songs out of the trigram / word indexes once this
+#   proportion of the numbered songs have gone.
+SongPurgeRatio = 0.25
+
+WordPattern = re.compile(r'\w+')
+
+#   Ranked searches - how many songs to return
+RankedResultCount = 50
+
+#   Ranked searches - how much more a word counts if it's in the song's title
+#   (or file name), or its first few lines, than further down the lyrics.
+TitleWeight = 3.0
+FirstLinesWeight = 2.0
+FirstLinesCount = 2
+
+#   Ranked searches - how much more a song counts if it has the typed text
+#   exactly as typed.
+ExactMatchWeight = 1.5
+
+#   Song details kept in the catalog - these are the OpenSong element names,
+#   and can be searched on as name:value
+CatalogFields = ('title', 'author', 'ccli', 'theme', 'aka', 'key', 'key_line', 'tempo', 'time_sig', 'hymn_number')
+
+#   Details which have to match exactly - the rest match if they have the
+#   searched for value anywhere in them.
+ExactCatalogFields = ('key', 'ccli', 'tempo', 'time_sig', 'hymn_number')
+
+#   Other names the details can be searched on by
+CatalogFieldNames = {
+                     'time': 'time_sig',
+                     'hymn': 'hymn_number',
+                     'keyline': 'key_line',
+                     }
+
+#   Names a chord progression can be searched on by (see SongChords.ParseProgression)
+ProgressionFieldNames = ('prog', 'progression', 'chords')
+
+#   Chord progressions are indexed by sequences of this many chords
+ProgressionGramSize = 3
+
+#   Songs are read in worker processes when there are at least this many to
+#   read - otherwise starting the workers takes longer than it saves.
+ParallelReadMinimum = 200
+
+#   How many songs a worker process reads at a time
+ReadShardSize = 250
+
+#   How often (seconds) the index is saved while songs are being read
+CheckpointInterval = 30
+
+#   How XML escapes the characters it has to - song files are scanned as they
+#   are, so these can appear either way.
+XmlEscapes = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&apos;'}
+
+#   How much of the lyrics (characters) to show before and after a search hit
+#   in a snippet
+SnippetBefore = 30
+SnippetAfter = 60
+
+#   Song files at least this big are memory mapped to be scanned - smaller ones
+#   (most of them) are quicker to just read in one go.
+ScanMapSize = 64 * 1024
+
+#   The most ways of splitting up the search text (see SongScanner._Compile)
+#   the scanner will look for - beyond that, songs are just read properly.
+ScanSplitLimit = 64
+
+#   Punctuation that comes in more than one form - curly quotes, dashes - is
+#   folded to the plain ASCII form, so it doesn't matter which was typed.
+PunctuationFolds = str.maketrans({
+                                  '‘': "'", '’': "'", '‚': "'", '‛': "'", '′': "'", '`': "'", '´': "'",
+                                  '“': '"', '”': '"', '„': '"', '‟': '"', '″': '"', '«': '"', '»': '"',
+                                  '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+                                  })
+
+#   The characters looked at when working out which characters fold to which
+#   (for SongScanner) - (first, last+1) - Latin, Greek, Cyrillic, punctuation,
+#   ligatures
+ScanVariantRanges = ((0x20, 0x250), (0x370, 0x530), (0x1E00, 0x1F00), (0x2000, 0x2070), (0xFB00, 0xFB07))
+
+#   UTF-8 combining accents (U+0300 to U+036F) - in decomposed text, accents
+#   come after the letter as separate characters
+CombiningAccentsPattern = rb'(?:\xcc[\x80-\xbf]|\xcd[\x80-\xaf])*'
+
+#   The elements of a song file the index reads
+IndexFields = ('lyrics',) + CatalogFields
+
+#   name:value or name:"value with spaces" in the search text (the value may
+#   not have been typed yet)
+CatalogTermPattern = re.compile(r'(?<!\S)(\w+):(?:"([^"]*)"?|(\S*))')
+
+
+#   Fold text for searching - the same folding is used for the index and for
+#   the typed search text.  Case is folded, accents are dropped (after
+#   splitting characters into letter + accent, NFKD - which also turns
+#   ligatures and the like into plain letters) and punctuation is folded as
+#   in PunctuationFolds.
+def FoldText(Text):
+
+    Text = Text.translate(PunctuationFolds)
+
+    # (nothing but case left to fold in plain ASCII - PunctuationFolds has
+    # ASCII in it too, '`')
+    if Text.isascii():
+        return Text.casefold()
+
+    Text = unicodedata.normalize('NFKD', Text.casefold())
+    return ''.join(Char for Char in Text if not unicodedata.combining(Char))
+
+
+#   Every character (of those likely to be in songs, see ScanVariantRanges)
+#   that folds to some text - {folded text: set of characters}.  Mostly the
+#   folded text is one character, but not always - 'ß' -> 'ss', 'ﬁ' -> 'fi'.
+_FoldVariants = None
+
+
+def FoldVariants():
+
+    global _FoldVariants
+
+    if _FoldVariants is None:
+        Variants = {}
+        for First, Last in ScanVariantRanges:
+            for CodePoint in range(First, Last):
+                Char = chr(CodePoint)
+                Variants.setdefault(FoldText(Char), set()).add(Char)
+        _FoldVariants = Variants
+
+    return _FoldVariants
+
+
+#   All the different three character sequences in (already folded) text
+def Trigrams(Folded):
+    return {Folded[Start:Start+3] for Start in range(len(Folded)-2)}
+
+
+#   The sequences of chords a chord progression is indexed by
+def ProgressionGrams(Progression):
+    return {Progression[Start:Start+ProgressionGramSize] for Start in range(len(Progression)-ProgressionGramSize+1)}
+
+
+#   Words are indexed by their trigrams for finding similar words - with the
+#   start and end marked, so that short words still have some.
+def WordTrigrams(Word):
+    return Trigrams('$'+Word+'$')
+
+
+#   How many typos we'll put up with in a word, depending on its length
+def AllowedEdits(Word):
+    if len(Word) <= 3:
+        return 0
+    if len(Word) <= 6:
+        return 1
+    return 2
+
+
+#   Levenshtein distance between two words - or Limit+1 if it's more than Limit
+def EditDistance(Word1, Word2, Limit):
+
+    if abs(len(Word1) - len(Word2)) > Limit:
+        return Limit + 1
+
+    PreviousRow = list(range(len(Word2) + 1))
+    for Position1, Char1 in enumerate(Word1, 1):
+        Row = [Position1]
+        for Position2, Char2 in enumerate(Word2, 1):
+            Row.append(min(
+                           PreviousRow[Position2] + 1,
+                           Row[Position2-1] + 1,
+                           PreviousRow[Position2-1] + (Char1 != Char2),
+                           ))
+        if min(Row) > Limit:
+            return Limit + 1
+        PreviousRow = Row
+
+    return min(PreviousRow[-1], Limit + 1)
+
+
+#   Split search text into the song details asked for (as name:value), the
+#   chord progressions asked for (as prog:progression) and the text to look
+#   for in the songs.
+#   Returns ([(detail name, folded value)],
+#            [[progressions - any one of which will do]],
+#            remaining text)
+def ParseQuery(SearchText):
+
+    CatalogTerms = []
+    ProgressionTerms = []
+
+    def CatalogTerm(Match):
+        Name = FoldText(Match.group(1))
+        Name = CatalogFieldNames.get(Name, Name)
+        Value = Match.group(2) if Match.group(2) is not None else Match.group(3)
+
+        if Name in ProgressionFieldNames:
+            if len(Value.strip()) > 0:
+                ProgressionTerms.append(ParseProgression(Value))
+            return ' '
+
+        if Name not in CatalogFields:
+            # Not one of ours - leave it as text to search for
+            return Match.group(0)
+
+        Value = FoldText(Value).strip()
+        if len(Value) > 0:
+            CatalogTerms.append((Name, Value))
+        return ' '
+
+    Text = CatalogTermPattern.sub(CatalogTerm, SearchText)
+
+    return CatalogTerms, ProgressionTerms, Text
+
+
+#   Does a catalog entry have all the details asked for?
+def CatalogMatches(Fields, CatalogTerms):
+
+    for Name, Value in CatalogTerms:
+        FieldValue = FoldText(Fields.get(Name, '')).strip()
+        if Name in ExactCatalogFields:
+            if FieldValue != Value:
+                return False
+        elif Value not in FieldValue:
+            return False
+
+    return True
+
+
+#   Does a song's chord progression have all the progressions asked for?
+def ProgressionMatches(Progression, ProgressionTerms):
+
+    for Progressions in ProgressionTerms:
+        if not any(Wanted in Progression for Wanted in Progressions):
+            return False
+
+    return True
+
+
+#   The text a song is found by - its file name, title and lyrics - folded
+def SongSearchText(FileName, Title, Text):
+    return FoldText(os.path.basename(FileName)+'\n'+Title+'\n'+Text)
+
+
+#   Add a song to trigram, word and chord progression song lists (of the
+#   index, or of a shard being read by a worker process).
+#   Returns the words that weren't in the word list before.
+def AddPostings(TrigramIndex, WordIndex, ProgressionIndex, SongNumber, Folded, Progression):
+
+    for Trigram in Trigrams(Folded):
+        try:
+            TrigramIndex[Trigram].append(SongNumber)
+        except KeyError:
+            TrigramIndex[Trigram] = array('i', (SongNumber,))
+
+    NewWords = []
+    for Word in set(WordPattern.findall(Folded)):
+        try:
+            WordIndex[Word].append(SongNumber)
+        except KeyError:
+            WordIndex[Word] = array('i', (SongNumber,))
+            NewWords.append(Word)
+
+    for Chords in ProgressionGrams(Progression):
+        try:
+            ProgressionIndex[Chords].append(SongNumber)
+        except KeyError:
+            ProgressionIndex[Chords] = array('i', (SongNumber,))
+
+    return NewWords
+
+
+#   Read a shard of song files - run in a worker process when building the
+#   index.  The songs are numbered from FirstSongNumber, in the order given.
+#   Returns ([(Title, Text, Fields, Progression, folded text) for each song],
+#            trigram song lists, word song lists, chord progression song lists)
+def ReadSongShard(FileNames, FirstSongNumber):
+
+    Songs = []
+    TrigramIndex, WordIndex, ProgressionIndex = {}, {}, {}
+
+    for Offset, FileName in enumerate(FileNames):
+        Title, Text, Fields, Progression = ReadSongForIndex(FileName)
+        Folded = SongSearchText(FileName, Title, Text)
+        AddPostings(TrigramIndex, WordIndex, ProgressionIndex, FirstSongNumber + Offset, Folded, Progression)
+        Songs.append((Title, Text, Fields, Progression, Folded))
+
+    return Songs, TrigramIndex, WordIndex, ProgressionIndex
+
+
+#   A copy of a trigram / word / progression index - {key: copy of its array
+#   (or list)}
+def CopyPostings(Index):
+    return {Key: Postings[:] for Key, Postings in Index.items()}
+
+
+#   An index entry for a song
+def SongEntry(FileStat, Title, Text, Fields, Progression):
+    return {
+            'size': FileStat.st_size,
+            'mtime': FileStat.st_mtime,
+            'inode': FileStat.st_ino,
+            'title': Title,
+            'text': Text,
+            'fields': Fields,
+            'progression': Progression,
+            }
+
+
+#   Read a song file and pull out the text we want to be able to search on
+#   - see SongForIndex.
+def ReadSongForIndex(FileName):
+
+    try:
+        SongFields = ReadSongFields(FileName, IndexFields)
+    except OSError:
+        print(FileName+" error")
+        SongFields = {}
+    except:
+        # Not a song file we understand - it can still be found by its file name.
+        SongFields = {}
+
+    return SongForIndex(SongFields)
+
+
+#   As ReadSongForIndex - for a song file already read (or memory mapped)
+def ParseSongForIndex(SongData):
+
+    try:
+        SongFields = ParseSongFields(SongData, IndexFields)
+    except:
+        SongFields = {}
+
+    return SongForIndex(SongFields)
+
+
+#   The text we want to be able to search on, from a song's details (see
+#   IndexFields) i.e. the song title and the lyrics (chord lines are left
+#   out), and the song's details for the catalog and its chord progression
+#   Returns (Title, Text, {detail name: value}, progression) - empty details
+#   are left out
+def SongForIndex(SongFields):
+
+    Title = (SongFields.get('title') or '').strip()
+    Lyrics = SongFields.get('lyrics') or ''
+
+    Fields = {}
+    for Name in CatalogFields:
+        Value = (SongFields.get(Name) or '').strip()
+        if len(Value) > 0:
+            Fields[Name] = Value
+
+    # Drop the chord lines - we only want the words.
+    LyricLines = []
+    for TextLine in Lyrics.split('\n'):
+        if len(TextLine) > 0 and TextLine[0] == '.':
+            continue
+        LyricLines.append(TextLine.strip())
+
+    return Title, '\n'.join(LyricLines).strip(), Fields, SongProgression(Lyrics, Fields.get('key', ''))
+
+
+#   Searching song files that aren't in the index yet - without reading them
+#   into strings.  The search text is looked for in the raw bytes (in the
+#   encoding the song file says it's in - or, if it doesn't say, as UTF-8 or
+#   the local encoding - in any case, with or without accents, and allowing
+#   for XML escapes) - big files are memory mapped rather than read - so for
+#   most songs nothing is decoded or folded at all.
+#   The bytes can match where the song doesn't (in a chord line or a tag, say)
+#   so a song that does is read properly and checked as the index would.
+#   Songs in encodings the bytes can't be searched in that way (UTF-16,
+#   UTF-32) are always read properly.
+class SongScanner(object):
+
+    #   Folded - the folded search text, as for the index
+    def __init__(self, Folded, CatalogTerms=(), ProgressionTerms=()):
+
+        self.Folded = Folded
+        self.CatalogTerms = CatalogTerms
+        self.ProgressionTerms = ProgressionTerms
+
+        # For songs that don't say what encoding they're in (see SongReader)
+        self.Encodings = ['utf-8']
+        try:
+            LocalEncoding = codecs.lookup(locale.getpreferredencoding(False)).name
+            if LocalEncoding != 'utf-8':
+                self.Encodings.append(LocalEncoding)
+        except:
+            pass
+
+        self.Pattern = self._Compile(Folded, self.Encodings)
+
+        # Encoding -> pattern for songs that say they're in it (None if the
+        # bytes can't be searched)
+        self._Patterns = {}
+
+    #   The pattern for the folded search text in any of the encodings - or
+    #   None if there are too many ways the song could have it (see
+    #   ScanSplitLimit), and songs have to be read properly.
+    #
+    #   Some characters in the song fold to more than one of the search text's
+    #   - 'ß' to 'ss', 'ﬁ' to 'fi' - so the search text is split up every way
+    #   it can be, into single characters and runs of characters something
+    #   folds to: 'sss' could be 'sss', 'ßs' or 'sß'.  The search text can also
+    #   start or end part way through such a run - 'stras' is in 'straße'.
+    @staticmethod
+    def _Compile(Folded, Encodings):
+
+        Runs = {Run: Chars for Run, Chars in FoldVariants().items() if len(Run) > 1}
+
+        # Start -> (pattern for the search text from there on, how many ways
+        # of splitting it up that is)
+        Splits = {len(Folded): (b'', 1)}
+
+        for Start in range(len(Folded) - 1, -1, -1):
+            Ways = [(SongScanner._CharPattern(Folded[Start], Encodings), Start + 1)]
+
+            for Run, Chars in Runs.items():
+                # (the search text can only start part way into a run)
+                for Cut in range(len(Run) if Start == 0 else 1):
+                    RunPart = Run[Cut:]
+                    if Folded.startswith(RunPart, Start):
+                        Ways.append((SongScanner._RunPattern(Chars, Encodings), Start + len(RunPart)))
+                    elif RunPart.startswith(Folded[Start:]):
+                        # (or end part way into one)
+                        Ways.append((SongScanner._RunPattern(Chars, Encodings), len(Folded)))
+
+            Patterns = [Pattern + Splits[End][0] for Pattern, End in Ways]
+            Count = sum(Splits[End][1] for Pattern, End in Ways)
+            if Count > ScanSplitLimit:
+                return None
+
+            if len(Patterns) == 1:
+                Splits[Start] = (Patterns[0], Count)
+            else:
+                Splits[Start] = (b'(?:' + b'|'.join(Patterns) + b')', Count)
+
+        return re.compile(Splits[0][0], re.IGNORECASE)
+
+    #   A pattern for a character in the song that folds to a run of the
+    #   search text's characters
+    @staticmethod
+    def _RunPattern(Chars, Encodings):
+        return b'(?:' + SongScanner._Alternatives(Chars, Encodings) + b')' + CombiningAccentsPattern
+
+    #   The pattern to look for in a song file, from the start of the file -
+    #   or None if the song has to be read properly.
+    def _PatternFor(self, Head):
+
+        Encoding = SongEncoding(Head)
+        if Encoding == 'utf-8-sig':
+            Encoding = 'utf-8'
+        if Encoding is None or Encoding in self.Encodings:
+            return self.Pattern
+
+        if Encoding not in self._Patterns:
+            Pattern = None
+            try:
+                # Only encodings with ASCII as it is - the tags and XML
+                # escapes have to look the same as they do in UTF-8.
+                if '<song>&;'.encode(Encoding) == b'<song>&;':
+                    Pattern = self._Compile(self.Folded, [Encoding])
+            except:
+                pass
+            self._Patterns[Encoding] = Pattern
+
+        return self._Patterns[Encoding]
+
+    #   A pattern for one character of the (folded) search text - matching
+    #   each character that folds to it, in each encoding it could be in,
+    #   followed by any accents.
+    @staticmethod
+    def _CharPattern(Char, Encodings):
+
+        Variants = {Char, Char.upper(), Char.title()}
+        Variants.update(FoldVariants().get(Char, ()))
+
+        return b'(?:' + SongScanner._Alternatives(Variants, Encodings) + b')' + CombiningAccentsPattern
+
+    #   Any of the characters, in any of the encodings, or XML escaped
+    @staticmethod
+    def _Alternatives(Variants, Encodings):
+
+        Variants = set(Variants)
+        Variants.update([XmlEscapes[Variant] for Variant in Variants if Variant in XmlEscapes])
+
+        Alternatives = set()
+        for Variant in Variants:
+            for Encoding in Encodings:
+                try:
+                    Alternatives.add(re.escape(Variant.encode(Encoding)))
+                except:
+                    pass
+
+        return b'|'.join(sorted(Alternatives, key=len, reverse=True))
+
+    #   Does the song file have the search text (and details) in it?
+    def Matches(self, FileName):
+
+        InName = self.Folded in FoldText(os.path.basename(FileName))
+
+        try:
+            with open(FileName, 'rb') as myfile:
+                if os.fstat(myfile.fileno()).st_size < ScanMapSize:
+                    SongData = myfile.read()
+                    Pattern = self._PatternFor(SongData[:ReadChunkSize])
+                    if not InName and Pattern is not None and Pattern.search(SongData) is None:
+                        return False
+                    Title, Text, Fields, Progression = ParseSongForIndex(SongData)
+                else:
+                    with mmap.mmap(myfile.fileno(), 0, access=mmap.ACCESS_READ) as Mapped:
+                        Pattern = self._PatternFor(Mapped[:ReadChunkSize])
+                        if not InName and Pattern is not None and Pattern.search(Mapped) is None:
+                            return False
+                        Title, Text, Fields, Progression = ParseSongForIndex(Mapped)
+        except:
+            return False
+
+        return (self.Folded in SongSearchText(FileName, Title, Text)
+                and CatalogMatches(Fields, self.CatalogTerms)
+                and ProgressionMatches(Progression, self.ProgressionTerms))
+
+    #   The song files (in the order given) with the search text in them -
+    #   or None if Cancelled returns True part way through.
+    #   Found - as for SongIndex.Search
+    def Scan(self, FileNames, Cancelled, Found=None):
+
+        Results = []
+        for FileName in FileNames:
+            if Cancelled():
+                return None
+            if self.Matches(FileName):
+                Results.append(FileName)
+                ReportFound(Found, Results, len(Results) - 1)
+
+        return Results
+
+
+#   Pass on the songs found since last time, if anyone wants to know (see
+#   SongIndex.Search) - returns how many have now been passed on.
+def ReportFound(Found, Results, Reported):
+    if Found is not None and len(Results) > Reported:
+        Found(Results[Reported:])
+    return len(Results)
+
+
+#   Where a position in folded text is in the text before it was folded - they
+#   only differ if folding changed the length of something (e.g. 'ß' -> 'ss',
+#   or an accent dropped).
+def UnfoldedOffset(Text, FoldedOffset):
+
+    FoldedLength = 0
+    for Offset, Char in enumerate(Text):
+        if FoldedLength >= FoldedOffset:
+            return Offset
+        FoldedLength += len(FoldText(Char))
+
+    return len(Text)
+
+
+#   Is the file (or directory) somewhere below the directory?
+def UnderDirectory(FileName, Directory):
+    if not FileName.startswith(Directory) or len(FileName) == len(Directory):
+        return False
+    return Directory[-1] in '/\\' or FileName[len(Directory)] in '/\\'
+
+
+#   Is the file (or directory) directly inside the directory?
+#   (Paths are built as directory+separator+name, so the directory may or may
+#   not end with a separator, and there may be a doubled separator.)
+def InDirectory(FileName, Directory):
+    if not UnderDirectory(FileName, Directory):
+        return False
+    Name = FileName[len(Directory):].lstrip('/\\')
+    return '/' not in Name and '\\' not in Name
+
+
+class SongIndex(object):
+
+    def __init__(self, IndexFileName):
+
+        self.IndexFileName = IndexFileName
+        self.SearchFileName = os.path.splitext(IndexFileName)[0]+SongSearchFileExtension
+
+        # Full path -> {'size', 'mtime', 'inode', 'title', 'text', 'fields', 'progression'}
+        self._Entries = {}
+
+        # Full path -> folded searchable text (file name, title and lyrics)
+        self._Folded = {}
+
+        # Trigram -> array of the numbers of the songs containing it
+        self._Trigrams = {}
+
+        # Word -> array of the numbers of the songs containing it
+        self._Words = {}
+
+        # Word trigram -> list of the words containing it
+        self._WordTrigrams = {}
+
+        # Sequence of chords (ProgressionGramSize of them, as in the songs'
+        # progressions) -> array of the numbers of the songs containing it
+        self._Progressions = {}
+
+        # Full path -> song number, and song number -> full path (songs that
+        # have been taken out are no longer in either)
+        self._SongNumbers = {}
+        self._SongPaths = {}
+        self._NextSongNumber = 0
+
+        # Set when the trigram / word indexes have had to be built from
+        # scratch, and haven't been saved yet.
+        self._SearchDataUnsaved = False
+
+        # inode -> full path - lets us spot a song that has just been renamed
+        self._Inodes = {}
+
+        # Directory -> {'mtime', 'files', 'dirs'} - the songs and sub directories
+        # found in each directory of the song directory, and the directory's
+        # modification time when it was listed.
+        self._Manifest = {}
+
+        # Folded search text -> sorted tuple of matching songs, most recently
+        # used last.  Emptied whenever the index changes.
+        self._QueryCache = OrderedDict()
+
+        self._Lock = threading.RLock()
+
+        # Only one refresh of the whole song directory at a time - and while
+        # one is going on, taken out songs aren't cleared out of the trigram /
+        # word indexes (it has song numbers set aside).
+        self._RefreshLock = threading.Lock()
+        self._Refreshing = False
+
+        # Songs found by the refresh that haven't been read into the index
+        # yet (in the order they'll be read) - searches scan them instead.
+        self._Unread = {}
+
+        self.Load()
+
+    #   Pull in a previously saved index - if there's a problem, start empty.
+    def Load(self):
+
+        with self._Lock:
+            self._Load()
+
+    def _Load(self):
+
+        try:
+            with open(self.IndexFileName, 'r', encoding="utf8") as f:
+                IndexData = json.load(f)
+
+            if IndexData['version'] == SongIndexVersion:
+                for FileName, Entry in IndexData['entries'].items():
+                    self._AddEntry(FileName, Entry, False)
+                self._Manifest = IndexData['directories']
+
+                if not self._LoadSearchData(IndexData.get('stamp')):
+                    self._RebuildSearchData()
+                    self._SearchDataUnsaved = len(self._Entries) > 0
+
+        except:
+            self._Entries = {}
+            self._Folded = {}
+            self._Inodes = {}
+            self._ClearSearchData()
+            self._Manifest = {}
+
+        self._QueryCache.clear()
+
+    #   Pick up the saved trigram / word indexes - only if they were saved along
+    #   with the index file (both have the same stamp) and so match the entries.
+    #   Returns True if it was loaded.
+    def _LoadSearchData(self, Stamp):
+
+        try:
+            with open(self.SearchFileName, 'rb') as f:
+                SearchData = pickle.load(f)
+
+            if SearchData['version'] != SongIndexVersion or Stamp is None or SearchData['stamp'] != Stamp:
+                return False
+
+            SongPaths = SearchData['songs']
+            if len(SongPaths) != len(self._Entries) or any(FileName not in self._Entries for FileName in SongPaths.values()):
+                return False
+
+            self._Trigrams = SearchData['trigrams']
+            self._Words = SearchData['words']
+            self._WordTrigrams = SearchData['wordtrigrams']
+            self._Progressions = SearchData['progressions']
+            self._SongPaths = SongPaths
+            self._SongNumbers = {FileName: SongNumber for SongNumber, FileName in SongPaths.items()}
+            self._NextSongNumber = SearchData['next']
+            return True
+
+        except:
+            return False
+
+    #   Write the index out - write to a temp file first so we never leave
+    #   a half written index behind.
+    def Save(self):
+
+        Stamp = repr(time.time())
+
+        with self._Lock:
+            IndexData = {
+                         'version': SongIndexVersion,
+                         'stamp': Stamp,
+                         'entries': dict(self._Entries),
+                         'directories': dict(self._Manifest),
+                         }
+
+            # The arrays are added to as songs come in - copy them now (much
+            # quicker than pickling them), and pickle the copies once the
+            # lock's been let go, so searches aren't held up.
+            SearchData = {
+                          'version': SongIndexVersion,
+                          'stamp': Stamp,
+                          'songs': dict(self._SongPaths),
+                          'next': self._NextSongNumber,
+                          'trigrams': CopyPostings(self._Trigrams),
+                          'words': CopyPostings(self._Words),
+                          'wordtrigrams': CopyPostings(self._WordTrigrams),
+                          'progressions': CopyPostings(self._Progressions),
+                          }
+            self._SearchDataUnsaved = False
+
+        try:
+            SearchData = pickle.dumps(SearchData, pickle.HIGHEST_PROTOCOL)
+
+            TempFileName = self.SearchFileName+'.tmp'
+            with open(TempFileName, 'wb') as f:
+                f.write(SearchData)
+            os.replace(TempFileName, self.SearchFileName)
+
+            TempFileName = self.IndexFileName+'.tmp'
+            with open(TempFileName, 'w', encoding="utf8") as f:
+                json.dump(IndexData, f)
+            os.replace(TempFileName, self.IndexFileName)
+        except:
+            print("Unable to save song index "+self.IndexFileName)
+
+    #   Bring the index up to date with the song directory - only songs that
+    #   are new, or have changed size / modification time are re-read.
+    #   Directories that haven't changed since they were last listed are
+    #   skipped, unless Full is set - then every song is checked.
+    #   Progress  - optional function, called with (songs read, songs to read)
+    #               as the songs are read
+    #   Cancelled - optional function, checked as the songs are read - if it
+    #               returns True, the refresh stops (what's been read so far is
+    #               kept, and saved)
+    #   Searches can carry on while the songs are being read.
+    #   Returns (Added, Updated, Removed) lists of song files.
+    def Refresh(self, SongDirectory, Full=False, Progress=None, Cancelled=None):
+
+        if Progress is None:
+            Progress = lambda Done, Total: None
+        if Cancelled is None:
+            Cancelled = lambda: False
+
+        with self._RefreshLock:
+
+            # Go through the song directory without holding the lock - with a
+            # big library, listing the directories and looking at every song
+            # takes a while, and searches carry on meanwhile.
+            with self._Lock:
+                OldManifest = self._Manifest
+
+            Manifest = {}
+            Found = []
+            self._ScanTree(SongDirectory, Manifest, Found, None if Full else OldManifest)
+
+            with self._Lock:
+                Added, Updated, Removed = [], [], []
+                SeenFiles = set()
+                ToRead = []
+                self._Manifest = Manifest
+                self._Refreshing = True
+
+                self._RefreshFound(Found, SeenFiles, Added, Updated, Removed, ToRead)
+
+                for FileName in list(self._Entries):
+                    if FileName not in SeenFiles:
+                        self._RemoveFile(FileName)
+                        Removed.append(FileName)
+
+                FirstSongNumber = self._SetAside(ToRead)
+
+            Added, Updated, Removed = self._ReadSetAside(ToRead, FirstSongNumber, Added, Updated, Removed, Progress, Cancelled)
+
+        Changed = len(Added) > 0 or len(Updated) > 0 or len(Removed) > 0 or self._Manifest != OldManifest
+        if Changed or self._SearchDataUnsaved:
+            self.Save()
+
+        return Added, Updated, Removed
+
+    #   Look for songs that have been changed in place - without their
+    #   directory's modification time changing, so Refresh (unless Full) and
+    #   the directory watcher don't notice, e.g. when edited while the program
+    #   wasn't running.  Each indexed song is stat'ed (the directories aren't
+    #   listed again) and those that have changed are re-read.
+    #   Progress, Cancelled - as for Refresh
+    #   Returns (Added, Updated, Removed) lists of song files.
+    def CheckFiles(self, Progress=None, Cancelled=None):
+
+        if Progress is None:
+            Progress = lambda Done, Total: None
+        if Cancelled is None:
+            Cancelled = lambda: False
+
+        with self._RefreshLock:
+
+            with self._Lock:
+                Known = [(FileName, Entry['size'], Entry['mtime']) for FileName, Entry in self._Entries.items()]
+
+            # (without holding the lock - as for Refresh)
+            Changed = []
+            for Count, (FileName, Size, ModifiedTime) in enumerate(Known):
+                if Count % SearchCheckInterval == 0 and Cancelled():
+                    return [], [], []
+                try:
+                    FileStat = os.stat(FileName)
+                except OSError:
+                    # Gone - its directory has changed, the watcher sees to it.
+                    continue
+                if FileStat.st_size != Size or FileStat.st_mtime != ModifiedTime:
+                    Changed.append((FileName, FileStat))
+
+            with self._Lock:
+                Added, Updated, Removed = [], [], []
+                ToRead = []
+                self._Refreshing = True
+                self._RefreshFound(Changed, set(), Added, Updated, Removed, ToRead)
+                FirstSongNumber = self._SetAside(ToRead)
+
+            Added, Updated, Removed = self._ReadSetAside(ToRead, FirstSongNumber, Added, Updated, Removed, Progress, Cancelled)
+
+        if len(Added) > 0 or len(Updated) > 0 or len(Removed) > 0:
+            self.Save()
+
+        return Added, Updated, Removed
+
+    #   Set aside song numbers for the songs a refresh is going to read -
+    #   searches scan them until they've been read.
+    #   Returns the first song number.
+    def _SetAside(self, ToRead):
+
+        FirstSongNumber = self._NextSongNumber
+        self._NextSongNumber += len(ToRead)
+        self._Unread = dict.fromkeys(FileName for FileName, FileStat in ToRead)
+
+        return FirstSongNumber
+
+    #   Read the songs set aside by a refresh (see _SetAside), and work out
+    #   what's actually changed - songs that haven't been read (because we
+    #   were cancelled) aren't in the index, changed songs were taken out to
+    #   be re-read.
+    #   Returns (Added, Updated, Removed) lists of song files.
+    def _ReadSetAside(self, ToRead, FirstSongNumber, Added, Updated, Removed, Progress=None, Cancelled=None):
+
+        if Progress is None:
+            Progress = lambda Done, Total: None
+        if Cancelled is None:
+            Cancelled = lambda: False
+
+        try:
+            Read = self._ReadSongs(ToRead, FirstSongNumber, Progress, Cancelled)
+        finally:
+            with self._Lock:
+                self._Refreshing = False
+                self._Unread = {}
+                self._PurgeSearchData()
+
+        Removed = Removed + [FileName for FileName in Updated if FileName not in Read]
+        Added = [FileName for FileName in Added if FileName in Read or FileName in self._Entries]
+        Updated = [FileName for FileName in Updated if FileName in Read]
+
+        return Added, Updated, Removed
+
+    #   Read the songs found by a refresh - (file name, stat) pairs - shared
+    #   out between worker processes if there are enough of them.
+    #   Returns the set of songs read.
+    def _ReadSongs(self, ToRead, FirstSongNumber, Progress, Cancelled):
+
+        Read = set()
+        if len(ToRead) == 0:
+            return Read
+
+        Shards = [ToRead[Start:Start+ReadShardSize] for Start in range(0, len(ToRead), ReadShardSize)]
+        ShardFiles = [[FileName for FileName, FileStat in Shard] for Shard in Shards]
+        ShardNumbers = [FirstSongNumber + ShardNo * ReadShardSize for ShardNo in range(len(Shards))]
+
+        Executor = None
+        if len(ToRead) >= ParallelReadMinimum and (os.cpu_count() or 1) > 1:
+            try:
+                Executor = ProcessPoolExecutor()
+                Results = Executor.map(ReadSongShard, ShardFiles, ShardNumbers)
+            except:
+                print("Unable to start worker processes - reading songs here")
+                Executor = None
+
+        if Executor is None:
+            Results = map(ReadSongShard, ShardFiles, ShardNumbers)
+
+        LastSave = time.time()
+        ShardNo = 0
+        try:
+            while ShardNo < len(Shards) and not Cancelled():
+                try:
+                    Result = next(Results)
+                except StopIteration:
+                    break
+                except:
+                    # A worker process has fallen over - read the rest here.
+                    print("Problem in worker process - reading songs here")
+                    Results = map(ReadSongShard, ShardFiles[ShardNo:], ShardNumbers[ShardNo:])
+                    continue
+
+                with self._Lock:
+                    self._MergeShard(Shards[ShardNo], ShardNumbers[ShardNo], Result)
+
+                Read.update(ShardFiles[ShardNo])
+                ShardNo += 1
+                Progress(len(Read), len(ToRead))
+
+                if time.time() - LastSave > CheckpointInterval:
+                    self.Save()
+                    LastSave = time.time()
+        finally:
+            if Executor is not None:
+                Executor.shutdown(wait=False, cancel_futures=True)
+
+        return Read
+
+    #   Put a shard of songs read by ReadSongShard into the index
+    def _MergeShard(self, Shard, FirstSongNumber, Result):
+
+        Songs, TrigramIndex, WordIndex, ProgressionIndex = Result
+
+        for Offset, ((FileName, FileStat), (Title, Text, Fields, Progression, Folded)) in enumerate(zip(Shard, Songs)):
+            self._RemoveFile(FileName)
+
+            Entry = SongEntry(FileStat, Title, Text, Fields, Progression)
+            self._Entries[FileName] = Entry
+            self._Inodes[Entry['inode']] = FileName
+            self._Folded[FileName] = Folded
+
+            SongNumber = FirstSongNumber + Offset
+            self._SongNumbers[FileName] = SongNumber
+            self._SongPaths[SongNumber] = FileName
+            self._Unread.pop(FileName, None)
+
+        for Trigram, SongNumbers in TrigramIndex.items():
+            if Trigram in self._Trigrams:
+                self._Trigrams[Trigram].extend(SongNumbers)
+            else:
+                self._Trigrams[Trigram] = SongNumbers
+
+        for Word, SongNumbers in WordIndex.items():
+            if Word in self._Words:
+                self._Words[Word].extend(SongNumbers)
+            else:
+                self._Words[Word] = SongNumbers
+                self._AddWord(Word)
+
+        for Chords, SongNumbers in ProgressionIndex.items():
+            if Chords in self._Progressions:
+                self._Progressions[Chords].extend(SongNumbers)
+            else:
+                self._Progressions[Chords] = SongNumbers
+
+        self._QueryCache.clear()
+
+    #   Bring the index up to date for a single directory - used when we're
+    #   told something in the directory has changed.  Sub directories that are
+    #   new are scanned, sub directories that have gone are dropped.
+    #   As for Refresh, the songs are read without holding the lock.
+    #   Returns (Added, Updated, Removed) lists of song files.
+    def RefreshDirectory(self, Directory):
+
+        Added, Updated, Removed = [], [], []
+
+        with self._RefreshLock:
+
+            if not os.path.isdir(Directory):
+                with self._Lock:
+                    Removed = self._RemoveDirectory(Directory)
+                return Added, Updated, Removed
+
+            # List the directory (and any new sub directories) first, then bring
+            # the index up to date with what was found.
+            with self._Lock:
+                KnownDirectories = set(self._Manifest)
+
+            Manifest = {}
+            Found = []
+            SubDirectories = self._ListDirectory(Directory, Manifest, Found)
+
+            for SubDirectory in SubDirectories:
+                # Already known sub directories look after themselves.
+                if SubDirectory not in KnownDirectories:
+                    self._ScanTree(SubDirectory, Manifest, Found, None)
+
+            with self._Lock:
+
+                self._Manifest.update(Manifest)
+
+                SeenFiles = set()
+                ToRead = []
+                self._Refreshing = True
+                self._RefreshFound(Found, SeenFiles, Added, Updated, Removed, ToRead)
+
+                for FileName in list(self._Entries):
+                    if FileName not in SeenFiles and InDirectory(FileName, Directory):
+                        self._RemoveFile(FileName)
+                        Removed.append(FileName)
+
+                for SubDirectory in list(self._Manifest):
+                    if InDirectory(SubDirectory, Directory) and SubDirectory not in SubDirectories:
+                        Removed.extend(self._RemoveDirectory(SubDirectory))
+
+                FirstSongNumber = self._SetAside(ToRead)
+
+            return self._ReadSetAside(ToRead, FirstSongNumber, Added, Updated, Removed)
+
+    #   Bring the index up to date for a single song file
+    #   Returns (Added, Updated, Removed) lists of song files.
+    def RefreshFile(self, FileName):
+
+        Added, Updated, Removed = [], [], []
+
+        with self._RefreshLock:
+            try:
+                FileStat = os.stat(FileName)
+            except OSError:
+                FileStat = None
+
+            with self._Lock:
+                ToRead = []
+                self._Refreshing = True
+
+                if FileStat is not None:
+                    self._RefreshFile(FileName, FileStat, Added, Updated, Removed, ToRead)
+                elif FileName in self._Entries:
+                    self._RemoveFile(FileName)
+                    Removed.append(FileName)
+
+                FirstSongNumber = self._SetAside(ToRead)
+
+            return self._ReadSetAside(ToRead, FirstSongNumber, Added, Updated, Removed)
+
+    #   All the directories in the song directory (as found by the last refresh)
+    def Directories(self):
+        with self._Lock:
+            return sorted(self._Manifest)
+
+    #   What's directly inside a directory (as found by the last refresh)
+    #   Returns (sub directories, song files) - as full paths.
+    def DirectoryContents(self, Directory):
+        with self._Lock:
+            Known = self._Manifest.get(Directory)
+            if Known is None:
+                return [], []
+            SubDirectories = sorted(os.path.join(Directory, Name) for Name in Known['dirs'] if os.path.join(Directory, Name) in self._Manifest)
+            Files = sorted(Directory+os.path.sep+Name for Name in Known['files'] if Directory+os.path.sep+Name in self._Entries)
+            return SubDirectories, Files
+
+    #   Go through all the directories in and below a directory, finding the
+    #   song files.  This only looks at the index (to see which songs it
+    #   already has), it doesn't change it - so it's done without holding the
+    #   lock, and what's found is applied afterwards by _RefreshFound.
+    #   Manifest    - what's in each directory is recorded in it.
+    #   Found       - (file name, stat) is added to it for each song file.  The
+    #                 stat is None for songs the index already has, in
+    #                 directories that haven't changed.
+    #   OldManifest - if given, directories whose modification time matches the
+    #                 manifest aren't listed again, the manifest is used instead.
+    def _ScanTree(self, Directory, Manifest, Found, OldManifest):
+
+        Known = None
+        if OldManifest is not None:
+            Known = OldManifest.get(Directory)
+
+        if Known is not None:
+            try:
+                DirectoryTime = os.stat(Directory).st_mtime
+            except OSError:
+                return
+
+            if Known['mtime'] == DirectoryTime:
+                # Nothing added, removed or renamed here since last time.
+                Manifest[Directory] = Known
+
+                for Name in Known['files']:
+                    FileName = Directory+os.path.sep+Name
+                    if FileName in self._Entries:
+                        Found.append((FileName, None))
+                        continue
+
+                    try:
+                        Found.append((FileName, os.stat(FileName)))
+                    except OSError:
+                        pass
+
+                SubDirectories = [os.path.join(Directory, Name) for Name in Known['dirs']]
+            else:
+                SubDirectories = self._ListDirectory(Directory, Manifest, Found)
+        else:
+            SubDirectories = self._ListDirectory(Directory, Manifest, Found)
+
+        for SubDirectory in SubDirectories:
+            self._ScanTree(SubDirectory, Manifest, Found, OldManifest)
+
+    #   List a directory, finding the song files (see _ScanTree), and record
+    #   what's in it in Manifest.  Returns the sub directories (but doesn't go
+    #   into them)
+    def _ListDirectory(self, Directory, Manifest, Found):
+
+        Files = []
+        SubDirectoryNames = []
+
+        try:
+            DirectoryTime = os.stat(Directory).st_mtime
+
+            # scandir gives us the file type for free, and the stat information
+            # is picked up once and re-used (on Windows it comes with the listing)
+            with os.scandir(Directory) as DirectoryEntries:
+                for DirEntry in DirectoryEntries:
+
+                    # dont follow links
+                    if DirEntry.is_dir(follow_symlinks=False):
+                        SubDirectoryNames.append(DirEntry.name)
+                        continue
+
+                    if ".xml" not in DirEntry.name or not DirEntry.is_file():
+                        continue
+
+                    try:
+                        FileStat = DirEntry.stat()
+                    except OSError:
+                        continue
+
+                    Files.append(DirEntry.name)
+                    Found.append((Directory+os.path.sep+DirEntry.name, FileStat))
+
+        except OSError:
+            return []
+
+        Manifest[Directory] = {'mtime': DirectoryTime, 'files': Files, 'dirs': SubDirectoryNames}
+
+        return [os.path.join(Directory, Name) for Name in SubDirectoryNames]
+
+    #   Bring the index up to date with the song files found by _ScanTree -
+    #   adding new / changed songs (a song that's been renamed or moved is
+    #   added under its new name and removed under its old one).
+    #   ToRead - new / changed songs are added to it, to be read once the lock
+    #            has been let go (see _SetAside).
+    def _RefreshFound(self, Found, SeenFiles, Added, Updated, Removed, ToRead):
+
+        for FileName, FileStat in Found:
+            SeenFiles.add(FileName)
+            if FileStat is None and FileName in self._Entries:
+                continue
+            self._RefreshFile(FileName, FileStat, Added, Updated, Removed, ToRead)
+
+    def _RefreshFile(self, FileName, FileStat, Added, Updated, Removed, ToRead):
+
+        if FileStat is None:
+            try:
+                FileStat = os.stat(FileName)
+            except OSError:
+                return
+
+        Entry = self._Entries.get(FileName)
+        if Entry is not None and Entry['size'] == FileStat.st_size and Entry['mtime'] == FileStat.st_mtime:
+            return
+
+        if Entry is None:
+            OldFileName = self._Renamed(FileName, FileStat)
+            if OldFileName is not None:
+                Added.append(FileName)
+                Removed.append(OldFileName)
+                return
+
+        # Take it out until it's been re-read
+        self._RemoveFile(FileName)
+        ToRead.append((FileName, FileStat))
+
+        if Entry is None:
+            Added.append(FileName)
+        else:
+            Updated.append(FileName)
+
+    #   Is this new file one we already know, that's just been renamed (or moved)?
+    #   If so move its entry across - no need to read the file again.
+    #   Returns the song's old file name - or None if it isn't a renamed song.
+    def _Renamed(self, FileName, FileStat):
+
+        if FileStat.st_ino == 0:
+            return None
+
+        OldFileName = self._Inodes.get(FileStat.st_ino)
+        if OldFileName is None or os.path.exists(OldFileName):
+            return None
+
+        Entry = self._Entries[OldFileName]
+        if Entry['size'] != FileStat.st_size or Entry['mtime'] != FileStat.st_mtime:
+            return None
+
+        self._RemoveFile(OldFileName)
+        self._AddEntry(FileName, Entry)
+        return OldFileName
+
+    #   A directory has gone - take out everything that was in it.
+    def _RemoveDirectory(self, Directory):
+
+        Removed = []
+
+        for FileName in list(self._Entries):
+            if UnderDirectory(FileName, Directory):
+                self._RemoveFile(FileName)
+                Removed.append(FileName)
+
+        for SubDirectory in list(self._Manifest):
+            if SubDirectory == Directory or UnderDirectory(SubDirectory, Directory):
+                del self._Manifest[SubDirectory]
+
+        return Removed
+
+    #   (Re-)index a single song file
+    def UpdateFile(self, FileName, FileStat=None):
+
+        if FileStat is None:
+            FileStat = os.stat(FileName)
+
+        Title, Text, Fields, Progression = ReadSongForIndex(FileName)
+
+        Entry = SongEntry(FileStat, Title, Text, Fields, Progression)
+
+        with self._Lock:
+            self.RemoveFile(FileName)
+            self._AddEntry(FileName, Entry)
+
+    #   Take a song file out of the index
+    def RemoveFile(self, FileName):
+
+        with self._Lock:
+            self._RemoveFile(FileName)
+
+    def _RemoveFile(self, FileName):
+
+        if FileName not in self._Entries:
+            return
+
+        # The song's number is left in the trigram / word indexes - it's
+        # skipped now it doesn't lead anywhere.
+        del self._SongPaths[self._SongNumbers.pop(FileName)]
+
+        Inode = self._Entries[FileName]['inode']
+        if self._Inodes.get(Inode) == FileName:
+            del self._Inodes[Inode]
+
+        del self._Entries[FileName]
+        del self._Folded[FileName]
+        self._QueryCache.clear()
+
+        self._PurgeSearchData()
+
+    #   Clear taken out songs out of the trigram / word indexes, if there are
+    #   enough of them.
+    def _PurgeSearchData(self):
+
+        if self._Refreshing:
+            return
+
+        if self._NextSongNumber - len(self._SongPaths) > SongPurgeRatio * self._NextSongNumber:
+            self._RebuildSearchData()
+
+    #   IndexSong - False when the trigram / word indexes are going to be put
+    #               together afterwards
+    def _AddEntry(self, FileName, Entry, IndexSong=True):
+
+        self._Entries[FileName] = Entry
+        self._Inodes[Entry['inode']] = FileName
+        self._QueryCache.clear()
+
+        Folded = SongSearchText(FileName, Entry['title'], Entry['text'])
+        self._Folded[FileName] = Folded
+        if IndexSong:
+            self._IndexSong(FileName, Folded)
+
+    #   Number a song and add it to the trigram, word and chord progression
+    #   indexes - numbers only go up, so each array of song numbers stays in
+    #   order.
+    def _IndexSong(self, FileName, Folded):
+
+        SongNumber = self._NextSongNumber
+        self._NextSongNumber += 1
+        self._SongNumbers[FileName] = SongNumber
+        self._SongPaths[SongNumber] = FileName
+
+        for Word in AddPostings(self._Trigrams, self._Words, self._Progressions, SongNumber, Folded, self._Entries[FileName]['progression']):
+            self._AddWord(Word)
+
+    #   A word new to the library - index it by its trigrams
+    def _AddWord(self, Word):
+        for Trigram in WordTrigrams(Word):
+            self._WordTrigrams.setdefault(Trigram, []).append(Word)
+
+    def _ClearSearchData(self):
+
+        self._Trigrams = {}
+        self._Words = {}
+        self._WordTrigrams = {}
+        self._Progressions = {}
+        self._SongNumbers = {}
+        self._SongPaths = {}
+        self._NextSongNumber = 0
+
+    #   Renumber the songs, leaving out the ones taken out of the index
+    def _RebuildSearchData(self):
+
+        self._ClearSearchData()
+        for FileName, Folded in self._Folded.items():
+            self._IndexSong(FileName, Folded)
+
+    #   Figures about the index - for seeing how big it's got
+    #   Returns {name: number}
+    def Stats(self):
+
+        with self._Lock:
+            Stats = {
+                     'songs': len(self._Entries),
+                     'songs_not_indexed_yet': len(self._Unread),
+                     'directories': len(self._Manifest),
+                     'trigrams': len(self._Trigrams),
+                     'trigram_postings': sum(len(SongNumbers) for SongNumbers in self._Trigrams.values()),
+                     'words': len(self._Words),
+                     'chord_sequences': len(self._Progressions),
+                     'songs_with_progressions': sum(1 for Entry in self._Entries.values() if len(Entry['progression']) > 0),
+                     'taken_out_song_numbers': self._NextSongNumber - len(self._SongNumbers),
+                     }
+
+        for Name, FileName in (('index_file_bytes', self.IndexFileName), ('search_file_bytes', self.SearchFileName)):
+            try:
+                Stats[Name] = os.path.getsize(FileName)
+            except OSError:
+                Stats[Name] = 0
+
+        return Stats
+
+    #   All the song files in the index
+    def Files(self):
+        with self._Lock:
+            return sorted(self._Entries)
+
+    #   The lyrics (without the chord lines) of all the songs in the index -
+    #   {file name: lyrics} - for looking at the library as a whole.
+    def SongLyrics(self):
+        with self._Lock:
+            return {FileName: Entry['text'] for FileName, Entry in self._Entries.items()}
+
+    #   Size and modification time of a song - as recorded when it was indexed,
+    #   or from the file itself if it hasn't been read into the index yet.
+    def FileDetails(self, FileName):
+        with self._Lock:
+            Entry = self._Entries.get(FileName)
+            if Entry is not None:
+                return Entry['size'], Entry['mtime']
+
+        FileStat = os.stat(FileName)
+        return FileStat.st_size, FileStat.st_mtime
+
+    #   Find the songs whose file name, title or lyrics contain the search text
+    #   (not case sensitive) - returns a sorted list of full paths.
+    #   Song details asked for as name:value (see ParseQuery) are looked up in
+    #   the catalog, and chord progressions (prog:I-V-vi-IV) in the chord
+    #   progression index.
+    #   Cancelled - optional function, checked as the search goes along - if it
+    #   returns True the search is abandoned and None is returned.
+    #   Found - optional function, called with lists of songs as they're found,
+    #   so they can be shown before the search has finished.  Between them
+    #   they're the songs returned, but not necessarily in order.
+    def Search(self, SearchText, Cancelled=None, Found=None):
+
+        if Cancelled is None:
+            Cancelled = lambda: False
+
+        CatalogTerms, ProgressionTerms, Text = ParseQuery(SearchText)
+        Folded = FoldText(Text).strip()
+
+        if len(Folded) == 0 and len(CatalogTerms) == 0 and len(ProgressionTerms) == 0:
+            return self.Files()
+
+        # Songs are only passed on to Found once they've passed every check.
+        CheckDetails = len(CatalogTerms) > 0 or len(ProgressionTerms) > 0
+
+        with self._Lock:
+            if len(Folded) > 0:
+                Results = self._Search(Folded, Cancelled, None if CheckDetails else Found)
+            elif len(ProgressionTerms) > 0:
+                Results = self._SearchProgressions(ProgressionTerms[0], Cancelled)
+            else:
+                Results = sorted(self._Entries)
+
+            if Results is not None and CheckDetails:
+                Results = self._CheckCatalog(Results, CatalogTerms, ProgressionTerms, Cancelled, Found)
+
+            Unread = list(self._Unread) if len(Folded) > 0 else []
+
+        if Results is None or len(Unread) == 0:
+            return Results
+
+        #   Songs not read into the index yet have to be looked at directly
+        #   (only when searching on text - scanning every song for details
+        #   would mean reading them all).
+        Scanned = SongScanner(Folded, CatalogTerms, ProgressionTerms).Scan(Unread, Cancelled, Found)
+        if Scanned is None:
+            return None
+
+        return sorted(set(Results).union(Scanned))
+
+    #   Just the songs with the details and chord progressions asked for
+    def _CheckCatalog(self, Candidates, CatalogTerms, ProgressionTerms, Cancelled, Found=None):
+
+        Results = []
+        Reported = 0
+        for Count, FileName in enumerate(Candidates):
+            if Count % SearchCheckInterval == 0:
+                if Cancelled():
+                    return None
+                Reported = ReportFound(Found, Results, Reported)
+            if self._HasDetails(FileName, CatalogTerms, ProgressionTerms):
+                Results.append(FileName)
+
+        ReportFound(Found, Results, Reported)
+        return Results
+
+    def _HasDetails(self, FileName, CatalogTerms, ProgressionTerms):
+
+        Entry = self._Entries[FileName]
+        return CatalogMatches(Entry['fields'], CatalogTerms) and ProgressionMatches(Entry['progression'], ProgressionTerms)
+
+    #   Find the songs with any of the chord progressions, using the chord
+    #   progression index in the same way as the trigram index is used for text.
+    def _SearchProgressions(self, Progressions, Cancelled):
+
+        Candidates = set()
+        for Progression in Progressions:
+
+            if len(Progression) < ProgressionGramSize:
+                # Too short to look up - check everything.
+                return self._CheckProgressions(Progressions, sorted(self._Entries), Cancelled)
+
+            SongNumbers = self._Narrow(self._Progressions, ProgressionGrams(Progression), Cancelled)
+            if SongNumbers is None:
+                return None
+            Candidates.update(self._SongPaths[SongNumber] for SongNumber in SongNumbers if SongNumber in self._SongPaths)
+
+        return self._CheckProgressions(Progressions, sorted(Candidates), Cancelled)
+
+    def _CheckProgressions(self, Progressions, Candidates, Cancelled):
+        return self._CheckCatalog(Candidates, [], [Progressions], Cancelled)
+
+    #   Narrow down the songs that could have all the keys (trigrams or chord
+    #   sequences) - the songs having the rarest one, then narrowed down with
+    #   the next rarest, until there are few enough to check.
+    #   Returns a set of song numbers (which may include taken out songs)
+    def _Narrow(self, Index, Keys, Cancelled):
+
+        KeySongs = []
+        for Key in Keys:
+            Songs = Index.get(Key)
+            if Songs is None:
+                return set()
+            KeySongs.append(Songs)
+
+        KeySongs.sort(key=len)
+
+        SongCount = max(self._NextSongNumber, 1)
+
+        Candidates = set(KeySongs[0])
+        for Songs in KeySongs[1:]:
+            if len(Candidates) <= CandidateCheckSize:
+                break
+            # (the rest have even more songs)
+            if len(Songs) > CheckCostRatio * len(Candidates) * (1 - len(Songs) / SongCount):
+                break
+            if Cancelled():
+                return None
+            Candidates.intersection_update(Songs)
+
+        return Candidates
+
+    #   The catalog details of an indexed song - {detail name: value}
+    def SongDetails(self, FileName):
+        with self._Lock:
+            return dict(self._Entries[FileName]['fields'])
+
+    #   A short piece of a song's lyrics around where the search text first
+    #   appears in them (or, failing that, the first of its words to) - for
+    #   showing why a song was found.  It comes from the text held in the index,
+    #   the song file isn't read.
+    #   Returns (text before, the hit, text after) - with the line breaks shown
+    #   as ' / ' - or None if the lyrics don't have it (it may have been found
+    #   in the title, or as a near miss).
+    def Snippet(self, FileName, SearchText):
+
+        CatalogTerms, ProgressionTerms, Text = ParseQuery(SearchText)
+        Folded = FoldText(Text).strip()
+        if len(Folded) == 0:
+            return None
+
+        with self._Lock:
+            Entry = self._Entries.get(FileName)
+            if Entry is None:
+                return None
+            Lyrics = Entry['text']
+            FoldedSong = self._Folded[FileName]
+
+        # The lyrics are the end of the song's search text
+        FoldedLyrics = FoldText(Lyrics)
+        LyricsStart = len(FoldedSong) - len(FoldedLyrics)
+
+        for Hit in [Folded] + sorted(set(WordPattern.findall(Folded)), key=len, reverse=True):
+            Position = FoldedSong.find(Hit, LyricsStart)
+            if Position != -1:
+                break
+        else:
+            return None
+
+        Start = Position - LyricsStart
+        End = Start + len(Hit)
+        if not Lyrics.isascii():
+            Start, End = UnfoldedOffset(Lyrics, Start), UnfoldedOffset(Lyrics, End)
+
+        # Show whole words either side, as far as there's room
+        Before = Lyrics[max(0, Start - SnippetBefore):Start]
+        if Start > SnippetBefore:
+            Before = '…' + Before[Before.find(' ') + 1:] if ' ' in Before else '…' + Before
+        After = Lyrics[End:End + SnippetAfter]
+        if End + SnippetAfter < len(Lyrics):
+            After = After[:After.rfind(' ')] + '…' if ' ' in After else After + '…'
+
+        return tuple(Part.replace('\n', ' / ') for Part in (Before, Lyrics[Start:End], After))
+
+    def _Search(self, Folded, Cancelled, Found=None):
+
+        #   Searched for this recently?
+        Results = self._QueryCache.get(Folded)
+        if Results is not None:
+            self._QueryCache.move_to_end(Folded)
+            ReportFound(Found, Results, 0)
+            return list(Results)
+
+        #   If we've recently searched for part of this text, then only the songs
+        #   that matched that need to be checked.
+        Previous = None
+        for CachedText in self._QueryCache:
+            if CachedText in Folded and (Previous is None or len(CachedText) > len(Previous)):
+                Previous = CachedText
+
+        if Previous is not None:
+            Results = self._CheckSongs(Folded, self._QueryCache[Previous], Cancelled, Found)
+        else:
+            Results = self._SearchPostings(Folded, Cancelled, Found)
+
+        if Results is None:
+            return None
+
+        self._QueryCache[Folded] = tuple(Results)
+        while len(self._QueryCache) > QueryCacheSize:
+            self._QueryCache.popitem(last=False)
+
+        return Results
+
+    #   Search using the trigram index
+    def _SearchPostings(self, Folded, Cancelled, Found):
+
+        if len(Folded) < 3:
+            # Too short to have any trigrams - check everything.
+            return self._CheckSongs(Folded, sorted(self._Entries), Cancelled, Found)
+
+        if WordPattern.fullmatch(Folded):
+            return self._SearchWords(Folded, Cancelled, Found)
+
+        #   Every trigram of the search text has to be in the song
+        Candidates = self._Narrow(self._Trigrams, Trigrams(Folded), Cancelled)
+        if Candidates is None:
+            return None
+
+        Candidates = [self._SongPaths[SongNumber] for SongNumber in Candidates if SongNumber in self._SongPaths]
+
+        return self._CheckSongs(Folded, sorted(Candidates), Cancelled, Found)
+
+    #   Search for a single word (or part of one) using the word index - the
+    #   songs with the words that have it in them.  Nothing else can have it,
+    #   so the songs found don't need checking.
+    def _SearchWords(self, Folded, Cancelled, Found):
+
+        # The words with it in have all its trigrams - go through the words
+        # having the rarest one.
+        Words = None
+        for Trigram in Trigrams(Folded):
+            TrigramWords = self._WordTrigrams.get(Trigram)
+            if TrigramWords is None:
+                return []
+            if Words is None or len(TrigramWords) < len(Words):
+                Words = TrigramWords
+
+        SongNumbers = set()
+        for Count, Word in enumerate(Words):
+            if Count % SearchCheckInterval == 0 and Cancelled():
+                return None
+            if Folded in Word:
+                SongNumbers.update(self._Words[Word])
+
+        Results = sorted(self._SongPaths[SongNumber] for SongNumber in SongNumbers if SongNumber in self._SongPaths)
+        ReportFound(Found, Results, 0)
+        return Results
+
+    #   Final check - the full search text has to appear in the song.
+    #   Candidates is in file name order, and so are the results.
+    def _CheckSongs(self, Folded, Candidates, Cancelled, Found=None):
+
+        Results = []
+        Reported = 0
+        for Count, FileName in enumerate(Candidates):
+            if Count % SearchCheckInterval == 0:
+                if Cancelled():
+                    return None
+                Reported = ReportFound(Found, Results, Reported)
+            if Folded in self._Folded[FileName]:
+                Results.append(FileName)
+
+        ReportFound(Found, Results, Reported)
+        return Results
+
+    #   Find the songs that best match the search text, allowing for typos -
+    #   returns up to Limit full paths, best match first.
+    #
+    #   Each typed word is matched against the words in the library - exactly,
+    #   with a typo or two (depending on the word's length), or, for the last
+    #   word (which may still be being typed), as the start of a word.  A song
+    #   scores for each typed word by its best matching word in the song:
+    #
+    #       how close the match is (1 for an exact match)
+    #     x how rare the word is (words in every song count for little)
+    #     x where it is - title, first lines or further down the lyrics
+    #
+    #   and songs containing the search text exactly as typed get a boost.
+    #   Song details and chord progressions asked for have to match as for Search.
+    #   Cancelled - as for Search - None is returned if the search is cancelled.
+    def RankedSearch(self, SearchText, Cancelled=None, Limit=RankedResultCount):
+
+        if Cancelled is None:
+            Cancelled = lambda: False
+
+        CatalogTerms, ProgressionTerms, Text = ParseQuery(SearchText)
+        Folded = FoldText(Text).strip()
+        QueryWords = WordPattern.findall(Folded)
+
+        if len(QueryWords) == 0:
+            return []
+
+        with self._Lock:
+            return self._RankedSearch(Folded, QueryWords, CatalogTerms, ProgressionTerms, Cancelled, Limit)
+
+    def _RankedSearch(self, Folded, QueryWords, CatalogTerms, ProgressionTerms, Cancelled, Limit):
+
+        SongCount = max(len(self._SongPaths), 1)
+
+        #   Song number -> [(score, matching word) for each typed word]
+        Matches = {}
+
+        for Position, QueryWord in enumerate(QueryWords):
+
+            if Cancelled():
+                return None
+
+            #   Song number -> best (score, word) for this typed word
+            WordMatches = {}
+            for Word, Closeness in self._SimilarWords(QueryWord, Position == len(QueryWords) - 1):
+
+                Songs = self._Words[Word]
+                Score = Closeness * math.log(1 + SongCount / len(Songs))
+
+                for SongNumber in Songs:
+                    Best = WordMatches.get(SongNumber)
+                    if Best is None or Best[0] < Score:
+                        WordMatches[SongNumber] = (Score, Word)
+
+            for SongNumber, Match in WordMatches.items():
+                Matches.setdefault(SongNumber, []).append(Match)
+
+        #   Rank on the scores so far, then take a closer look at the best of
+        #   them to see where in the song the words are.
+        Scores = []
+        for SongNumber, SongMatches in Matches.items():
+            if SongNumber not in self._SongPaths:
+                continue
+            if not self._HasDetails(self._SongPaths[SongNumber], CatalogTerms, ProgressionTerms):
+                continue
+            Scores.append((sum(Score for Score, Word in SongMatches), SongNumber))
+
+        Results = []
+        for Count, (Score, SongNumber) in enumerate(heapq.nlargest(Limit * 4, Scores)):
+
+            if Count % SearchCheckInterval == 0 and Cancelled():
+                return None
+
+            FileName = self._SongPaths[SongNumber]
+            TitleWords, FirstLineWords = self._LeadingWords(FileName)
+
+            Score = 0.0
+            for WordScore, Word in Matches[SongNumber]:
+                if Word in TitleWords:
+                    WordScore *= TitleWeight
+                elif Word in FirstLineWords:
+                    WordScore *= FirstLinesWeight
+                Score += WordScore
+
+            if Folded in self._Folded[FileName]:
+                Score *= ExactMatchWeight
+
+            Results.append((Score, FileName))
+
+        #   Best first - songs scoring the same in file name order
+        Results.sort(key=lambda Result: (-Result[0], Result[1]))
+
+        return [FileName for Score, FileName in Results[:Limit]]
+
+    #   Words in the library like the typed word - (word, closeness) pairs,
+    #   closeness being 1 for the word itself, less for words with typos in.
+    #   Prefix - the word may not be finished, so words starting with it count.
+    def _SimilarWords(self, QueryWord, Prefix):
+
+        Similar = {}
+        if QueryWord in self._Words:
+            Similar[QueryWord] = 1.0
+
+        MaxEdits = AllowedEdits(QueryWord)
+        if MaxEdits == 0 and not Prefix:
+            return Similar.items()
+
+        #   Count the trigrams each word has in common with the typed word -
+        #   every typo can only spoil three of them, so words without enough
+        #   in common can't be close enough.
+        QueryTrigrams = WordTrigrams(QueryWord)
+        Shared = {}
+        for Trigram in QueryTrigrams:
+            for Word in self._WordTrigrams.get(Trigram, ()):
+                Shared[Word] = Shared.get(Word, 0) + 1
+
+        MinShared = len(QueryTrigrams) - 3 * MaxEdits
+        for Word, SharedCount in Shared.items():
+            if Word in Similar:
+                continue
+
+            if Prefix and Word.startswith(QueryWord):
+                Similar[Word] = len(QueryWord) / len(Word)
+            elif MaxEdits > 0 and SharedCount >= MinShared:
+                Distance = EditDistance(QueryWord, Word, MaxEdits)
+                if Distance <= MaxEdits:
+                    Similar[Word] = 1.0 - Distance / max(len(QueryWord), len(Word))
+
+        return Similar.items()
+
+    #   The words in a song's file name and title, and those in its first few
+    #   lines - these count for more in ranked searches.
+    def _LeadingWords(self, FileName):
+
+        Entry = self._Entries[FileName]
+        TitleWords = set(WordPattern.findall(FoldText(os.path.basename(FileName)+'\n'+Entry['title'])))
+
+        FirstLines = [TextLine for TextLine in Entry['text'].split('\n') if len(TextLine) > 0][:FirstLinesCount]
+        FirstLineWords = set(WordPattern.findall(FoldText('\n'.join(FirstLines))))
+
+        return TitleWords, FirstLineWords
@@ -0,0 +1,178 @@
+import codecs
+import itertools
+import locale
+import re
+import xml.etree.ElementTree as ET
+
+
+#   SongReader
+#
+#   Reading OpenSong song files - shared by everything that opens a song (the
+#   song list, the song previews, saving a song, and the song index).
+#
+#   A song file is an XML document - <song> with an element for each of the
+#   song's details (title, lyrics, key, user1, ...).  Usually only a few of
+#   them are wanted, so rather than building the whole tree, the file is fed
+#   through a pull parser a piece at a time and the wanted elements picked out
+#   as they go past - once they've all been seen, the rest of the file isn't
+#   read or parsed.
+#
+#   The encoding is worked out once, from the start of the file - a byte order
+#   mark, or the encoding in the XML declaration.  Files with neither should be
+#   UTF-8, but older ones may be in the local encoding - so those are read as
+#   UTF-8 and, if that turns out to be wrong, read again in the local encoding.
+
+#   How much of a file to read (and parse) at a time
+ReadChunkSize = 16 * 1024
+
+#   Byte order marks -> encoding (UTF-32 before UTF-16, which it starts with)
+ByteOrderMarks = (
+                  (codecs.BOM_UTF8, 'utf-8-sig'),
+                  (codecs.BOM_UTF32_LE, 'utf-32'),
+                  (codecs.BOM_UTF32_BE, 'utf-32'),
+                  (codecs.BOM_UTF16_LE, 'utf-16'),
+                  (codecs.BOM_UTF16_BE, 'utf-16'),
+                  )
+
+#   <?xml version="1.0" encoding="..."?>
+XmlDeclarationPattern = re.compile(rb'^\s*<\?xml[^>]*?\sencoding\s*=\s*["\']([A-Za-z][A-Za-z0-9._-]*)["\']')
+
+
+#   The encoding a song file says it's in - from the start of the file - or
+#   None if it doesn't say (or names an encoding we don't know).
+def SongEncoding(Head):
+
+    for Mark, Encoding in ByteOrderMarks:
+        if Head.startswith(Mark):
+            return Encoding
+
+    Match = XmlDeclarationPattern.match(Head)
+    if Match is None:
+        return None
+
+    try:
+        return codecs.lookup(Match.group(1).decode('ascii')).name
+    except LookupError:
+        return None
+
+
+#   The encodings to try for a song file - (encoding, errors) - see above
+def SongEncodings(Head):
+
+    Encoding = SongEncoding(Head)
+    if Encoding is not None:
+        return [(Encoding, 'replace')]
+
+    return [('utf-8', 'strict'), (locale.getpreferredencoding(False), 'replace')]
+
+
+#   A song file's (or song data's) bytes as text
+def DecodeSongData(SongData):
+
+    for Encoding, Errors in SongEncodings(SongData[:ReadChunkSize]):
+        try:
+            return SongData.decode(Encoding, Errors)
+        except UnicodeDecodeError:
+            pass
+
+
+#   Read the whole of a song file into an ElementTree - for changing and
+#   writing back.
+def ReadSongTree(FileName):
+
+    with open(FileName, 'rb') as SongFile:
+        SongData = SongFile.read()
+
+    return ET.ElementTree(ET.fromstring(DecodeSongData(SongData)))
+
+
+#   Read some of a song's details from a song file.
+#   Fields - the names of the elements wanted, e.g. ('lyrics', 'key')
+#   Returns {name: text} for the wanted elements the song has (the text is
+#   None if the element is empty) - elements the song doesn't have are left
+#   out.  Raises ET.ParseError if the file isn't XML (as far as it's read).
+def ReadSongFields(FileName, Fields):
+
+    def Chunks():
+        with open(FileName, 'rb') as SongFile:
+            while True:
+                Chunk = SongFile.read(ReadChunkSize)
+                if len(Chunk) == 0:
+                    return
+                yield Chunk
+
+    return _SongFields(Chunks, Fields)
+
+
+#   As ReadSongFields - for a song already in memory (bytes, or a memory
+#   mapped file)
+def ParseSongFields(SongData, Fields):
+
+    def Chunks():
+        for Start in range(0, len(SongData), ReadChunkSize):
+            yield SongData[Start:Start+ReadChunkSize]
+
+    return _SongFields(Chunks, Fields)
+
+
+#   Chunks - a function giving the song's bytes, a piece at a time (called
+#   again if the song has to be read again in another encoding)
+def _SongFields(Chunks, Fields):
+
+    Wanted = set(Fields)
+
+    ChunkList = Chunks()
+    try:
+        Head = next(ChunkList, b'')
+        for Encoding, Errors in SongEncodings(Head):
+            try:
+                # (usually the first piece is the whole song)
+                if len(Head) < ReadChunkSize:
+                    return _ParseFields((Head.decode(Encoding, Errors),), Wanted)
+                return _ParseFields(_DecodeChunks(itertools.chain((Head,), ChunkList), Encoding, Errors), Wanted)
+            except UnicodeDecodeError:
+                ChunkList.close()
+                ChunkList = Chunks()
+                Head = next(ChunkList, b'')
+    finally:
+        ChunkList.close()
+
+
+def _DecodeChunks(ChunkList, Encoding, Errors):
+
+    Decoder = codecs.getincrementaldecoder(Encoding)(Errors)
+    for Chunk in ChunkList:
+        yield Decoder.decode(Chunk)
+    yield Decoder.decode(b'', True)
+
+
+#   Feed the song's text through the parser, picking out the wanted elements
+#   - stopping as soon as they've all been found.
+def _ParseFields(Texts, Wanted):
+
+    Found = {}
+    Parser = ET.XMLPullParser(events=('start', 'end'))
+    Depth = 0
+
+    # (None - the end of the song)
+    for Text in itertools.chain(Texts, (None,)):
+        if Text is None:
+            Parser.close()
+        else:
+            Parser.feed(Text)
+
+        for Event, Element in Parser.read_events():
+            if Event == 'start':
+                Depth += 1
+                continue
+
+            # The song's details are the elements directly inside <song>
+            if Depth == 2:
+                if Element.tag in Wanted and Element.tag not in Found:
+                    Found[Element.tag] = Element.text
+                    if len(Found) == len(Wanted):
+                        return Found
+                Element.clear()
+            Depth -= 1
+
+    return Found
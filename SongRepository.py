@@ -0,0 +1,171 @@
+import os
+
+from SongSheet import ParseSongText
+
+
+#   SongRepository
+#
+#   The songs in the song list (set list) - each held as a Song record, and
+#   found by its name in the on-screen list, by its file, or by its id, without
+#   looking through the whole list.
+#
+#   The on-screen list shows each song's DisplayName - usually just the song's
+#   file name, but the same file name can turn up more than once (the same
+#   song twice in a set, or songs from different directories with the same
+#   name) so the repository makes each one unique - 'Amazing Grace',
+#   'Amazing Grace (2)', ...  Each song also gets an id when it's added, which
+#   never changes and is never given to another song, even if the song is
+#   renamed or taken out.
+
+
+#   A song in the song list - what used to be the 9 element list
+#   [full file name, lyrics, base key, offset, file name, font size,
+#    font size portrait, page size, page size portrait]
+#   The lyrics are worked through (see SongSheet) the first time they're
+#   needed, and again only if they're changed.
+class Song(object):
+
+    __slots__ = (
+                 'Id',
+                 'FilePath',             # full file and path name
+                 '_Lyrics',              # lyrics text (see Lyrics)
+                 '_Sheet',               # the lyrics worked through - or None if not done yet (see Sheet)
+                 'Key',                  # base key
+                 'Offset',               # semitones transposed from the base key, 0 - 11
+                 'FileName',             # just the file name
+                 'FontSize',             # font size (or 'Default') - landscape
+                 'FontSize_Portrait',    # font size (or 'Default') - portrait
+                 'PageSize',             # line count before column break (or 'Default') - landscape
+                 'PageSize_Portrait',    # line count before column break (or 'Default') - portrait
+                 'DisplayName',          # the (unique) name shown in the song list
+                 )
+
+    def __init__(self, FilePath, Lyrics, Key, Offset=0, FileName=None,
+                 FontSize='Default', FontSize_Portrait='Default', PageSize='Default', PageSize_Portrait='Default'):
+
+        self.Id = None
+        self.FilePath = FilePath
+        self._Lyrics = Lyrics
+        self._Sheet = None
+        self.Key = Key
+        self.Offset = Offset
+        self.FileName = os.path.basename(FilePath) if FileName is None else FileName
+        self.FontSize = FontSize
+        self.FontSize_Portrait = FontSize_Portrait
+        self.PageSize = PageSize
+        self.PageSize_Portrait = PageSize_Portrait
+        self.DisplayName = None
+
+    def __repr__(self):
+        return 'Song(%r, id=%r, name=%r)' % (self.FilePath, self.Id, self.DisplayName)
+
+    @property
+    def Lyrics(self):
+        return self._Lyrics
+
+    @Lyrics.setter
+    def Lyrics(self, Lyrics):
+        self._Lyrics = Lyrics
+        self._Sheet = None
+
+    #   The lyrics as a SongSheet - for displaying and transposing
+    @property
+    def Sheet(self):
+        if self._Sheet is None:
+            self._Sheet = ParseSongText(self._Lyrics)
+        return self._Sheet
+
+
+class SongRepository(object):
+
+    def __init__(self):
+
+        # Id -> Song, in the order they were added
+        self._Songs = {}
+
+        # Display name -> Song
+        self._ByName = {}
+
+        # Full path -> {Id: Song} - there can be more than one copy of a song
+        self._ByPath = {}
+
+        self._NextId = 1
+
+    def __len__(self):
+        return len(self._Songs)
+
+    def __iter__(self):
+        return iter(list(self._Songs.values()))
+
+    #   Put a song in the repository - it gets an id and a display name.
+    #   Returns the song.
+    def Add(self, NewSong):
+
+        NewSong.Id = self._NextId
+        self._NextId += 1
+
+        self._Songs[NewSong.Id] = NewSong
+        self._ByPath.setdefault(NewSong.FilePath, {})[NewSong.Id] = NewSong
+        self._Name(NewSong)
+
+        return NewSong
+
+    #   Take a song out - does nothing if it isn't in the repository.
+    def Remove(self, OldSong):
+
+        if self._Songs.pop(OldSong.Id, None) is None:
+            return
+
+        del self._ByName[OldSong.DisplayName]
+        Copies = self._ByPath[OldSong.FilePath]
+        del Copies[OldSong.Id]
+        if len(Copies) == 0:
+            del self._ByPath[OldSong.FilePath]
+
+    def Clear(self):
+
+        self._Songs.clear()
+        self._ByName.clear()
+        self._ByPath.clear()
+
+    #   The song with this display name - or None
+    def ByName(self, DisplayName):
+        return self._ByName.get(DisplayName)
+
+    #   The song with this id - or None
+    def ById(self, Id):
+        return self._Songs.get(Id)
+
+    #   The songs (copies of the same song) with this full path - oldest first
+    def ByPath(self, FilePath):
+        return list(self._ByPath.get(FilePath, {}).values())
+
+    #   The song's file has changed - e.g. it's been renamed when it was edited.
+    #   Its display name is worked out again (its id stays the same).
+    def Update(self, ChangedSong, FilePath, FileName):
+
+        Copies = self._ByPath[ChangedSong.FilePath]
+        del Copies[ChangedSong.Id]
+        if len(Copies) == 0:
+            del self._ByPath[ChangedSong.FilePath]
+
+        ChangedSong.FilePath = FilePath
+        ChangedSong.FileName = FileName
+        self._ByPath.setdefault(FilePath, {})[ChangedSong.Id] = ChangedSong
+
+        if ChangedSong.DisplayName != FileName:
+            del self._ByName[ChangedSong.DisplayName]
+            self._Name(ChangedSong)
+
+    #   Give a song a display name no other song has - its file name, or if
+    #   that's taken, its file name with a number after it.
+    def _Name(self, NamedSong):
+
+        DisplayName = NamedSong.FileName
+        Copy = 1
+        while DisplayName in self._ByName:
+            Copy += 1
+            DisplayName = NamedSong.FileName+' ('+str(Copy)+')'
+
+        NamedSong.DisplayName = DisplayName
+        self._ByName[DisplayName] = NamedSong
@@ -0,0 +1,148 @@
+import re
+
+from SongChords import ChordsInLine
+
+
+#   SongSheet
+#
+#   A song's lyrics, worked through once - so the song display, the plain text
+#   for the edit window and transposing can use it over and over (changing key
+#   or orientation) without picking the text apart again each time.
+#
+#   Each line of the lyrics becomes a SongLine, of one of these kinds -
+#
+#       chords  - '.' and chords, e.g. '.G    D/F#   Em'.  The chords' places
+#                 in the line are found once (see ChordsInLine), as are the
+#                 'words' - the runs of non-spaces the chords are put above
+#                 the lyrics by.  If the next line is a lyric line (starting
+#                 with a space), it's kept with the chords, as Lyrics.
+#       lyrics  - words to be sung (or anything else - e.g. ';' comments)
+#       heading - a section heading, e.g. '[V1]', '[Chorus]'
+#       break   - a column break - '[===]' always, '[=L=]' only in landscape,
+#                 '[=P=]' only in portrait
+#       blank   - nothing but spaces
+#
+#   The song is a list of sections - one starting at each heading (and one
+#   for any lines before the first heading), each with its heading line and
+#   the lines under it.
+
+ChordLine = 'chords'
+LyricLine = 'lyrics'
+HeadingLine = 'heading'
+BreakLine = 'break'
+BlankLine = 'blank'
+
+#   Column breaks -> the orientation they're for ('' - both)
+ColumnBreaks = {
+                '[===]': '',
+                '[=L=]': 'L',
+                '[=P=]': 'P',
+                }
+
+#   The 'words' of a chord line (after the '.') - only spaces separate them
+ChordWordPattern = re.compile(r'[^ ]+')
+
+
+class SongLine(object):
+
+    __slots__ = (
+                 'Kind',
+                 'Text',           # the line as it is in the lyrics
+                 'Chords',         # chord lines - [(start, end, chord)]
+                 'Words',          # chord lines - [(start, end)]
+                 'Lyrics',         # chord lines - the lyric line under the chords, or None
+                 'Orientation',    # breaks - 'L', 'P', or '' for both
+                 )
+
+    def __init__(self, Kind, Text):
+
+        self.Kind = Kind
+        self.Text = Text
+        self.Chords = None
+        self.Words = None
+        self.Lyrics = None
+        self.Orientation = None
+
+    def __repr__(self):
+        return 'SongLine(%r, %r)' % (self.Kind, self.Text)
+
+
+class SongSection(object):
+
+    __slots__ = (
+                 'Heading',        # the heading line - None for the lines before the first heading
+                 'Lines',          # the lines under the heading (the lyric lines kept with chord lines
+                                   # aren't in here - they're the chord lines' Lyrics)
+                 )
+
+    def __init__(self, Heading):
+
+        self.Heading = Heading
+        self.Lines = []
+
+    #   The section's lines in order - the heading first
+    def __iter__(self):
+        if self.Heading is not None:
+            yield self.Heading
+        yield from self.Lines
+
+
+class SongSheet(object):
+
+    def __init__(self, Sections):
+
+        self.Sections = Sections
+
+
+#   What kind of line a line (that isn't a chord line) is
+def LineKind(TextLine):
+
+    Stripped = TextLine.strip()
+    if len(Stripped) == 0:
+        return BlankLine
+    if Stripped[0] == '[':
+        if Stripped in ColumnBreaks:
+            return BreakLine
+        return HeadingLine
+    return LyricLine
+
+
+#   Work through a song's lyrics - returns a SongSheet
+def ParseSongText(Lyrics):
+
+    TextLines = (Lyrics or '').split('\n')
+
+    Sections = [SongSection(None)]
+
+    Ptr2 = 0
+    while Ptr2 < len(TextLines):
+
+        TextLine = TextLines[Ptr2]
+
+        if len(TextLine) > 0 and TextLine[0] == '.':
+            Line = SongLine(ChordLine, TextLine)
+            Line.Chords = ChordsInLine(TextLine)
+            Line.Words = [(Match.start(), Match.end()) for Match in ChordWordPattern.finditer(TextLine, 1)]
+
+            # The lyrics the chords go with
+            if Ptr2+1 < len(TextLines) and TextLines[Ptr2+1][:1] == ' ':
+                Ptr2 = Ptr2+1
+                Line.Lyrics = SongLine(LineKind(TextLines[Ptr2]), TextLines[Ptr2])
+        else:
+            Line = SongLine(LineKind(TextLine), TextLine)
+            if Line.Kind == BreakLine:
+                Line.Orientation = ColumnBreaks[TextLine.strip()]
+            elif Line.Kind == HeadingLine:
+                Sections.append(SongSection(Line))
+                Ptr2 = Ptr2+1
+                continue
+
+        Sections[-1].Lines.append(Line)
+
+        Ptr2 = Ptr2+1
+
+    # (no lines before the first heading)
+    if len(Sections[0].Lines) == 0:
+        del Sections[0]
+
+    return SongSheet(Sections)
@@ -0,0 +1,111 @@
+import os
+
+import SongCache
+from SongCache import SongCache as Cache
+
+
+#   Tests for SongCache - run with pytest
+
+
+def WriteSong(FileName, Lyrics, Key='G'):
+
+    with open(FileName, 'w', encoding='utf8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<song><title>x</title><lyrics>'+Lyrics+'</lyrics><key>'+Key+'</key><user1>20|||</user1></song>')
+
+
+#   Count the song files actually read (rather than found in the cache)
+def CountReads(monkeypatch):
+
+    Reads = []
+    ReadSongFields = SongCache.ReadSongFields
+
+    def Reading(FileName, Fields):
+        Reads.append(FileName)
+        return ReadSongFields(FileName, Fields)
+
+    monkeypatch.setattr(SongCache, 'ReadSongFields', Reading)
+    return Reads
+
+
+def test_SongsReadOnce(tmp_path, monkeypatch):
+
+    Reads = CountReads(monkeypatch)
+    SongFile = str(tmp_path / 'song.xml')
+    WriteSong(SongFile, ' Amazing grace')
+
+    Songs = Cache(str(tmp_path / 'cache.bin'))
+    assert Songs.SongFields(SongFile) == {'lyrics': ' Amazing grace', 'key': 'G', 'user1': '20|||'}
+    assert Songs.SongFields(SongFile)['lyrics'] == ' Amazing grace'
+    assert Reads == [SongFile]
+
+
+def test_ChangedSongReadAgain(tmp_path, monkeypatch):
+
+    Reads = CountReads(monkeypatch)
+    SongFile = str(tmp_path / 'song.xml')
+    WriteSong(SongFile, ' Amazing grace')
+
+    Songs = Cache(str(tmp_path / 'cache.bin'))
+    Songs.SongFields(SongFile)
+
+    WriteSong(SongFile, ' Amazing grace, how sweet')
+    os.utime(SongFile, (1, 1))
+    assert Songs.SongFields(SongFile)['lyrics'] == ' Amazing grace, how sweet'
+    assert Reads == [SongFile, SongFile]
+
+
+def test_SavedAndLoaded(tmp_path, monkeypatch):
+
+    SongFile = str(tmp_path / 'song.xml')
+    CacheFile = str(tmp_path / 'cache.bin')
+    WriteSong(SongFile, ' Amazing grace')
+
+    Songs = Cache(CacheFile)
+    Songs.SongFields(SongFile)
+    Songs.Save()
+
+    Reads = CountReads(monkeypatch)
+    assert Cache(CacheFile).SongFields(SongFile)['lyrics'] == ' Amazing grace'
+    assert Reads == []
+
+
+#   Songs found in the cache don't make it write itself out again
+def test_NotSavedWhenUnchanged(tmp_path):
+
+    SongFile = str(tmp_path / 'song.xml')
+    CacheFile = str(tmp_path / 'cache.bin')
+    WriteSong(SongFile, ' Amazing grace')
+
+    Songs = Cache(CacheFile)
+    Songs.SongFields(SongFile)
+    Songs.Save()
+    os.utime(CacheFile, (1, 1))
+
+    Songs = Cache(CacheFile)
+    Songs.SongFields(SongFile)
+    Songs.Save()
+    assert os.stat(CacheFile).st_mtime == 1
+
+
+#   The songs used longest ago are dropped first - using a song counts
+def test_LeastRecentlyUsedDropped(tmp_path, monkeypatch):
+
+    SongFiles = [str(tmp_path / ('song'+str(SongNo)+'.xml')) for SongNo in range(3)]
+    for SongFile in SongFiles:
+        WriteSong(SongFile, ' '+'la '*100)
+
+    Songs = Cache(str(tmp_path / 'cache.bin'))
+    Songs.SongFields(SongFiles[0])
+    Songs.SongFields(SongFiles[1])
+    Songs.SongFields(SongFiles[0])
+
+    # Room for two songs
+    monkeypatch.setattr(SongCache, 'SongCacheMaxSize', 2 * SongCache.CachedSize(Songs.SongFields(SongFiles[0])))
+    Reads = CountReads(monkeypatch)
+    Songs.SongFields(SongFiles[2])
+
+    Songs.SongFields(SongFiles[0])
+    Songs.SongFields(SongFiles[2])
+    assert Reads == [SongFiles[2]]
+    Songs.SongFields(SongFiles[1])
+    assert Reads == [SongFiles[2], SongFiles[1]]
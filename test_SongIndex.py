@@ -0,0 +1,256 @@
+import os
+import pickle
+import threading
+
+import SongIndex as SongIndexModule
+from SongIndex import SongIndex, SongScanner, FoldText
+
+
+#   Tests for SongIndex - run with pytest
+
+
+def WriteSong(FileName, Title, Lyrics):
+
+    with open(FileName, 'w', encoding='utf8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<song><title>'+Title+'</title><lyrics>'+Lyrics+'</lyrics><key>G</key></song>')
+
+
+def MakeLibrary(tmp_path):
+
+    SongDirectory = str(tmp_path / 'songs')
+    os.makedirs(os.path.join(SongDirectory, 'sub'))
+    WriteSong(os.path.join(SongDirectory, 'amazing.xml'), 'Amazing Grace', '.G   D\n Amazing grace how sweet the sound')
+    WriteSong(os.path.join(SongDirectory, 'sub', 'vision.xml'), 'Be Thou My Vision', '.D   G\n Be thou my vision')
+
+    Index = SongIndex(str(tmp_path / 'index.json'))
+    Index.Refresh(SongDirectory)
+
+    return SongDirectory, Index
+
+
+def test_RefreshFindsSongs(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+
+    assert sorted(Index.Files()) == [SongDirectory+os.sep+'amazing.xml', os.path.join(SongDirectory, 'sub')+os.sep+'vision.xml']
+    assert Index.Search('sweet the') == [SongDirectory+os.sep+'amazing.xml']
+
+
+#   Single words (or parts of them) are found through the word index
+def test_SearchWords(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    AmazingFile = SongDirectory+os.sep+'amazing.xml'
+    WriteSong(SongDirectory+os.sep+'graceful.xml', 'Graceful', ' So graceful')
+    Index.RefreshDirectory(SongDirectory)
+
+    assert Index.Search('grace') == [AmazingFile, SongDirectory+os.sep+'graceful.xml']
+    assert Index.Search('ace') == [AmazingFile, SongDirectory+os.sep+'graceful.xml']
+    assert Index.Search('gracefully') == []
+
+    Index.RemoveFile(AmazingFile)
+    assert Index.Search('grace') == [SongDirectory+os.sep+'graceful.xml']
+
+
+def test_RenameInDirectory(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    OldName = SongDirectory+os.sep+'amazing.xml'
+    NewName = SongDirectory+os.sep+'renamed.xml'
+    os.rename(OldName, NewName)
+
+    assert Index.RefreshDirectory(SongDirectory) == ([NewName], [], [OldName])
+    assert Index.Search('sweet the') == [NewName]
+
+
+def test_MoveToOtherDirectory(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    SubDirectory = os.path.join(SongDirectory, 'sub')
+    OldName = SongDirectory+os.sep+'amazing.xml'
+    NewName = SubDirectory+os.sep+'amazing.xml'
+    os.rename(OldName, NewName)
+
+    # The watcher may be told about either directory first
+    Added, Updated, Removed = Index.RefreshDirectory(SubDirectory)
+    assert (Added, Updated, Removed) == ([NewName], [], [OldName])
+    assert Index.RefreshDirectory(SongDirectory) == ([], [], [])
+
+
+def test_RenameFoundByFullRefresh(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    OldName = SongDirectory+os.sep+'amazing.xml'
+    NewName = SongDirectory+os.sep+'renamed.xml'
+    os.rename(OldName, NewName)
+
+    assert Index.Refresh(SongDirectory) == ([NewName], [], [OldName])
+    assert Index.Search('sweet the') == [NewName]
+
+
+#   A song edited in place doesn't change its directory's modification time -
+#   a quick refresh doesn't see it, checking the songs does.
+def test_CheckFilesFindsSongsEditedInPlace(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    SongFile = SongDirectory+os.sep+'amazing.xml'
+    DirectoryTime = os.stat(SongDirectory).st_mtime_ns
+
+    WriteSong(SongFile, 'Amazing Grace', ' Amazing grace how sweet the sound that saved')
+    os.utime(SongDirectory, ns=(DirectoryTime, DirectoryTime))
+
+    assert Index.Refresh(SongDirectory) == ([], [], [])
+    assert Index.Search('that saved') == []
+
+    assert Index.CheckFiles() == ([], [SongFile], [])
+    assert Index.Search('that saved') == [SongFile]
+    assert Index.CheckFiles() == ([], [], [])
+
+    Loaded = SongIndex(str(tmp_path / 'index.json'))
+    assert Loaded.Search('that saved') == [SongFile]
+
+
+#   Searches shouldn't have to wait while a refresh goes through the song
+#   directory - it's only locked to apply what was found.
+def test_RefreshListsWithoutLock(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    WriteSong(SongDirectory+os.sep+'new.xml', 'New Song', ' A new song')
+
+    Free = []
+    ListDirectory = Index._ListDirectory
+
+    def Listing(*Args):
+        def TryLock():
+            if Index._Lock.acquire(timeout=5):
+                Index._Lock.release()
+                Free.append(True)
+        Thread = threading.Thread(target=TryLock)
+        Thread.start()
+        Thread.join()
+        return ListDirectory(*Args)
+
+    Index._ListDirectory = Listing
+
+    assert Index.Refresh(SongDirectory, Full=True) == ([SongDirectory+os.sep+'new.xml'], [], [])
+    assert Index.RefreshDirectory(SongDirectory) == ([], [], [])
+    assert len(Free) >= 3
+
+
+#   Text is folded the same whether or not it's plain ASCII
+def test_FoldText():
+
+    assert FoldText("Lord`s") == "lord's"
+    assert FoldText("Lord`s café") == "lord's cafe"
+    assert FoldText('Lord’s “Jesús” – Straße') == 'lord\'s "jesus" - strasse'
+
+
+def test_SearchFoldsBackticks(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    WriteSong(SongDirectory+os.sep+'lord.xml', 'Lord`s Prayer', ' Lord`s café')
+    Index.RefreshDirectory(SongDirectory)
+
+    assert Index.Search("lord`s") == [SongDirectory+os.sep+'lord.xml']
+    assert Index.Search("lord's") == [SongDirectory+os.sep+'lord.xml']
+
+
+#   Changes the watcher is told about - the songs are read without holding
+#   the lock, so searches don't wait on the song files.
+def test_ChangesReadWithoutLock(tmp_path, monkeypatch):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    SongFile = SongDirectory+os.sep+'amazing.xml'
+
+    Free = []
+    ReadSongForIndex = SongIndexModule.ReadSongForIndex
+
+    def Reading(FileName):
+        def TryLock():
+            if Index._Lock.acquire(timeout=5):
+                Index._Lock.release()
+                Free.append(FileName)
+        Thread = threading.Thread(target=TryLock)
+        Thread.start()
+        Thread.join()
+        return ReadSongForIndex(FileName)
+
+    monkeypatch.setattr(SongIndexModule, 'ReadSongForIndex', Reading)
+
+    WriteSong(SongDirectory+os.sep+'new.xml', 'New Song', ' A new song')
+    assert Index.RefreshDirectory(SongDirectory) == ([SongDirectory+os.sep+'new.xml'], [], [])
+
+    WriteSong(SongFile, 'Amazing Grace', ' Amazing grace that saved')
+    os.utime(SongFile, (1, 1))
+    assert Index.RefreshFile(SongFile) == ([], [SongFile], [])
+
+    assert Free == [SongDirectory+os.sep+'new.xml', SongFile]
+    assert Index.Search('new song') == [SongDirectory+os.sep+'new.xml']
+    assert Index.Search('that saved') == [SongFile]
+
+
+#   Songs in other encodings - the scanner (for songs not indexed yet) has to
+#   find the same songs as the index.
+def test_ScannerMatchesIndex(tmp_path):
+
+    SongDirectory = str(tmp_path / 'songs')
+    os.makedirs(SongDirectory)
+
+    Songs = {
+             'latin1.xml': ('iso-8859-1', '<?xml version="1.0" encoding="ISO-8859-1"?>\n', 'Jésus é bom'),
+             'cp1252.xml': ('cp1252', '<?xml version="1.0" encoding="windows-1252"?>\n', 'Jesus’ name – Straße'),
+             'utf16.xml': ('utf-16', '<?xml version="1.0" encoding="UTF-16"?>\n', 'Jésus my king'),
+             'utf8bom.xml': ('utf-8-sig', '', 'Jésus lover'),
+             'plain.xml': ('utf-8', '', 'Jesus loves me'),
+             'folds.xml': ('utf-8', '', 'Kisß ﬁre ﬃ'),
+             }
+    for Name, (Encoding, Declaration, Lyrics) in Songs.items():
+        with open(os.path.join(SongDirectory, Name), 'wb') as f:
+            f.write((Declaration+'<song><title>'+Name+'</title><lyrics> '+Lyrics+'</lyrics></song>').encode(Encoding))
+
+    Index = SongIndex(str(tmp_path / 'index.json'))
+    Index.Refresh(SongDirectory)
+    FileNames = sorted(Index.Files())
+
+    # (characters folding to more than one - the search text can be split
+    # up over them more than one way, or start or end part way into them)
+    for SearchText in ('jesus', 'é bom', 'jesus\' name', 'strasse', 'my king', 'lover', 'nowhere',
+                       'isß', 'iss', 'sss', 'stras', 'sse', 's', 'fire', 'ffi', 'fi', 'if'):
+        Folded = FoldText(SearchText)
+        assert SongScanner(Folded).Scan(FileNames, lambda: False) == sorted(Index.Search(SearchText)), SearchText
+
+    assert len(Index.Search('jesus')) == 5
+
+
+def test_SavedAndLoaded(tmp_path):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+    Index.Save()
+
+    Loaded = SongIndex(str(tmp_path / 'index.json'))
+    assert Loaded.Files() == Index.Files()
+    assert Loaded.Search('sweet the') == [SongDirectory+os.sep+'amazing.xml']
+    assert Loaded._Trigrams == Index._Trigrams
+
+
+#   Pickling a big index takes a while - searches shouldn't have to wait for it.
+def test_SaveHasLockFreeWhilePickling(tmp_path, monkeypatch):
+
+    SongDirectory, Index = MakeLibrary(tmp_path)
+
+    Free = []
+    Dumps = pickle.dumps
+
+    def Pickling(*Args):
+        def TryLock():
+            if Index._Lock.acquire(timeout=5):
+                Index._Lock.release()
+                Free.append(True)
+        Thread = threading.Thread(target=TryLock)
+        Thread.start()
+        Thread.join()
+        return Dumps(*Args)
+
+    monkeypatch.setattr(SongIndexModule.pickle, 'dumps', Pickling)
+    Index.Save()
+    assert Free == [True]
@@ -0,0 +1,93 @@
+import codecs
+import locale
+
+import pytest
+
+import SongReader
+from SongReader import SongEncoding, SongEncodings, ReadSongFields, ParseSongFields, ReadSongTree
+
+
+#   Tests for SongReader - run with pytest
+
+
+def WriteSong(tmp_path, SongData):
+
+    FileName = str(tmp_path / 'song.xml')
+    with open(FileName, 'wb') as f:
+        f.write(SongData)
+
+    return FileName
+
+
+def test_EncodingFromByteOrderMark():
+
+    assert SongEncoding(codecs.BOM_UTF8+b'<song/>') == 'utf-8-sig'
+    assert SongEncoding(codecs.BOM_UTF16_LE+'<song/>'.encode('utf-16-le')) == 'utf-16'
+    assert SongEncoding(codecs.BOM_UTF32_LE+'<song/>'.encode('utf-32-le')) == 'utf-32'
+
+
+def test_EncodingFromDeclaration():
+
+    assert SongEncoding(b'<?xml version="1.0" encoding="ISO-8859-1"?><song/>') == 'iso8859-1'
+    assert SongEncoding(b"  <?xml version='1.0' encoding='windows-1252' ?>") == 'cp1252'
+    assert SongEncoding(b'<?xml version="1.0" encoding="no-such-encoding"?>') is None
+    assert SongEncoding(b'<song/>') is None
+
+
+#   Songs that don't say are read as UTF-8, or if they aren't, the local encoding
+def test_UndeclaredEncodings():
+
+    assert SongEncodings(b'<song/>') == [('utf-8', 'strict'), (locale.getpreferredencoding(False), 'replace')]
+    assert SongEncodings(b'<?xml version="1.0" encoding="UTF-8"?>') == [('utf-8', 'replace')]
+
+
+def test_ReadFields(tmp_path):
+
+    FileName = WriteSong(tmp_path, '<?xml version="1.0" encoding="UTF-8"?>\n<song><title>Jésus</title><lyrics>.G\n Words</lyrics><key/><other><key>no</key></other></song>'.encode('utf8'))
+
+    # Only the elements directly inside <song> - empty ones are None, missing ones left out
+    assert ReadSongFields(FileName, ('title', 'lyrics', 'key', 'user1')) == {'title': 'Jésus', 'lyrics': '.G\n Words', 'key': None}
+
+
+def test_DeclaredEncoding(tmp_path):
+
+    FileName = WriteSong(tmp_path, '<?xml version="1.0" encoding="ISO-8859-1"?>\n<song><title>Jésus é bom</title></song>'.encode('latin-1'))
+
+    assert ReadSongFields(FileName, ('title',)) == {'title': 'Jésus é bom'}
+
+
+def test_Utf16(tmp_path):
+
+    FileName = WriteSong(tmp_path, '<?xml version="1.0" encoding="UTF-16"?>\n<song><title>Jésus</title></song>'.encode('utf-16'))
+
+    assert ReadSongFields(FileName, ('title',)) == {'title': 'Jésus'}
+
+
+def test_LocalEncodingFallback(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(SongReader.locale, 'getpreferredencoding', lambda DoSetLocale=True: 'cp1252')
+
+    # Not UTF-8 - and past the first chunk read, so it's only found part way through
+    FileName = WriteSong(tmp_path, b'<song><lyrics>' + b' la' * SongReader.ReadChunkSize + b'</lyrics><title>Caf\xe9</title></song>')
+
+    assert ReadSongFields(FileName, ('title',)) == {'title': 'Café'}
+
+
+#   Once everything wanted has been found, the rest of the song isn't read
+def test_StopsWhenFound():
+
+    SongData = b'<song><title>Amazing Grace</title><key>G</key><backgrounds>' + b'x' * (4 * SongReader.ReadChunkSize) + b'<not xml'
+
+    assert ParseSongFields(SongData, ('title', 'key')) == {'title': 'Amazing Grace', 'key': 'G'}
+
+    with pytest.raises(SongReader.ET.ParseError):
+        ParseSongFields(SongData, ('title', 'lyrics'))
+
+
+def test_ReadTree(tmp_path):
+
+    FileName = WriteSong(tmp_path, '<?xml version="1.0" encoding="ISO-8859-1"?>\n<song><title>Jésus</title><key>G</key></song>'.encode('latin-1'))
+
+    Tree = ReadSongTree(FileName)
+    assert Tree.find('title').text == 'Jésus'
+    assert Tree.find('key').text == 'G'
@@ -0,0 +1,42 @@
+from SongSheet import ParseSongText, ChordLine, LyricLine, HeadingLine, BreakLine, BlankLine
+
+
+#   Tests for SongSheet - run with pytest
+
+
+def test_LineKinds():
+
+    Sheet = ParseSongText('.G   D\n Amazing grace\n\n;comment\n[=L=]\n.C')
+
+    Lines = [SongLine for Section in Sheet.Sections for SongLine in Section]
+    assert [SongLine.Kind for SongLine in Lines] == [ChordLine, BlankLine, LyricLine, BreakLine, ChordLine]
+    assert Lines[3].Orientation == 'L'
+
+    # The lyrics under the first chords are kept with them - the last chords
+    # have none
+    assert Lines[0].Lyrics.Text == ' Amazing grace'
+    assert Lines[4].Lyrics is None
+
+
+def test_ChordPositions():
+
+    Sheet = ParseSongText('.G/B    C#M  Dsus')
+    ChordsLine = Sheet.Sections[0].Lines[0]
+
+    assert ChordsLine.Chords == [(1, 2, 'G'), (3, 4, 'B'), (8, 11, 'C#M'), (13, 14, 'D')]
+    assert ChordsLine.Words == [(1, 4), (8, 11), (13, 17)]
+
+
+def test_Sections():
+
+    Sheet = ParseSongText('.G\n Intro words\n[V1]\n.C\n Verse\n[===]\n[Chorus]\n Chorus')
+
+    assert [(Section.Heading and Section.Heading.Text) for Section in Sheet.Sections] == [None, '[V1]', '[Chorus]']
+    assert [[SongLine.Kind for SongLine in Section] for Section in Sheet.Sections] == [[ChordLine],
+                                                                                     [HeadingLine, ChordLine, BreakLine],
+                                                                                     [HeadingLine, LyricLine]]
+
+
+def test_NoLyrics():
+
+    assert ParseSongText(None).Sections[0].Lines[0].Kind == BlankLine